@@ -18,6 +18,7 @@ represents two variables, x and y, where x is a scalar and y has a
 shape of (3, 2).
 """
 from glob import glob
+from collections import OrderedDict
 
 import itertools
 import copy
@@ -97,24 +98,31 @@ class BaseSMCTrace(object):
     vars : list of variables
         Sampling values will be stored for these variables. If None,
         `model.unobserved_RVs` is used.
+    layout : :class:`collections.OrderedDict`
+        variable name: (shape, dtype), see :func:`get_trace_layout`.
+        If given, the model and the variables are not needed.
     """
 
-    def __init__(self, name, model=None, vars=None):
+    def __init__(self, name, model=None, vars=None, layout=None):
         self.name = name
-        model = modelcontext(model)
-        self.model = model
 
-        if vars is None:
-            vars = model.unobserved_RVs
+        if layout is None:
+            model = modelcontext(model)
+
+            if vars is None:
+                vars = model.unobserved_RVs
+
+            layout = get_trace_layout(vars=vars)
 
+        self.model = model
         self.vars = vars
-        self.varnames = [var.name for var in vars]
+        self.varnames = list(layout.keys())
 
         # Get variable shapes. Most backends will need this
         # information.
 
-        self.var_shapes_list = [var.tag.test_value.shape for var in vars]
-        self.var_dtypes_list = [var.tag.test_value.dtype for var in vars]
+        self.var_shapes_list = [shape for shape, _ in layout.values()]
+        self.var_dtypes_list = [dtype for _, dtype in layout.values()]
 
         self.var_shapes = dict(zip(self.varnames, self.var_shapes_list))
         self.var_dtypes = dict(zip(self.varnames, self.var_dtypes_list))
@@ -153,10 +161,10 @@ class TextChain(BaseSMCTrace):
         `model.unobserved_RVs` is used.
     """
 
-    def __init__(self, name, model=None, vars=None):
+    def __init__(self, name, model=None, vars=None, layout=None):
         if not os.path.exists(name):
             os.mkdir(name)
-        super(TextChain, self).__init__(name, model, vars)
+        super(TextChain, self).__init__(name, model, vars, layout)
 
         self.flat_names = {v: ttab.create_flat_names(v, shape)
                            for v, shape in self.var_shapes.items()}
@@ -394,7 +402,7 @@ class TextStage(object):
             chains = None
         return chains
 
-    def load_multitrace(self, stage, model=None):
+    def load_multitrace(self, stage, model=None, layout=None):
         """
         Load TextChain database.
 
@@ -404,12 +412,14 @@ class TextStage(object):
             Name of directory with files (one per chain)
         model : Model
             If None, the model is taken from the `with` context.
+        layout : :class:`collections.OrderedDict`
+            trace layout, if given the model is not needed
         Returns
         -------
         A :class:`pymc3.backend.base.MultiTrace` instance
         """
         dirname = self.stage_path(stage)
-        return load_multitrace(dirname=dirname, model=model)
+        return load_multitrace(dirname=dirname, model=model, layout=layout)
 
     def recover_existing_results(self, stage, draws, step, model=None):
         stage_path = self.stage_path(stage)
@@ -427,7 +437,30 @@ class TextStage(object):
         return None
 
 
-def load_multitrace(dirname, model=None):
+def get_trace_layout(model=None, vars=None):
+    """
+    Get the names, shapes and dtypes of the variables stored in the traces.
+
+    Parameters
+    ----------
+    model : Model
+        If None, the model is taken from the `with` context.
+    vars : list of variables
+        If None, `model.unobserved_RVs` is used.
+
+    Returns
+    -------
+    :class:`collections.OrderedDict` variable name: (shape, dtype)
+    """
+    if vars is None:
+        vars = modelcontext(model).unobserved_RVs
+
+    return OrderedDict(
+        (var.name, (var.tag.test_value.shape, var.tag.test_value.dtype))
+        for var in vars)
+
+
+def load_multitrace(dirname, model=None, layout=None):
     """
     Load TextChain database.
 
@@ -437,6 +470,9 @@ def load_multitrace(dirname, model=None):
         Name of directory with files (one per chain)
     model : Model
         If None, the model is taken from the `with` context.
+    layout : :class:`collections.OrderedDict`
+        trace layout, if given the model is not needed,
+        see :func:`get_trace_layout`
 
     Returns
     -------
@@ -448,7 +484,7 @@ def load_multitrace(dirname, model=None):
     straces = []
     for f in files:
         chain = int(os.path.splitext(f)[0].rsplit('-', 1)[1])
-        strace = TextChain(dirname, model=model)
+        strace = TextChain(dirname, model=model, layout=layout)
         strace.chain = chain
         strace.filename = f
         straces.append(strace)
@@ -27,13 +27,13 @@ from beat import utility
 
 import numpy as num
 
-from theano import config as tconfig
-
 
 guts_prefix = 'beat'
 
 logger = logging.getLogger('config')
 
+floatX = utility.get_floatX()
+
 block_vars = [
     'bl_azimuth', 'bl_amplitude', 'nucleation_strike', 'nucleation_dip', 'time_shift']
 seis_vars = ['time', 'duration']
@@ -174,6 +174,9 @@ geodetic_linear_gf_name = 'linear_geodetic_gfs.pkl'
 sample_p_outname = 'sample.params'
 
 summary_name = 'summary.txt'
+linear_solution_name = 'linear_solution.pkl'
+compiled_functions_name = 'compiled_functions.pkl'
+velocity_models_dir_name = 'velocity_models'
 
 km = 1000.
 
@@ -255,6 +258,12 @@ class NonlinearGFConfig(GFConfig):
         help='Depth limit [km] for varying the velocity model. Below that '
              'depth the velocity model is not varied based on the errors '
              'defined above!')
+    variation_seed = Int.T(
+        default=0,
+        help='Seed for the random velocity model variations, the seed of'
+             ' the variation of index crust_ind is derived from the'
+             ' variation_seed, the reference model and crust_ind. Locations'
+             ' with different reference models get independent variations.')
 
 
 class SeismicGFConfig(NonlinearGFConfig):
@@ -277,6 +286,12 @@ class SeismicGFConfig(NonlinearGFConfig):
         default=True,
         help='Flag for removing modeling module GF files after'
              ' completion.')
+    station_stores = Dict.T(
+        String.T(), String.T(),
+        default={},
+        help='Names of shared GF stores for station names. Created by'
+             ' "beat build_gfs --plan_stores". Stations that are not'
+             ' listed use their own stores.')
 
 
 class GeodeticGFConfig(NonlinearGFConfig):
@@ -301,6 +316,15 @@ class GeodeticGFConfig(NonlinearGFConfig):
     medium_distance_spacing = Float.T(
         default=1.,
         help='Distance spacing [km] for GF medium grid.')
+    psgrn_cache_dir = String.T(
+        default='',
+        help='Directory for caching psgrn results, which may be shared'
+             ' among projects, e.g. "~/.beat/psgrn_cache".'
+             ' Default: no caching')
+    psgrn_cache_size = Float.T(
+        default=10.,
+        help='Maximum size [GB] of the psgrn cache, the least recently'
+             ' used results are removed.')
 
 
 class LinearGFConfig(GFConfig):
@@ -330,6 +354,11 @@ class LinearGFConfig(GFConfig):
     sample_rate = Float.T(
         default=2.,
         help='Sample rate for the Greens Functions.')
+    cache_size = Float.T(
+        default=2048.,
+        help='Memory budget [MB] for the Greens Function libraries of the'
+             ' velocity model variants that are kept in memory. The library'
+             ' of the reference model is always kept in memory.')
 
 
 class SeismicLinearGFConfig(LinearGFConfig):
@@ -550,13 +579,13 @@ class ProblemConfig(Object):
                     name=variable,
                     lower=num.ones(
                         nvars,
-                        dtype=tconfig.floatX) * lower,
+                        dtype=floatX) * lower,
                     upper=num.ones(
                         nvars,
-                        dtype=tconfig.floatX) * upper,
+                        dtype=floatX) * upper,
                     testvalue=num.ones(
                         nvars,
-                        dtype=tconfig.floatX) * (lower + (upper / 5.)))
+                        dtype=floatX) * (lower + (upper / 5.)))
 
     def set_vars(self, bounds_dict):
         """
@@ -679,6 +708,19 @@ class SamplerParameters(Object):
     n_jobs = Int.T(
         default=1,
         help='Number of processors to use, i.e. chains to sample in parallel.')
+    threads_per_worker = Int.T(
+        default=1,
+        help='Number of BLAS/ OpenMP threads of each of the n_jobs workers.'
+             ' Not applied if n_jobs is 1.'
+             ' Few multi-threaded workers may be faster than many'
+             ' single-threaded ones for large covariance matrixes.'
+             ' Uses threadpoolctl or mkl-service if installed, otherwise the'
+             ' loaded openblas, MKL or OpenMP libraries directly.')
+    pin_workers = Bool.T(
+        default=False,
+        help='Flag for pinning each worker to threads_per_worker cores,'
+             ' grouped by NUMA node. Do not use if other jobs run on the'
+             ' same cores.')
     tune_interval = Int.T(
         default=50,
         help='Tune interval for adaptive tuning of Metropolis step size.')
@@ -690,6 +732,35 @@ class SamplerParameters(Object):
         default=True,
         help='Flag for checking whether proposed step lies within'
              ' variable bounds.')
+    adaptive = Bool.T(
+        default=False,
+        help='Flag for Adaptive Metropolis, online adaptation of the full'
+             ' proposal covariance within each chain. Replaces the tuning'
+             ' of the step size. Requires MultivariateNormal proposal_dist.')
+    delayed_acceptance = Bool.T(
+        default=False,
+        help='Flag for delayed acceptance, proposals are screened with a'
+             ' surrogate likelihood fitted to the forward model evaluations'
+             ' of the stage. Only proposals that pass are evaluated with the'
+             ' forward model.')
+    blocked_updates = Bool.T(
+        default=False,
+        help='Flag for blocked updates, each step moves only the variables'
+             ' that affect the same composites (e.g. ramps or'
+             ' hyperparameters of one datatype). The likelihoods of the'
+             ' unaffected composites are reused from the previous sample.')
+    concurrent_composites = Bool.T(
+        default=False,
+        help='Flag for evaluating the forward models of the composites'
+             ' (e.g. seismic and geodetic) concurrently in threads of each'
+             ' process. Uses idle cores if n_jobs is below the number of'
+             ' cores.')
+    cache_compiled = Bool.T(
+        default=False,
+        help='Flag for persisting the compiled likelihood functions in the'
+             ' result directory. They are reused if the configuration, the'
+             ' data and the Greens Functions did not change. Plots of the'
+             ' traces only do not need to build the model then.')
 
     rm_flag = Bool.T(default=False,
                      help='Remove existing results prior to sampling.')
@@ -713,6 +784,32 @@ class MetropolisConfig(SamplerParameters):
              ' samples from the beginning of the chain.')
 
 
+class ParallelTemperingConfig(MetropolisConfig):
+    """
+    Config for optimization parameters of the Parallel Tempering algorithm.
+    """
+    n_steps = Int.T(
+        default=100000,
+        help='Number of samples of each chain at beta 1. (posterior).')
+    n_chains = Int.T(
+        default=8,
+        help='Number of chains of the temperature ladder.')
+    n_chains_posterior = Int.T(
+        default=1,
+        help='Number of chains at beta 1. that sample the posterior.')
+    swap_interval = Int.T(
+        default=100,
+        help='Number of Metropolis steps between swap proposals of chains'
+             ' at neighbouring temperatures.')
+    tmax = Float.T(
+        default=100.,
+        help='Temperature of the hottest chain.')
+    adapt_temperatures = Bool.T(
+        default=True,
+        help='Adapt the temperature spacing towards equal swap acceptance'
+             ' rates between neighbouring chains.')
+
+
 class SMCConfig(SamplerParameters):
     """
     Config for optimization parameters of the SMC algorithm.
@@ -727,6 +824,28 @@ class SMCConfig(SamplerParameters):
              'intermediate stage pdfs;'
              'low - small beta steps (slow cooling),'
              'high - wide beta steps (fast cooling)')
+    target_ess = Float.T(
+        default=0.,
+        help='Target effective sample size as fraction [0., 1.] of n_chains'
+             ' that determines the beta step between stages. If larger than'
+             ' zero it is used instead of the coef_variation.')
+    adapt_n_steps = Bool.T(
+        default=False,
+        help='Adapt the number of steps of the next stage from the acceptance'
+             ' rate and autocorrelation of the chains of the current stage.'
+             ' n_steps is the upper limit.')
+    resampling_method = StringChoice.T(
+        choices=['systematic', 'stratified', 'residual', 'multinomial'],
+        default='systematic',
+        help='Scheme for resampling the chains based on the importance'
+             ' weights between stages.')
+    resampling_threshold = Float.T(
+        default=1.,
+        help='Resample only if the effective sample size drops below this'
+             ' fraction [0., 1.] of n_chains, otherwise the importance weights'
+             ' are carried over to the next stage. 1. - resample every stage.'
+             ' Ignored if the target_ess is used, then it resamples every'
+             ' stage.')
     stage = Int.T(default=0,
                   help='Stage where to start/continue the sampling. Has to'
                        ' be int -1 for final stage')
@@ -740,6 +859,13 @@ class SMCConfig(SamplerParameters):
         optional=True,
         help='Update model prediction covariance matrixes in transition '
              'stages.')
+    covariance_update_rtol = Float.T(
+        default=0.,
+        optional=True,
+        help='Relative change (Frobenius norm) of the model prediction'
+             ' covariance matrix of a dataset below which its weight update'
+             ' is skipped. If no weight changed, the last samples are not'
+             ' re-evaluated. 0. - always update')
 
 
 class SamplerConfig(Object):
@@ -750,7 +876,7 @@ class SamplerConfig(Object):
     name = String.T(
         default='SMC',
         help='Sampler to use for sampling the solution space.'
-             ' Metropolis/ SMC')
+             ' Metropolis/ SMC/ PT')
     progressbar = Bool.T(
         default=True,
         help='Display progressbar(s) during sampling.')
@@ -771,6 +897,9 @@ class SamplerConfig(Object):
         if self.name == 'SMC':
             self.parameters = SMCConfig(**kwargs)
 
+        if self.name == 'PT':
+            self.parameters = ParallelTemperingConfig(**kwargs)
+
 
 class GFLibaryConfig(Object):
     """
@@ -848,11 +977,11 @@ class BEATconfig(Object, Cloneable):
             defaultb_name = 'hypers'
             hypers[name] = Parameter(
                 name=name,
-                lower=num.ones(1, dtype=tconfig.floatX) *
+                lower=num.ones(1, dtype=floatX) *
                 default_bounds[defaultb_name][0],
-                upper=num.ones(1, dtype=tconfig.floatX) *
+                upper=num.ones(1, dtype=floatX) *
                 default_bounds[defaultb_name][1],
-                testvalue=num.ones(1, dtype=tconfig.floatX) *
+                testvalue=num.ones(1, dtype=floatX) *
                 num.mean(default_bounds[defaultb_name]))
 
         self.problem_config.hyperparameters = hypers
@@ -904,7 +1033,7 @@ def init_config(name, date=None, min_magnitude=6.0, main_path='./',
         GF calculation
     sampler : str
         Optimization algorithm to use to sample the solution space
-        Options: 'SMC', 'Metropolis'
+        Options: 'SMC', 'Metropolis', 'PT'
     use_custom : boolean
         Flag to setup manually a custom velocity model.
     individual_gfs : boolean
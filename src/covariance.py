@@ -118,9 +118,15 @@ def model_prediction_sensitivity(engine, *args, **kwargs):
     calculate_model_prediction_sensitivity(sources,
                                              targets, source_params, **kwargs)
 
+    All perturbed sources (4 per parameter and reference source) are
+    processed in one single (parallel) request to the engine.
+
     Returns traces in a list[parameter][targets] for each station and channel
     as specified in the targets. The location code of each trace is placed to
     show the respective source parameter.
+    Additionally returns the sensitivities as
+    :class:`numpy.ndarray` of shape (n_params, n_targets, n_samples),
+    where traces shorter than n_samples are zero padded at the end.
     '''
 
     if len(args) not in (0, 1, 2, 3):
@@ -142,83 +148,79 @@ def model_prediction_sensitivity(engine, *args, **kwargs):
     if request is None:
         request = gf.Request(**kwargs)
 
+    n_params = len(source_params)
+
     if h is None:
-        h = num.ones(len(source_params)) * 1e-1
+        h = num.ones(n_params) * 1e-1
 
-    # create results list
-    sensitivity_param_list = []
-    sensitivity_param_trcs = []
+    h = num.asarray(h, dtype=num.float64)
 
-    for i in xrange(len(source_params)):
-        sensitivity_param_list.append([0] * len(request.targets))
-        sensitivity_param_trcs.append([0] * len(request.targets))
+    # finite difference stencil of the 5-point derivative
+    stencil_steps = num.array([2., 1., -1., -2.])
+    stencil_coeffs = num.array([-1., 8., -8., 1.])
 
+    calc_sources = []
     for ref_source in request.sources:
-        par_count = 0
-        for param in source_params:
-            print param, 'with h = ', h[par_count]
-            calc_source_p2h = ref_source.clone()
-            calc_source_ph = ref_source.clone()
-            calc_source_mh = ref_source.clone()
-            calc_source_m2h = ref_source.clone()
-
-            setattr(calc_source_p2h, param,
-                    ref_source[param] + (2 * h[par_count]))
-            setattr(calc_source_ph, param,
-                    ref_source[param] + (h[par_count]))
-            setattr(calc_source_mh, param,
-                    ref_source[param] - (h[par_count]))
-            setattr(calc_source_m2h, param,
-                    ref_source[param] - (2 * h[par_count]))
-
-            calc_sources = [calc_source_p2h, calc_source_ph,
-                            calc_source_mh, calc_source_m2h]
-
-            response = engine.process(sources=calc_sources,
-                                      targets=request.targets,
-                                      nprocs=nprocs)
-
-            for k in xrange(len(request.targets)):
-                # zero padding if necessary
-                trc_lengths = num.array(
-                    [len(response.results_list[i][k].trace.data) for i in \
-                                        range(len(response.results_list))])
-                Id = num.where(trc_lengths != trc_lengths.max())
-
-                for l in Id[0]:
-                    response.results_list[l][k].trace.data = num.concatenate(
-                            (response.results_list[l][k].trace.data,
-                             num.zeros(trc_lengths.max() - trc_lengths[l])))
-
-                # calculate numerical partial derivative for
-                # each source and target
-                sensitivity_param_list[par_count][k] = (
-                        sensitivity_param_list[par_count][k] + (\
-                            - response.results_list[0][k].trace.data + \
-                            8 * response.results_list[1][k].trace.data - \
-                            8 * response.results_list[2][k].trace.data + \
-                                response.results_list[3][k].trace.data) / \
-                            (12 * h[par_count])
-                                                       )
-
-            par_count = par_count + 1
+        for par_count, param in enumerate(source_params):
+            logger.debug('%s with h = %f' % (param, h[par_count]))
+            for step in stencil_steps:
+                calc_source = ref_source.clone()
+                setattr(calc_source, param,
+                        ref_source[param] + step * h[par_count])
+                calc_sources.append(calc_source)
+
+    t0 = time()
+    response = engine.process(
+        sources=calc_sources,
+        targets=request.targets,
+        nprocs=nprocs)
+    t1 = time()
+    logger.debug(
+        'Sensitivity synthetics for %i sources took %f' % (
+            len(calc_sources), t1 - t0))
+
+    n_targets = len(request.targets)
+    n_calc = len(calc_sources)
+
+    trc_lengths = num.array(
+        [[len(response.results_list[i][k].trace.data)
+          for k in range(n_targets)] for i in range(n_calc)])
+
+    # zero padding at the end if necessary
+    synths = num.zeros((n_calc, n_targets, trc_lengths.max()))
+    for i in range(n_calc):
+        for k in range(n_targets):
+            synths[i, k, :trc_lengths[i, k]] = \
+                response.results_list[i][k].trace.data
+
+    synths = synths.reshape(
+        (len(request.sources), n_params, stencil_steps.size, n_targets, -1))
+
+    # calculate numerical partial derivative for
+    # each source and target and sum over sources
+    sensitivity_array = num.einsum(
+        'j,ipjkl->pkl', stencil_coeffs, synths) / \
+        (12. * h)[:, num.newaxis, num.newaxis]
 
     # form traces from sensitivities
-    par_count = 0
-    for param in source_params:
-        for k in xrange(len(request.targets)):
-            sensitivity_param_trcs[par_count][k] = trace.Trace(
-                        network=request.targets[k].codes[0],
-                        station=request.targets[k].codes[1],
-                        ydata=sensitivity_param_list[par_count][k],
-                        deltat=response.results_list[0][k].trace.deltat,
-                        tmin=response.results_list[0][k].trace.tmin,
-                        channel=request.targets[k].codes[3],
-                        location=param)
+    target_lengths = trc_lengths.max(axis=0)
+    sensitivity_param_trcs = []
+    for par_count, param in enumerate(source_params):
+        param_trcs = []
+        for k, target in enumerate(request.targets):
+            ref_trace = response.results_list[0][k].trace
+            param_trcs.append(trace.Trace(
+                network=target.codes[0],
+                station=target.codes[1],
+                ydata=sensitivity_array[par_count, k, :target_lengths[k]],
+                deltat=ref_trace.deltat,
+                tmin=ref_trace.tmin,
+                channel=target.codes[3],
+                location=param))
 
-        par_count = par_count + 1
+        sensitivity_param_trcs.append(param_trcs)
 
-    return sensitivity_param_trcs
+    return sensitivity_param_trcs, sensitivity_array
 
 
 def seismic_cov_velocity_models(engine, sources, targets,
@@ -345,13 +347,13 @@ def geodetic_cov_velocity_models_pscmp(
     """
 
     synths = num.zeros((len(crust_inds), target.samples))
-    for crust_ind in crust_inds:
-        disp = heart.geo_layer_synthetics(
+    for i, crust_ind in enumerate(crust_inds):
+        disp = heart.geo_layer_synthetics_pscmp(
             store_superdir, crust_ind,
             lons=target.lons,
             lats=target.lats,
             sources=sources)
-        synths[crust_ind, :] = (
+        synths[i, :] = (
             disp[:, 0] * target.los_vector[:, 0] + \
             disp[:, 1] * target.los_vector[:, 1] + \
             disp[:, 2] * target.los_vector[:, 2]) * \
@@ -183,6 +183,101 @@ def load_gf_library(directory='', filename=None):
     return gfs
 
 
+class GFLibraryManager(object):
+    """
+    Manager of the Greens Function Libraries of a composite. Resident
+    libraries (of the reference velocity model) are loaded once, optionally
+    into theano shared memory for the optimization. The libraries of the
+    velocity model variants are memory-mapped on demand and kept in a
+    least-recently-used cache, whose total size is limited by a memory
+    budget.
+
+    Parameters
+    ----------
+    directory : str
+        path to the directory of the GF libraries
+    max_size : float
+        memory budget [MB] for the cached variant libraries
+    """
+
+    def __init__(self, directory, max_size=2048.):
+        self.directory = directory
+        self.max_size = max_size
+
+        self._filenames = {}
+        self._resident = {}
+        self._cache = collections.OrderedDict()
+
+    def register(self, key, filename, resident=False, make_shared=False):
+        """
+        Register GF library under key, resident libraries are loaded
+        immediately, others on first access.
+
+        Parameters
+        ----------
+        key : str
+            library key of the composite
+        filename : str
+            of the library in the directory, see :func:`get_gf_prefix`
+        resident : bool
+            if True the library is kept in memory
+        make_shared : bool
+            if True, resident libraries are set to optimization mode, i.e.
+            transformed to :class:`theano.shared` variables
+        """
+        self._filenames[key] = filename
+
+        if resident and key not in self._resident:
+            gfs = self._cache.pop(key, None) or load_gf_library(
+                directory=self.directory, filename=filename)
+
+            if make_shared:
+                gfs.init_optimization()
+
+            self._resident[key] = gfs
+
+    def __getitem__(self, key):
+        if key in self._resident:
+            return self._resident[key]
+
+        if key in self._cache:
+            gfs = self._cache.pop(key)
+        else:
+            try:
+                filename = self._filenames[key]
+            except KeyError:
+                raise KeyError('GF library %s is not registered!' % key)
+
+            logger.debug('Memory-mapping GF library %s' % filename)
+            gfs = load_gf_library(directory=self.directory, filename=filename)
+
+        self._cache[key] = gfs
+        while self.cache_size > self.max_size and len(self._cache) > 1:
+            old_key, _ = self._cache.popitem(last=False)
+            logger.debug('Evicting GF library %s from cache' % old_key)
+
+        return gfs
+
+    def __contains__(self, key):
+        return key in self._filenames
+
+    def __len__(self):
+        return len(self._filenames)
+
+    def keys(self):
+        return list(self._filenames.keys())
+
+    @property
+    def cache_size(self):
+        """
+        Size [MB] of the cached variant libraries.
+        """
+        return sum(gfs.filesize for gfs in self._cache.values())
+
+    def clear_cache(self):
+        self._cache.clear()
+
+
 class GeodeticGFLibrary(GFLibrary):
     """
     Seismic Greens Funcion Library for the finite fault optimization.
@@ -301,7 +396,18 @@ filename: %s''' % (
         matrix : size (nsamples)
         """
         self._check_mode_init(self._mode)
-        return self.stack_switch[self._mode].T.dot(slips)
+        return self._stack_switch[self._mode].T.dot(slips)
+
+    def get_matrix(self):
+        """
+        Get the Greens Function matrix of the library.
+
+        Returns
+        -------
+        :class:`numpy.ndarray` (npatches x nsamples)
+        """
+        self._check_setup()
+        return num.asarray(self._gfmatrix)
 
     @property
     def nsamples(self):
@@ -805,6 +911,66 @@ class FaultGeometryError(Exception):
     pass
 
 
+class PatchGeometry(object):
+    """
+    Array representation of the patches of a subfault. Patch centers are
+    computed at once, patch sources are only created on request.
+
+    Parameters
+    ----------
+    source : :class:`sources.RectangularSource`
+        extended subfault, depth is top depth
+    nl : int
+        number of patches in length direction (strike)
+    nw : int
+        number of patches in width direction (dip)
+    """
+
+    def __init__(self, source, nl, nw):
+        self.source = source
+        self.nl = nl
+        self.nw = nw
+        self.length = source.length / float(nl)
+        self.width = source.width / float(nw)
+        self.centers = source.patch_centers(nl=nl, nw=nw)
+
+    @property
+    def npatches(self):
+        return self.centers.shape[0]
+
+    @property
+    def east_shifts(self):
+        return self.centers[:, 0]
+
+    @property
+    def north_shifts(self):
+        return self.centers[:, 1]
+
+    @property
+    def depths(self):
+        return self.centers[:, 2]
+
+    def get_patch(self, idx):
+        """
+        Get patch source.
+
+        Parameters
+        ----------
+        idx : int
+            index of the patch, ordering row-wise from shallow to deep
+
+        Returns
+        -------
+        :class:`pyrocko.gf.seismosizer.RectangularSource`
+        """
+        return self.source.patch_source(
+            self.centers[idx], self.length, self.width)
+
+    def iter_patches(self):
+        for idx in range(self.npatches):
+            yield self.get_patch(idx)
+
+
 def positions2idxs(positions, cell_size, backend='numpy'):
     """
     Return index to a grid with a given cell size.npatches
@@ -849,6 +1015,7 @@ class FaultGeometry(gf.seismosizer.Cloneable):
         self.datatypes = datatypes
         self.components = components
         self._ext_sources = {}
+        self._patch_geometries = {}
         self.ordering = ordering
 
     def __str__(self):
@@ -901,6 +1068,7 @@ number of patches: %i ''' % (
 
             if source_key not in self._ext_sources.keys() or replace:
                 self._ext_sources[source_key] = copy.deepcopy(source)
+                self._get_patch_geometries().pop(source_key, None)
             else:
                 raise FaultGeometryError(
                     'Subfault already specified in geometry!')
@@ -940,6 +1108,47 @@ number of patches: %i ''' % (
         else:
             raise FaultGeometryError('Requested subfault not defined!')
 
+    def _get_patch_geometries(self):
+        # geometries pickled before patch geometries were introduced
+        if not hasattr(self, '_patch_geometries'):
+            self._patch_geometries = {}
+
+        return self._patch_geometries
+
+    def get_subfault_patch_geometry(
+            self, index, datatype=None, component=None):
+        """
+        Get array representation of the patches of a subfault in the
+        geometry. Patch geometries are computed once and stored.
+
+        Parameters
+        ----------
+        index : int
+            to subfault
+        datatype : str
+            to return 'seismic' or 'geodetic'
+        component : str
+            slip component
+
+        Returns
+        -------
+        :class:`PatchGeometry`
+        """
+        datatype = self._assign_datatype(datatype)
+        component = self._assign_component(component)
+
+        source_key = self.get_subfault_key(index, datatype, component)
+        patch_geometries = self._get_patch_geometries()
+
+        if source_key not in patch_geometries:
+            subfault = self.get_subfault(
+                index, datatype=datatype, component=component)
+            npw, npl = self.get_subfault_discretization(index)
+            patch_geometries[source_key] = PatchGeometry(
+                subfault, nl=npl, nw=npw)
+
+        return patch_geometries[source_key]
+
     def get_subfault_patches(self, index, datatype=None, component=None):
         """
         Get all Patches to a subfault in the geometry.
@@ -953,14 +1162,32 @@ number of patches: %i ''' % (
         """
         self._check_index(index)
 
-        datatype = self._assign_datatype(datatype)
-        component = self._assign_component(component)
+        return list(self.get_subfault_patch_geometry(
+            index, datatype=datatype, component=component).iter_patches())
 
-        subfault = self.get_subfault(
-            index, datatype=datatype, component=component)
-        npw, npl = self.get_subfault_discretization(index)
+    def iter_patches(self, datatype=None, component=None):
+        """
+        Iterator over all RectangularSource patches of the full complex
+        fault, patches are created on request.
+        """
+        for i in range(self.nsubfaults):
+            for patch in self.get_subfault_patch_geometry(
+                    i, datatype=datatype, component=component).iter_patches():
+                yield patch
+
+    def get_patch_centers(self, datatype=None, component=None):
+        """
+        Get center coordinates of all patches of the full complex fault.
 
-        return subfault.patches(nl=npl, nw=npw, datatype=datatype)
+        Returns
+        -------
+        :class:`numpy.ndarray` (npatches, 3) with east_shift, north_shift
+        and center depth [m] of the patches
+        """
+        return num.vstack([
+            self.get_subfault_patch_geometry(
+                i, datatype=datatype, component=component).centers
+            for i in range(self.nsubfaults)])
 
     def get_all_patches(self, datatype=None, component=None):
         """
@@ -974,15 +1201,7 @@ number of patches: %i ''' % (
             slip component to return may be %s
         """ % ut.list2string(slip_directions.keys())
 
-        datatype = self._assign_datatype(datatype)
-        component = self._assign_component(component)
-
-        patches = []
-        for i in range(self.nsubfaults):
-            patches += self.get_subfault_patches(
-                i, datatype=datatype, component=component)
-
-        return patches
+        return list(self.iter_patches(datatype=datatype, component=component))
 
     def get_patch_indexes(self, index):
         """
@@ -1173,16 +1392,18 @@ def discretize_sources(
     patch_length_m = patch_length * km
     patch_width_m = patch_width * km
 
+    # extension does not depend on the slip parameters, extend only once
+    base_ext_sources = []
     npls = []
     npws = []
     for source in sources:
-        s = copy.deepcopy(source)
-        ext_source = s.extent_source(
+        ext_source = source.extent_source(
             extension_width, extension_length,
             patch_width_m, patch_length_m)
 
-        npls.append(int(num.ceil(ext_source.length / patch_length_m)))
-        npws.append(int(num.ceil(ext_source.width / patch_width_m)))
+        npls.append(ext_source.get_n_patches(patch_length_m, 'length'))
+        npws.append(ext_source.get_n_patches(patch_width_m, 'width'))
+        base_ext_sources.append(ext_source)
 
     ordering = FaultOrdering(
         npls, npws, patch_size_strike=patch_length, patch_size_dip=patch_width)
@@ -1194,22 +1415,14 @@ def discretize_sources(
 
         for var in varnames:
             logger.info('%s slip component' % var)
-            param_mod = copy.deepcopy(slip_directions[var])
 
             ext_sources = []
-            for source in sources:
-                s = copy.deepcopy(source)
-                param_mod['rake'] += s.rake
-                s.update(**param_mod)
-
-                ext_source = s.extent_source(
-                    extension_width, extension_length,
-                    patch_width_m, patch_length_m)
-
-                npls.append(
-                    ext_source.get_n_patches(patch_length_m, 'length'))
-                npws.append(
-                    ext_source.get_n_patches(patch_width_m, 'width'))
+            for base_ext_source in base_ext_sources:
+                param_mod = copy.deepcopy(slip_directions[var])
+                param_mod['rake'] += base_ext_source.rake
+
+                ext_source = copy.deepcopy(base_ext_source)
+                ext_source.update(**param_mod)
                 ext_sources.append(ext_source)
                 logger.info('Extended fault(s): \n %s' % ext_source.__str__())
 
@@ -1233,6 +1446,74 @@ def _process_patch_geodetic(
     los_disp = (disp * los_vectors).sum(axis=1) * odws
 
     gfs.put(entries=los_disp, patchidx=patchidx)
+    return patchidx
+
+
+def _collect_patches(results, npatches):
+    """
+    Collect patch indexes of finished patches from :func:`parallel.iparipool`
+    as they are completed.
+
+    Raises
+    ------
+    ValueError if patches did not finish, e.g. due to worker timeouts
+    """
+    # report progress about every 5 percent
+    report_interval = max(npatches // 20, 1)
+
+    finished = set()
+    for _, patchidx in results:
+        if patchidx is not None:
+            finished.add(patchidx)
+            if len(finished) % report_interval == 0 or \
+                    len(finished) == npatches:
+                logger.info(
+                    'Finished %i of %i patches' % (len(finished), npatches))
+
+    missing = sorted(set(range(npatches)) - finished)
+    if missing:
+        raise ValueError(
+            'Calculation of GFs failed for patches: %s' % ut.list2string(
+                missing))
+
+
+def plan_gf_nworkers(gfs, nworkers):
+    """
+    Plan the number of workers for the calculation of a GF library from an
+    estimate of the peak memory, see :class:`parallel.MemoryBudget`.
+    The library is allocated in shared memory before the workers are forked
+    and each worker holds the GFs of one patch.
+
+    Parameters
+    ----------
+    gfs : :class:`GFLibrary`
+        library that is to be calculated
+    nworkers : int
+        requested number of workers
+
+    Returns
+    -------
+    int, number of workers that fit into the available memory
+    """
+    parallel.check_available_memory(gfs.filesize)
+
+    nbytes = gfs.size * 8.
+    budget = parallel.MemoryBudget()
+    budget.add_shared('Shared GF library', nbytes)
+    if nworkers < 2:
+        budget.add_shared('GF library', nbytes)
+
+    budget.add_per_worker('GFs of one patch', nbytes / gfs.npatches)
+
+    max_nworkers = budget.max_n_jobs()
+    if max_nworkers < nworkers:
+        logger.warning(
+            'Estimated memory for %i workers exceeds the available memory,'
+            ' reducing to %i workers!' % (nworkers, max(max_nworkers, 1)))
+        nworkers = max(max_nworkers, 1)
+
+    logger.debug('\n' + budget.breakdown(nworkers))
+    return nworkers
 
 
 def geo_construct_gf_linear(
@@ -1288,6 +1569,7 @@ def geo_construct_gf_linear(
                 'Library exists: %s. '
                 'Please use --force to override!' % outpath)
 
+            nworkers = plan_gf_nworkers(gfs, nworkers)
             if nworkers < 2:
                 allocate = True
             else:
@@ -1298,8 +1580,6 @@ def geo_construct_gf_linear(
             logger.info(
                 "Setting up Green's Function Library: %s \n ", gfs.__str__())
 
-            parallel.check_available_memory(gfs.filesize)
-
             shared_gflibrary = RawArray('d', gfs.size)
 
             work = [
@@ -1307,13 +1587,12 @@ def geo_construct_gf_linear(
                 for patchidx, patch in enumerate(
                     fault.get_all_patches('geodetic', component=var))]
 
-            p = parallel.paripool(
+            p = parallel.iparipool(
                 _process_patch_geodetic, work,
                 initializer=_init_shared,
                 initargs=(shared_gflibrary, None), nprocs=nworkers)
 
-            for res in p:
-                pass
+            _collect_patches(p, npatches)
 
             if nworkers > 1:
                 # collect and store away
@@ -1392,6 +1671,8 @@ def _process_patch_seismic(
                 durations=durations,
                 starttimes=starttime)
 
+    return patchidx
+
 
 def seis_construct_gf_linear(
         engine, fault, durations_prior, velocities_prior,
@@ -1483,6 +1764,7 @@ def seis_construct_gf_linear(
                 'Library exists: %s. '
                 'Please use --force to override!' % outpath)
         else:
+            nworkers = plan_gf_nworkers(gfs, nworkers)
             if nworkers < 2:
                 allocate = True
             else:
@@ -1495,8 +1777,6 @@ def seis_construct_gf_linear(
             logger.info(
                 "Setting up Green's Function Library: %s \n ", gfs.__str__())
 
-            parallel.check_available_memory(gfs.filesize)
-
             shared_gflibrary = RawArray('d', gfs.size)
             shared_times = RawArray('d', gfs.ntargets * (gfs.npatches + 1))
 
@@ -1506,13 +1786,12 @@ def seis_construct_gf_linear(
                 for patchidx, patch in enumerate(
                     fault.get_all_patches('seismic', component=var))]
 
-            p = parallel.paripool(
+            p = parallel.iparipool(
                 _process_patch_seismic, work,
                 initializer=_init_shared,
                 initargs=(shared_gflibrary, shared_times), nprocs=nworkers)
 
-            for res in p:
-                pass
+            _collect_patches(p, npatches)
 
             if nworkers > 1:
                 # collect and store away
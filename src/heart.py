@@ -5,15 +5,14 @@ Also contains main classes for setup specific parameters.
 
 import os
 import logging
+import hashlib
 import shutil
 import copy
 from time import time
 from collections import OrderedDict
 
-from beat import psgrn, pscmp, utility, qseis2d
+from beat import psgrn, pscmp, utility, qseis2d, parallel
 
-from theano import config as tconfig
-from theano import shared
 import numpy as num
 from scipy import linalg
 
@@ -31,6 +30,9 @@ from pyrocko.model import Station
 
 logger = logging.getLogger('heart')
 
+# theano is imported only where needed, it is slow to import
+floatX = utility.get_floatX()
+
 c = 299792458.  # [m/s]
 km = 1000.
 d2r = num.pi / 180.
@@ -90,21 +92,22 @@ class Covariance(Object):
 
     data = Array.T(
         shape=(None, None),
-        dtype=tconfig.floatX,
+        dtype=floatX,
         help='Data covariance matrix',
         optional=True)
     pred_g = Array.T(
         shape=(None, None),
-        dtype=tconfig.floatX,
+        dtype=floatX,
         help='Model prediction covariance matrix, fault geometry',
         optional=True)
     pred_v = Array.T(
         shape=(None, None),
-        dtype=tconfig.floatX,
+        dtype=floatX,
         help='Model prediction covariance matrix, velocity model',
         optional=True)
 
     def __init__(self, **kwargs):
+        from theano import shared
         self.slnf = shared(0., name='cov_normalisation', borrow=True)
         Object.__init__(self, **kwargs)
         self.update_slnf()
@@ -112,13 +115,37 @@ class Covariance(Object):
     @property
     def p_total(self):
         if self.pred_g is None:
-            self.pred_g = num.zeros_like(self.data, dtype=tconfig.floatX)
+            self.pred_g = num.zeros_like(self.data, dtype=floatX)
 
         if self.pred_v is None:
-            self.pred_v = num.zeros_like(self.data, dtype=tconfig.floatX)
+            self.pred_v = num.zeros_like(self.data, dtype=floatX)
 
         return self.pred_g + self.pred_v
 
+    def pred_v_change(self, pred_v):
+        """
+        Relative change of the given model prediction covariance w.r.t.
+        the current velocity model prediction covariance matrix, measured in
+        the Frobenius norm.
+
+        Parameters
+        ----------
+        pred_v : :class:`numpy.ndarray`
+            new model prediction covariance matrix, velocity model
+
+        Returns
+        -------
+        float, inf if no previous prediction covariance exists
+        """
+        if self.pred_v is None:
+            return num.inf
+
+        ref_norm = num.linalg.norm(self.pred_v, ord='fro')
+        if ref_norm == 0.:
+            return num.inf
+
+        return num.linalg.norm(pred_v - self.pred_v, ord='fro') / ref_norm
+
     @property
     def inverse(self):
         """
@@ -128,7 +155,7 @@ class Covariance(Object):
         if Cx.sum() == 0:
             raise ValueError('No covariances given!')
         else:
-            return num.linalg.inv(Cx).astype(tconfig.floatX)
+            return num.linalg.inv(Cx).astype(floatX)
 
     @property
     def inverse_p(self):
@@ -137,7 +164,7 @@ class Covariance(Object):
         """
         if self.p_total.sum() == 0:
             raise ValueError('No model covariance defined!')
-        return num.linalg.inv(self.p_total).astype(tconfig.floatX)
+        return num.linalg.inv(self.p_total).astype(floatX)
 
     @property
     def inverse_d(self):
@@ -146,7 +173,7 @@ class Covariance(Object):
         """
         if self.data is None:
             raise AttributeError('No data covariance matrix defined!')
-        return num.linalg.inv(self.data).astype(tconfig.floatX)
+        return num.linalg.inv(self.data).astype(floatX)
 
     @property
     def chol(self):
@@ -157,7 +184,7 @@ class Covariance(Object):
         if Cx.sum() == 0:
             raise ValueError('No covariances given!')
         else:
-            return linalg.cholesky(Cx, lower=True).astype(tconfig.floatX)
+            return linalg.cholesky(Cx, lower=True).astype(floatX)
 
     @property
     def chol_inverse(self):
@@ -165,7 +192,7 @@ class Covariance(Object):
         Inverse of Cholesky decomposition of ALL uncertainty covariance
         matrices. To be used as weight in the optimization.
         """
-        return num.linalg.inv(self.chol).astype(tconfig.floatX)
+        return num.linalg.inv(self.chol).astype(floatX)
 
     @property
     def log_norm_factor(self):
@@ -184,7 +211,7 @@ class Covariance(Object):
         (for theano models).
         """
         self.slnf.set_value(self.log_norm_factor)
-        self.slnf.astype(tconfig.floatX)
+        self.slnf.astype(floatX)
 
 
 class ArrivalTaper(trace.Taper):
@@ -344,17 +371,17 @@ class Parameter(Object):
                     help='Type of prior distribution to use. Options:'
                          ' "Uniform", ...')
     lower = Array.T(shape=(None,),
-                    dtype=tconfig.floatX,
+                    dtype=floatX,
                     serialize_as='list',
-                    default=num.array([0., 0.], dtype=tconfig.floatX))
+                    default=num.array([0., 0.], dtype=floatX))
     upper = Array.T(shape=(None,),
-                    dtype=tconfig.floatX,
+                    dtype=floatX,
                     serialize_as='list',
-                    default=num.array([1., 1.], dtype=tconfig.floatX))
+                    default=num.array([1., 1.], dtype=floatX))
     testvalue = Array.T(shape=(None,),
-                        dtype=tconfig.floatX,
+                        dtype=floatX,
                         serialize_as='list',
-                        default=num.array([0.5, 0.5], dtype=tconfig.floatX))
+                        default=num.array([0.5, 0.5], dtype=floatX))
 
     def validate_bounds(self):
 
@@ -872,7 +899,7 @@ class GeodeticResult(Object):
 def init_seismic_targets(
         stations, earth_model_name='ak135-f-average.m', channels=['T', 'Z'],
         sample_rate=1.0, crust_inds=[0], interpolation='multilinear',
-        reference_location=None, blacklist=[]):
+        reference_location=None, blacklist=[], station_stores={}):
     """
     Initiate a list of target objects given a list of indexes to the
     respective GF store velocity model variation index (crust_inds).
@@ -899,6 +926,10 @@ def init_seismic_targets(
         :class:`pyrocko.model.Station`
         if given, targets are initialised with this reference location
     blacklist : stations that are blacklisted later
+    station_stores : dict
+        of station names and names of shared stores, see
+        :func:`plan_seis_stores`, stations that are not included use their
+        own stores
 
     Returns
     -------
@@ -907,7 +938,8 @@ def init_seismic_targets(
 
     if reference_location is None:
         store_prefixes = [
-            copy.deepcopy(station.station) for station in stations]
+            copy.deepcopy(station_stores.get(station.station, station.station))
+            for station in stations]
     else:
         store_prefixes = [
             copy.deepcopy(reference_location.station)
@@ -990,7 +1022,7 @@ def init_geodetic_targets(
 
 def vary_model(
         earthmod, error_depth=0.1, error_velocities=0.1,
-        depth_limit_variation=600 * km):
+        depth_limit_variation=600 * km, rstate=None):
     """
     Vary depths and velocities in the given source model by Gaussians with
     given 2-sigma errors [percent]. Ensures increasing velocity with depth.
@@ -1008,6 +1040,8 @@ def vary_model(
         2 sigma error in percent of the velocities for the respective layers
     depth_limit_variations : scalar, float
         depth threshold [m], layers with depth > than this are not varied
+    rstate : :class:`numpy.random.RandomState`
+        random number generator, default: global numpy generator
 
     Returns
     -------
@@ -1018,6 +1052,9 @@ def vary_model(
         Cost of up to 20 are ok for crustal profiles.
     """
 
+    if rstate is None:
+        rstate = num.random
+
     new_earthmod = copy.deepcopy(earthmod)
     layers = new_earthmod.layers()
 
@@ -1065,7 +1102,7 @@ def vary_model(
                     logger.debug('Velocity error: %f ', error_velocities)
 
             deltavp = float(
-                num.random.normal(
+                rstate.normal(
                     0, layer.mtop.vp * error_velocities / 3., 1))
 
             if layer.ztop == 0:
@@ -1111,7 +1148,7 @@ def vary_model(
         while repeat:
             # ensure that bottom of layer is not shallower than the top
             deltaz = float(
-                num.random.normal(
+                rstate.normal(
                     0, layer.zbot * factor_d / 3., 1))  # 3 sigma
             layer.zbot += deltaz
             if layer.zbot < layer.ztop:
@@ -1126,8 +1163,50 @@ def vary_model(
     return new_earthmod, cost
 
 
+def draw_earthmodel(
+        ref_earthmod, seed=None, error_depth=0.1, error_velocities=0.1,
+        depth_limit_variation=600 * km, max_cost=20):
+    """
+    Draw one varied earthmodel by rejection of unlikely models, see
+    :func:`vary_model`.
+
+    Parameters
+    ----------
+    ref_earthmod : :class:`pyrocko.cake.LayeredModel`
+        Reference earthmodel defining layers, depth, velocities, densities
+    seed : int
+        seed of the random number generator, if None not reproducible
+    error_depth : scalar, float
+        3 sigma error in percent of the depth for the respective layers
+    error_velocities : scalar, float
+        3 sigma error in percent of the velocities for the respective layers
+    depth_limit_variation : scalar, float
+        depth threshold [m], layers with depth > than this are not varied
+    max_cost : int
+        models with higher cost are rejected
+
+    Returns
+    -------
+    Varied Earthmodel : :class:`pyrocko.cake.LayeredModel`
+    """
+    rstate = num.random.RandomState(seed)
+    while True:
+        new_model, cost = vary_model(
+            ref_earthmod,
+            error_depth,
+            error_velocities,
+            depth_limit_variation,
+            rstate=rstate)
+
+        if cost > max_cost:
+            logger.debug('Skipped unlikely model %f' % cost)
+        else:
+            return new_model
+
+
 def ensemble_earthmodel(ref_earthmod, num_vary=10, error_depth=0.1,
-                        error_velocities=0.1, depth_limit_variation=600 * km):
+                        error_velocities=0.1, depth_limit_variation=600 * km,
+                        seeds=None, nprocs=1):
     """
     Create ensemble of earthmodels that vary around a given input earth model
     by a Gaussian of 2 sigma (in Percent 0.1 = 10%) for the depth layers
@@ -1145,36 +1224,143 @@ def ensemble_earthmodel(ref_earthmod, num_vary=10, error_depth=0.1,
         3 sigma error in percent of the velocities for the respective layers
     depth_limit_variation : scalar, float
         depth threshold [m], layers with depth > than this are not varied
+    seeds : list
+        of int, seeds for the realisations, makes the ensemble reproducible
+    nprocs : int
+        number of processors to draw the realisations in parallel
 
     Returns
     -------
     List of Varied Earthmodels :class:`pyrocko.cake.LayeredModel`
+
+    Raises
+    ------
+    RuntimeError
+        if not all realisations could be drawn, e.g. due to a timeout
     """
+    if seeds is None:
+        seeds = [None] * num_vary
+    elif len(seeds) != num_vary:
+        raise ValueError(
+            'Number of seeds %i does not match number of realisations'
+            ' %i!' % (len(seeds), num_vary))
+
+    workpackage = [
+        (ref_earthmod, seed, error_depth, error_velocities,
+         depth_limit_variation) for seed in seeds]
 
     earthmods = []
-    i = 0
-    while i < num_vary:
-        new_model, cost = vary_model(
-            ref_earthmod,
-            error_depth,
-            error_velocities,
-            depth_limit_variation)
+    for result in parallel.paripool(
+            draw_earthmodel, workpackage, nprocs=min(nprocs, num_vary)):
+        earthmods.extend(result)
 
-        if cost > 20:
-            logger.debug('Skipped unlikely model %f' % cost)
-        else:
-            i += 1
-            earthmods.append(new_model)
+    n_drawn = len([earthmod for earthmod in earthmods if earthmod is not None])
+    if n_drawn != num_vary:
+        raise RuntimeError(
+            'Only %i of %i velocity model variations could be drawn!' % (
+                n_drawn, num_vary))
 
     return earthmods
 
 
+def get_velocity_model_key(ref_earthmod, gf_config):
+    """
+    Get key of the velocity model variations of a reference earthmodel.
+    """
+    gfc = gf_config
+    return hashlib.sha1(' '.join((
+        str(ref_earthmod),
+        '%g' % gfc.error_depth,
+        '%g' % gfc.error_velocities,
+        '%g' % gfc.depth_limit_variation,
+        '%i' % gfc.variation_seed))).hexdigest()
+
+
+def get_velocity_models(
+        location, earth_model_name, crust_inds=[0], gf_config=None,
+        custom_velocity_model=None, cache_dir=None, nprocs=1):
+    """
+    Get the reference velocity model and its variations at the specified
+    location. The variation of index crust_ind is reproducible, its seed is
+    derived from the variation_seed of the gf_config, the reference model
+    and crust_ind. Locations with different reference models, e.g. source
+    and receiver, therefore get independent variations. If a cache directory
+    is given the variations are stored and reused, so that all GF stores
+    (and the covariance estimation) use the same realisations.
+
+    Parameters
+    ----------
+    location : :class:`pyrocko.meta.Location`
+    earth_model_name : str
+        Name of the base earth model to be used, check
+        :func:`pyrocko.cake.builtin_models` for alternatives,
+        default ak135 with medium resolution
+    crust_inds : list
+        of int, 0 is the reference model,
+        indexes > 0 use reference model and vary its parameters by a Gaussian
+    gf_config : :class:`beat.config.NonlinearGFConfig`
+    custom_velocity_model : :class:`pyrocko.cake.LayeredModel`
+    cache_dir : str
+        directory of the cached variations
+    nprocs : int
+        number of processors to draw the variations in parallel
+
+    Returns
+    -------
+    list of :class:`pyrocko.cake.LayeredModel`
+    """
+    gfc = gf_config
+
+    ref_model = get_reference_velocity_model(
+        location, earth_model_name, gf_config=gfc,
+        custom_velocity_model=custom_velocity_model)
+
+    if max(crust_inds) < 1:
+        return [ref_model for _ in crust_inds]
+
+    key = get_velocity_model_key(ref_model, gfc)
+
+    models = {}
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, 'velocity_models_%s.pkl' % key)
+
+        if os.path.exists(cache_path):
+            models = utility.load_objects(cache_path)[0]
+
+    missing = sorted(set(
+        crust_ind for crust_ind in crust_inds
+        if crust_ind > 0 and crust_ind not in models))
+
+    if missing:
+        logger.info('Drawing %i velocity model variations ...' % len(missing))
+        varied_models = ensemble_earthmodel(
+            ref_model,
+            num_vary=len(missing),
+            error_depth=gfc.error_depth,
+            error_velocities=gfc.error_velocities,
+            depth_limit_variation=gfc.depth_limit_variation * km,
+            seeds=[(int(key[:8], 16) + crust_ind) % 2 ** 32
+                   for crust_ind in missing],
+            nprocs=nprocs)
+
+        models.update(zip(missing, varied_models))
+
+        if cache_path is not None:
+            util.ensuredir(cache_dir)
+            utility.dump_objects(cache_path, [models])
+
+    return [
+        ref_model if crust_ind == 0 else models[crust_ind]
+        for crust_ind in crust_inds]
+
+
 def get_velocity_model(
         location, earth_model_name, crust_ind=0, gf_config=None,
-        custom_velocity_model=None):
+        custom_velocity_model=None, cache_dir=None):
     """
     Get velocity model at the specified location, combines given or crustal
-    models with the global model.
+    models with the global model, see :func:`get_velocity_models`.
 
     Parameters
     ----------
@@ -1188,6 +1374,35 @@ def get_velocity_model(
         indexes > 0 use reference model and vary its parameters by a Gaussian
     gf_config : :class:`beat.config.GFConfig`
     custom_velocity_model : :class:`pyrocko.cake.LayeredModel`
+    cache_dir : str
+        directory of the cached variations
+
+    Returns
+    -------
+    :class:`pyrocko.cake.LayeredModel`
+    """
+    return get_velocity_models(
+        location, earth_model_name, crust_inds=[crust_ind],
+        gf_config=gf_config, custom_velocity_model=custom_velocity_model,
+        cache_dir=cache_dir)[0]
+
+
+def get_reference_velocity_model(
+        location, earth_model_name, gf_config=None,
+        custom_velocity_model=None):
+    """
+    Get reference velocity model at the specified location, combines given
+    or crustal models with the global model.
+
+    Parameters
+    ----------
+    location : :class:`pyrocko.meta.Location`
+    earth_model_name : str
+        Name of the base earth model to be used, check
+        :func:`pyrocko.cake.builtin_models` for alternatives,
+        default ak135 with medium resolution
+    gf_config : :class:`beat.config.GFConfig`
+    custom_velocity_model : :class:`pyrocko.cake.LayeredModel`
 
     Returns
     -------
@@ -1255,14 +1470,6 @@ def get_velocity_model(
         source_model = cake.load_model(
             earth_model_name).extract(depth_max='cmb')
 
-    if crust_ind > 0:
-        source_model = ensemble_earthmodel(
-            source_model,
-            num_vary=1,
-            error_depth=gfc.error_depth,
-            error_velocities=gfc.error_velocities,
-            depth_limit_variation=gfc.depth_limit_variation * km)[0]
-
     return source_model
 
 
@@ -1313,7 +1520,7 @@ def get_earth_model_prefix(earth_model_name):
 
 
 def get_fomosto_baseconfig(
-        gfconfig, event, station, waveforms, crust_ind):
+        gfconfig, event, station, waveforms, crust_ind, distance_range=None):
     """
     Initialise fomosto config.
 
@@ -1329,15 +1536,22 @@ def get_fomosto_baseconfig(
         Waveforms to calculate GFs for, determines the length of traces
     crust_ind : int
         Index to set to the Greens Function store
+    distance_range : tuple
+        of minimum and maximum distance [m] of the store,
+        default: station distance +- source_distance_radius
     """
     sf = gfconfig
 
     if gfconfig.code != 'psgrn' and len(waveforms) < 1:
         raise IOError('No waveforms specified! No GFs to be calculated!')
 
-    # calculate event-station distance [m]
-    distance = orthodrome.distance_accurate50m(event, station)
-    distance_min = distance - (sf.source_distance_radius * km)
+    if distance_range is None:
+        # calculate event-station distance [m]
+        distance = orthodrome.distance_accurate50m(event, station)
+        distance_min = distance - (sf.source_distance_radius * km)
+        distance_max = distance + (sf.source_distance_radius * km)
+    else:
+        distance_min, distance_max = distance_range
 
     if distance_min < 0.:
         logger.warn(
@@ -1375,7 +1589,7 @@ def get_fomosto_baseconfig(
         source_depth_max=sf.source_depth_max * km,
         source_depth_delta=sf.source_depth_spacing * km,
         distance_min=distance_min,
-        distance_max=distance + (sf.source_distance_radius * km),
+        distance_max=distance_max,
         distance_delta=sf.source_distance_spacing * km,
         tabulated_phases=tabulated_phases)
 
@@ -1505,13 +1719,387 @@ def choose_backend(
     return conf
 
 
+def get_receiver_structure_key(location, gf_config):
+    """
+    Get key of the crustal structure below a location, locations with equal
+    keys have identical receiver site velocity models.
+
+    Parameters
+    ----------
+    location : :class:`pyrocko.model.Station`
+    gf_config : :class:`config.SeismicGFConfig`
+
+    Returns
+    -------
+    tuple of the rounded crustal profile (depth, vp, vs, rho)
+    """
+    receiver_model = get_velocity_model(
+        location, earth_model_name=gf_config.earth_model_name,
+        crust_ind=0, gf_config=gf_config).extract(depth_max='moho')
+
+    profile = num.vstack([
+        receiver_model.profile(what) for what in ['z', 'vp', 'vs', 'rho']])
+    return tuple(num.round(profile).ravel().tolist())
+
+
+def get_store_locations(stations, event, gf_config):
+    """
+    Get locations and distance ranges of the seismic GF stores for the
+    stations, stations sharing a store (see :func:`plan_seis_stores`) are
+    covered by one store.
+
+    Parameters
+    ----------
+    stations : list
+        of :class:`pyrocko.model.Station`
+    event : :class:`pyrocko.model.Event`
+    gf_config : :class:`config.SeismicGFConfig`
+
+    Returns
+    -------
+    list of tuples of (location, distance_range), location is a
+    :class:`pyrocko.model.Station` or :class:`ReferenceLocation` named after
+    the store, distance_range is None for individual stores
+    """
+    radius = gf_config.source_distance_radius * km
+
+    store_members = OrderedDict()
+    for station in stations:
+        store_name = gf_config.station_stores.get(
+            station.station, station.station)
+        store_members.setdefault(store_name, []).append(station)
+
+    locations = []
+    for store_name, members in store_members.iteritems():
+        if len(members) == 1 and store_name == members[0].station:
+            locations.append((members[0], None))
+        else:
+            distances = [
+                orthodrome.distance_accurate50m(event, station)
+                for station in members]
+            location = ReferenceLocation(
+                station=store_name, lat=members[0].lat, lon=members[0].lon)
+            locations.append((
+                location,
+                (max(min(distances) - radius, 0.), max(distances) + radius)))
+
+    return locations
+
+
+def plan_seis_stores(stations, event, seismic_config, max_spread=None):
+    """
+    Plan shared seismic GF stores. Stations with identical receiver site
+    structure are clustered with respect to their distances to the event,
+    each cluster shares one GF store covering the distances of all its
+    stations. Logs the estimated savings, build time and disk space scale
+    with the number of GF records.
+
+    Parameters
+    ----------
+    stations : list
+        of :class:`pyrocko.model.Station`
+    event : :class:`pyrocko.model.Event`
+    seismic_config : :class:`config.SeismicConfig`
+    max_spread : float
+        maximum distance [km] between the stations of a cluster,
+        default: source_distance_radius of the gf_config
+
+    Returns
+    -------
+    dict of station names and names of the shared stores, to be set as
+    station_stores of the gf_config
+    """
+    sf = seismic_config.gf_config
+
+    if max_spread is None:
+        max_spread = sf.source_distance_radius
+
+    structures = OrderedDict()
+    for station in stations:
+        key = get_receiver_structure_key(station, sf)
+        distance = orthodrome.distance_accurate50m(event, station)
+        structures.setdefault(key, []).append((distance, station))
+
+    logger.info(
+        'Stations have %i different receiver structures' % len(structures))
+
+    station_stores = {}
+    for members in structures.itervalues():
+        members.sort(key=lambda x: x[0])
+
+        clusters = [[members[0]]]
+        for distance, station in members[1:]:
+            if distance - clusters[-1][0][0] > max_spread * km:
+                clusters.append([])
+
+            clusters[-1].append((distance, station))
+
+        for cluster in clusters:
+            names = sorted(station.station for _, station in cluster)
+            if len(names) == 1:
+                store_name = names[0]
+            else:
+                store_name = 'C%s' % hashlib.sha1(
+                    ','.join(names)).hexdigest()[:8]
+
+            for name in names:
+                station_stores[name] = store_name
+
+    waveforms = seismic_config.get_waveform_names()
+
+    def nrecords(gf_config):
+        return sum(
+            get_fomosto_baseconfig(
+                gf_config, event, location, waveforms, 0,
+                distance_range=distance_range).nrecords
+            for location, distance_range in get_store_locations(
+                stations, event, gf_config))
+
+    individual_sf = copy.deepcopy(sf)
+    individual_sf.station_stores = {}
+    planned_sf = copy.deepcopy(sf)
+    planned_sf.station_stores = station_stores
+
+    nrecords_individual = nrecords(individual_sf)
+    nrecords_shared = nrecords(planned_sf)
+
+    logger.info(
+        'Number of GF stores: %i -> %i' % (
+            len(stations), len(set(station_stores.values()))))
+    logger.info(
+        'Number of GF records: %i -> %i, saves ~%.0f %% build time and'
+        ' disk space' % (
+            nrecords_individual, nrecords_shared,
+            100. * (1. - float(nrecords_shared) / nrecords_individual)))
+
+    return station_stores
+
+
+# number of GF records that justify one processor for building a GF store
+gf_records_per_worker = 2000
+
+
+def get_store_nworkers(fomosto_config, max_nworkers=1):
+    """
+    Get the number of processors for building a GF store with respect to
+    the number of its records.
+
+    Parameters
+    ----------
+    fomosto_config : :class:`pyrocko.gf.meta.Config`
+    max_nworkers : int
+        maximum number of processors
+
+    Returns
+    -------
+    int
+    """
+    nworkers = int(num.ceil(
+        float(fomosto_config.nrecords) / gf_records_per_worker))
+    return max(1, min(nworkers, max_nworkers))
+
+
+def get_gf_build_marker(store_dir, step):
+    """
+    Get path to the completion marker of a GF store build step.
+    """
+    return os.path.join(store_dir, '.beat_%s_done' % step)
+
+
+def seis_create_store(
+        store_dir, fomosto_config, code, source_model, receiver_model,
+        gf_directory, force=False):
+    """
+    Create the editable files of a seismic GF store.
+    """
+    if not os.path.exists(store_dir) or force:
+        logger.info('Creating Store at %s' % store_dir)
+
+        conf = choose_backend(
+            fomosto_config, code, source_model, receiver_model,
+            gf_directory)
+
+        fomosto_config.validate()
+        conf.validate()
+
+        gf.Store.create_editables(
+            store_dir,
+            config=fomosto_config,
+            extra={code: conf},
+            force=force)
+    else:
+        logger.info(
+            'Store %s exists! Use force=True to overwrite!' % store_dir)
+
+
+def seis_make_store_ttt(store_dir, force=False):
+    """
+    Calculate the travel time tables of a seismic GF store.
+    """
+    logger.info('Calculating travel time tables of %s ...' % store_dir)
+    store = gf.Store(store_dir, 'r')
+    store.make_ttt(force=force)
+    store.close()
+
+
+def seis_fill_store(store_dir, code, nworkers=1, force=False, rm_gfs=False):
+    """
+    Fill a seismic GF store, continues interrupted calculations.
+    """
+    traces_path = os.path.join(store_dir, 'traces')
+    continue_ = os.path.exists(traces_path) and not force
+
+    logger.info(
+        'Filling store %s with %i worker(s) ...' % (store_dir, nworkers))
+    backend_builders[code](
+        store_dir, nworkers=nworkers, force=force, continue_=continue_)
+
+    if rm_gfs and code == 'qssp':
+        gf_dir = os.path.join(store_dir, 'qssp_green')
+        logger.info('Removing QSSP Greens Functions!')
+        shutil.rmtree(gf_dir)
+
+
+def get_seis_gf_jobs(
+        stations, event, seismic_config, crust_inds=[0], execute=False,
+        force=False, cache_dir=None):
+    """
+    Get the graph of jobs to create and fill the seismic GF stores of all
+    stations and velocity models. Each store is being created, its travel
+    time tables calculated and filled. The number of processors for filling
+    a store depends on its number of records. Stations that share a store
+    (station_stores of the gf_config) are covered by one store. The
+    velocity model variations of each location are drawn at once, see
+    :func:`get_velocity_models`.
+
+    Parameters
+    ----------
+    stations : list
+        of :class:`pyrocko.model.Station`
+    event : :class:`pyrocko.model.Event`
+    seismic_config : :class:`config.SeismicConfig`
+    crust_inds : list
+        of int of the velocity model indexes
+    execute : boolean
+        Flag to execute the calculation, if False just setup tested
+    force : boolean
+        Flag to overwrite existing GF stores
+    cache_dir : str
+        directory of the cached velocity model variations
+
+    Returns
+    -------
+    :class:`parallel.JobGraph`
+    """
+    sf = seismic_config.gf_config
+    waveforms = seismic_config.get_waveform_names()
+
+    source_models = get_velocity_models(
+        event, earth_model_name=sf.earth_model_name, crust_inds=crust_inds,
+        gf_config=sf, custom_velocity_model=sf.custom_velocity_model,
+        cache_dir=cache_dir, nprocs=sf.nworkers)
+
+    if len(stations) == 1:
+        custom_velocity_model = sf.custom_velocity_model
+    else:
+        custom_velocity_model = None
+
+    locations = get_store_locations(stations, event, sf)
+
+    fomosto_configs = {}
+    receiver_models = {}
+    for station, distance_range in locations:
+        create_inds = []
+        for crust_ind in crust_inds:
+            fomosto_config = get_fomosto_baseconfig(
+                sf, event, station, waveforms, crust_ind,
+                distance_range=distance_range)
+            fomosto_configs[station.station, crust_ind] = fomosto_config
+
+            store_dir = os.path.join(sf.store_superdir, fomosto_config.id)
+            if not os.path.exists(store_dir) or force:
+                create_inds.append(crust_ind)
+
+        if create_inds:
+            receiver_models.update(zip(
+                [(station.station, crust_ind) for crust_ind in create_inds],
+                get_velocity_models(
+                    station, earth_model_name=sf.earth_model_name,
+                    crust_inds=create_inds, gf_config=sf,
+                    custom_velocity_model=custom_velocity_model,
+                    cache_dir=cache_dir, nprocs=sf.nworkers)))
+
+    graph = parallel.JobGraph()
+    for crust_ind, source_model in zip(crust_inds, source_models):
+        gf_directory = os.path.join(
+            sf.store_superdir, 'base_gfs_%i' % crust_ind)
+
+        first_fill = None
+        for station, _ in locations:
+            fomosto_config = fomosto_configs[station.station, crust_ind]
+
+            store_id = fomosto_config.id
+            store_dir = os.path.join(sf.store_superdir, store_id)
+
+            nworkers = get_store_nworkers(fomosto_config, sf.nworkers)
+
+            receiver_model = receiver_models.get(
+                (station.station, crust_ind), None)
+
+            graph.add(parallel.Job(
+                name='create_%s' % store_id,
+                function=seis_create_store,
+                kwargs=dict(
+                    store_dir=store_dir,
+                    fomosto_config=fomosto_config,
+                    code=sf.code,
+                    source_model=source_model,
+                    receiver_model=receiver_model,
+                    gf_directory=gf_directory,
+                    force=force),
+                marker=get_gf_build_marker(store_dir, 'create')))
+
+            if execute:
+                graph.add(parallel.Job(
+                    name='ttt_%s' % store_id,
+                    function=seis_make_store_ttt,
+                    kwargs=dict(store_dir=store_dir, force=force),
+                    depends=['create_%s' % store_id],
+                    marker=get_gf_build_marker(store_dir, 'ttt')))
+
+                depends = ['ttt_%s' % store_id]
+                if sf.code == 'qseis2d':
+                    # base GFs are shared by the stores of a velocity model
+                    if first_fill is None:
+                        first_fill = 'fill_%s' % store_id
+                    else:
+                        depends.append(first_fill)
+
+                graph.add(parallel.Job(
+                    name='fill_%s' % store_id,
+                    function=seis_fill_store,
+                    kwargs=dict(
+                        store_dir=store_dir,
+                        code=sf.code,
+                        nworkers=nworkers,
+                        force=force,
+                        rm_gfs=sf.rm_gfs),
+                    depends=depends,
+                    nworkers=nworkers,
+                    marker=get_gf_build_marker(store_dir, 'fill')))
+
+    return graph
+
+
 def seis_construct_gf(
         stations, event, seismic_config, crust_ind=0, execute=False,
-        force=False):
+        force=False, crust_inds=None, cache_dir=None):
     """
     Calculate seismic Greens Functions (GFs) and create a repository 'store'
     that is being used later on repeatetly to calculate the synthetic
-    waveforms.
+    waveforms. The stores of all stations (and velocity models) are built
+    in parallel, using in total the number of processors given in the
+    gf_config. Interrupted calculations are resumed.
 
     Parameters
     ----------
@@ -1530,78 +2118,34 @@ def seis_construct_gf(
         Flag to execute the calculation, if False just setup tested
     force : boolean
         Flag to overwrite existing GF stores
+    crust_inds : list
+        of int, Indexes of several velocity models, overrides crust_ind
+    cache_dir : str
+        directory of the cached velocity model variations
     """
 
     sf = seismic_config.gf_config
 
-    source_model = get_velocity_model(
-        event, earth_model_name=sf.earth_model_name, crust_ind=crust_ind,
-        gf_config=sf, custom_velocity_model=sf.custom_velocity_model)
+    if crust_inds is None:
+        crust_inds = [crust_ind]
 
-    waveforms = seismic_config.get_waveform_names()
+    graph = get_seis_gf_jobs(
+        stations, event, seismic_config, crust_inds=crust_inds,
+        execute=execute, force=force, cache_dir=cache_dir)
 
-    for station in stations:
-        logger.info('Station %s' % station.station)
-        logger.info('---------------------')
+    if force:
+        graph.reset()
 
-        fomosto_config = get_fomosto_baseconfig(
-            sf, event, station, waveforms, crust_ind)
-
-        store_dir = os.path.join(sf.store_superdir, fomosto_config.id)
-
-        if not os.path.exists(store_dir) or force:
-            logger.info('Creating Store at %s' % store_dir)
-
-            if len(stations) == 1:
-                custom_velocity_model = sf.custom_velocity_model
-            else:
-                custom_velocity_model = None
+    failed = graph.run(nprocs=sf.nworkers)
 
-            receiver_model = get_velocity_model(
-                station, earth_model_name=sf.earth_model_name,
-                crust_ind=crust_ind, gf_config=sf,
-                custom_velocity_model=custom_velocity_model)
-
-            gf_directory = os.path.join(
-                sf.store_superdir, 'base_gfs_%i' % crust_ind)
-
-            conf = choose_backend(
-                fomosto_config, sf.code, source_model, receiver_model,
-                gf_directory)
-
-            fomosto_config.validate()
-            conf.validate()
-
-            gf.Store.create_editables(
-                store_dir,
-                config=fomosto_config,
-                extra={sf.code: conf},
-                force=force)
-        else:
-            logger.info(
-                'Store %s exists! Use force=True to overwrite!' % store_dir)
-
-        traces_path = os.path.join(store_dir, 'traces')
-
-        if execute:
-            if not os.path.exists(traces_path) or force:
-                logger.info('Filling store ...')
-                store = gf.Store(store_dir, 'r')
-                store.make_ttt(force=force)
-                store.close()
-                backend_builders[sf.code](
-                    store_dir, nworkers=sf.nworkers, force=force)
-
-                if sf.rm_gfs and sf.code == 'qssp':
-                    gf_dir = os.path.join(store_dir, 'qssp_green')
-                    logger.info('Removing QSSP Greens Functions!')
-                    shutil.rmtree(gf_dir)
-            else:
-                logger.info('Traces exist use force=True to overwrite!')
+    if failed:
+        raise RuntimeError(
+            'GF store jobs failed: %s' % utility.list2string(failed))
 
 
 def geo_construct_gf(
-        event, geodetic_config, crust_ind=0, execute=True, force=False):
+        event, geodetic_config, crust_ind=0, execute=True, force=False,
+        cache_dir=None):
     """
     Calculate geodetic Greens Functions (GFs) and create a fomosto 'GF store'
     that is being used repeatetly later on to calculate the synthetic
@@ -1619,6 +2163,8 @@ def geo_construct_gf(
         Flag to execute the calculation, if False just setup tested
     force : boolean
         Flag to overwrite existing GF stores
+    cache_dir : str
+        directory of the cached velocity model variations
     """
     from pyrocko.fomosto import psgrn_pscmp as ppp
 
@@ -1629,7 +2175,8 @@ def geo_construct_gf(
     source_model = get_velocity_model(
         event, earth_model_name=gfc.earth_model_name,
         crust_ind=crust_ind, gf_config=gfc,
-        custom_velocity_model=gfc.custom_velocity_model).extract(
+        custom_velocity_model=gfc.custom_velocity_model,
+        cache_dir=cache_dir).extract(
             depth_max=gfc.source_depth_max * km)
 
     c = ppp.PsGrnPsCmpConfig()
@@ -1656,14 +2203,6 @@ def geo_construct_gf(
         logger.info('Create Store at: %s' % store_dir)
         logger.info('---------------------------')
 
-        # potentially vary source model
-        if crust_ind > 0:
-            source_model = ensemble_earthmodel(
-                source_model,
-                num_vary=1,
-                error_depth=gfc.error_depth,
-                error_velocities=gfc.error_velocities)[0]
-
         fomosto_config.earthmodel_1d = source_model
         fomosto_config.modelling_code_id = 'psgrn_pscmp.%s' % version
 
@@ -1755,14 +2294,6 @@ def geo_construct_gf_psgrn(
         custom_velocity_model=gfc.custom_velocity_model).extract(
             depth_max=gfc.source_depth_max * km)
 
-    # potentially vary source model
-    if crust_ind > 0:
-        source_model = ensemble_earthmodel(
-            source_model,
-            num_vary=1,
-            error_depth=gfc.error_depth,
-            error_velocities=gfc.error_velocities)[0]
-
     c.earthmodel_1d = source_model
     c.psgrn_outdir = os.path.join(
         gfc.store_superdir, 'psgrn_green_%i' % (crust_ind))
@@ -1772,6 +2303,11 @@ def geo_construct_gf_psgrn(
 
     runner = psgrn.PsGrnRunner(outdir=c.psgrn_outdir)
 
+    cache = None
+    if gfc.psgrn_cache_dir:
+        cache = psgrn.PsGrnCache(
+            gfc.psgrn_cache_dir, max_size=gfc.psgrn_cache_size)
+
     if not execute:
         logger.info('Geo GFs can be created in directory: %s ! '
                     '(execute=True necessary)! GF params: \n' % c.psgrn_outdir)
@@ -1779,7 +2315,7 @@ def geo_construct_gf_psgrn(
 
     if execute:
         logger.info('Creating Geo GFs in directory: %s' % c.psgrn_outdir)
-        runner.run(c, force)
+        runner.run(c, force, cache=cache)
 
 
 def geo_layer_synthetics_pscmp(
@@ -1803,7 +2339,8 @@ def geo_layer_synthetics_pscmp(
         Sources to calculate synthetics for
     keep_tmp : boolean
         Flag to keep directories (in '/tmp') where calculated synthetics are
-        stored.
+        stored. If False, the temporary directory of the process is reused
+        for subsequent calls.
     outmode : str
         determines type of output
 
@@ -1821,7 +2358,11 @@ def geo_layer_synthetics_pscmp(
     c.times_snapshots = [0]
     c.rectangular_source_patches = sources
 
-    runner = pscmp.PsCmpRunner(keep_tmp=keep_tmp)
+    if keep_tmp:
+        runner = pscmp.PsCmpRunner(keep_tmp=keep_tmp)
+    else:
+        runner = pscmp.get_runner()
+
     runner.run(c)
     # returns list of displacements for each snapshot
     return runner.get_results(component='displ', flip_z=True)[0]
@@ -2174,20 +2715,20 @@ def concatenate_datasets(datasets):
     Bij : :class:`utility.ListToArrayBijection`
     """
 
-    _disp_list = [data.displacement.astype(tconfig.floatX)
+    _disp_list = [data.displacement.astype(floatX)
                   for data in datasets]
-    _odws_list = [data.odw.astype(tconfig.floatX)
+    _odws_list = [data.odw.astype(floatX)
                   for data in datasets]
-    _lv_list = [data.update_los_vector().astype(tconfig.floatX)
+    _lv_list = [data.update_los_vector().astype(floatX)
                 for data in datasets]
 
     # merge geodetic data to calculate residuals on single array
     ordering = utility.ListArrayOrdering(_disp_list, intype='numpy')
     Bij = utility.ListToArrayBijection(ordering, _disp_list)
 
-    odws = Bij.fmap(_odws_list).astype(tconfig.floatX)
-    datasets = Bij.fmap(_disp_list).astype(tconfig.floatX)
-    los_vectors = Bij.f3map(_lv_list).astype(tconfig.floatX)
+    odws = Bij.fmap(_odws_list).astype(floatX)
+    datasets = Bij.fmap(_disp_list).astype(floatX)
+    los_vectors = Bij.f3map(_lv_list).astype(floatX)
     return datasets, los_vectors, odws, Bij
 
 
@@ -2219,7 +2760,8 @@ def init_datahandler(seismic_config, seismic_data_path='./'):
         sample_rate=sc.gf_config.sample_rate,
         crust_inds=[sc.gf_config.reference_model_idx],
         reference_location=sc.gf_config.reference_location,
-        blacklist=sc.blacklist)
+        blacklist=sc.blacklist,
+        station_stores=sc.gf_config.station_stores)
 
     datahandler = DataWaveformCollection(stations, wavenames)
     datahandler.add_datasets(
@@ -2450,6 +2992,87 @@ def seis_synthetics(engine, sources, targets, arrival_taper=None,
         raise TypeError('Outmode %s not supported!' % outmode)
 
 
+def seis_synthetics_batch(
+        engine, sources_list, targets, arrival_taper, wavename='any_P',
+        filterer=None, nprocs=1):
+    """
+    Calculate synthetic seismograms for several source configurations
+    (e.g. posterior samples) in a single request to the engine.
+    The traces of each source configuration are tapered around the phase
+    arrival of its first (reference) source and stacked.
+
+    Parameters
+    ----------
+    engine : :class:`pyrocko.gf.seismosizer.LocalEngine`
+    sources_list : list
+        of lists of :class:`pyrocko.gf.seismosizer.Source` Objects,
+        all of equal length, reference source is the first in each list!!!
+    targets : list
+        containing :class:`pyrocko.gf.seismosizer.Target` Objects
+    arrival_taper : :class:`ArrivalTaper`
+    wavename : string
+        of the tabulated phase that determines the phase arrival
+    filterer : :class:`Filterer`
+    nprocs : int
+        number of processors to use for synthetics calculation
+
+    Returns
+    -------
+    :class:`numpy.ndarray` (n_configurations, n_targets, n_samples)
+        synthetics
+    :class:`numpy.ndarray` (n_configurations, n_targets) of tmins for traces
+    """
+    npoints = len(sources_list)
+    ns = len(sources_list[0])
+    nt = len(targets)
+
+    tmins = num.zeros((npoints, nt))
+    taperers = []
+    tapp = taperers.append
+    for i, sources in enumerate(sources_list):
+        if len(sources) != ns:
+            raise ValueError(
+                'All source configurations need the same number of sources!')
+
+        for j, target in enumerate(targets):
+            taperer = get_phase_taperer(
+                engine=engine,
+                source=sources[0],
+                wavename=wavename,
+                target=target,
+                arrival_taper=arrival_taper)
+            tmins[i, j] = taperer.a
+            tapp(taperer)
+
+    t_2 = time()
+    response = engine.process(
+        sources=[source for sources in sources_list for source in sources],
+        targets=targets, nprocs=nprocs)
+    t_1 = time()
+
+    logger.debug('Synthetics generation time: %f' % (t_1 - t_2))
+
+    synths = None
+    for k, (source, target, tr) in enumerate(response.iter_results()):
+        i = k // (ns * nt)
+        j = k % nt
+
+        post_process_trace(
+            trace=tr,
+            taper=taperers[i * nt + j],
+            filterer=filterer,
+            outmode='array')
+
+        if synths is None:
+            synths = num.zeros((npoints, nt, tr.ydata.size))
+
+        # chopping may differ by one sample between configurations
+        n = min(synths.shape[2], tr.ydata.size)
+        synths[i, j, :n] += tr.ydata[:n]
+
+    return synths, tmins
+
+
 def geo_synthetics(
         engine, targets, sources, outmode='stacked_array', plot=False,
         nprocs=1):
@@ -0,0 +1,401 @@
+"""
+Closed-form solution of the linear-Gaussian static distributed slip problem.
+
+For fixed hyperparameters and the Laplacian smoothing prior the posterior of
+the slip on the fault patches is Gaussian, apart from the bounds of the
+priors. The weighted Greens Function matrixes of the
+:class:`ffi.GeodeticGFLibrary` and the whitened data define a regularized
+least-squares problem, with the Maximum A Posteriori (MAP) solution and the
+posterior covariance given by the normal equations. The bounded MAP is
+obtained by accelerated projected gradient descent.
+
+References
+----------
+.. [Beck2009] Beck, A. and Teboulle, M. (2009).
+    A Fast Iterative Shrinkage-Thresholding Algorithm for Linear Inverse
+    Problems. SIAM Journal on Imaging Sciences, 2(1), pp. 183-202.
+"""
+
+import logging
+from collections import OrderedDict
+
+import numpy as num
+from scipy import linalg
+
+from beat import heart
+from beat.config import hyper_name_laplacian, default_bounds
+
+
+__all__ = [
+    'LinearSolution',
+    'get_problem_hypers',
+    'solve_regularized_lsq',
+    'solve_bounded_lsq',
+    'solve_static_ffi',
+    'get_initial_population']
+
+
+logger = logging.getLogger('linear_solver')
+
+
+class LinearSolution(object):
+    """
+    Gaussian posterior of the linear parameters and their MAP.
+
+    Parameters
+    ----------
+    slices : :class:`collections.OrderedDict`
+        variable name: slice into the parameter vector
+    mean : :class:`numpy.ndarray`
+        mean of the unbounded Gaussian posterior
+    normal_chol : :class:`numpy.ndarray`
+        lower triangular Cholesky factor of the normal matrix, i.e. the
+        inverse posterior covariance
+    lower : :class:`numpy.ndarray`
+        lower bounds of the parameters
+    upper : :class:`numpy.ndarray`
+        upper bounds of the parameters
+    map : :class:`numpy.ndarray`
+        MAP solution within the bounds, if None the unbounded mean
+    """
+
+    def __init__(self, slices, mean, normal_chol, lower, upper, map=None):
+        self.slices = slices
+        self.mean = mean
+        self.normal_chol = normal_chol
+        self.lower = lower
+        self.upper = upper
+        self.map = mean if map is None else map
+
+    @property
+    def varnames(self):
+        return list(self.slices.keys())
+
+    @property
+    def covariance(self):
+        """
+        Posterior covariance of the unbounded solution.
+        """
+        return linalg.cho_solve(
+            (self.normal_chol, True), num.eye(self.mean.size))
+
+    @property
+    def stdz(self):
+        """
+        Standard deviations of the parameters.
+        """
+        return num.sqrt(num.diag(self.covariance))
+
+    def point(self, x=None):
+        """
+        Map parameter vector to point dictionary.
+
+        Parameters
+        ----------
+        x : :class:`numpy.ndarray`
+            parameter vector, if None the MAP
+
+        Returns
+        -------
+        dict of variable name: :class:`numpy.ndarray`
+        """
+        if x is None:
+            x = self.map
+
+        return {varname: x[slc] for varname, slc in self.slices.items()}
+
+    def random(self, n_samples=1):
+        """
+        Draw samples from the Gaussian posterior, samples outside of the
+        bounds are clipped to the bounds.
+
+        Parameters
+        ----------
+        n_samples : int
+            number of samples
+
+        Returns
+        -------
+        :class:`numpy.ndarray` (n_samples, n_parameters)
+        """
+        z = num.random.normal(size=(self.mean.size, n_samples))
+        x = self.mean[:, num.newaxis] + linalg.solve_triangular(
+            self.normal_chol, z, lower=True, trans='T')
+        return num.clip(x.T, self.lower, self.upper)
+
+
+def get_problem_hypers(problem, point=None):
+    """
+    Get hyperparameter values of the problem. Values are taken from the
+    point, from fixed hyperparameters or their testvalues, in this order.
+
+    Parameters
+    ----------
+    problem : :class:`models.Problem`
+    point : dict
+        with hyperparameter values
+
+    Returns
+    -------
+    dict of hyperparameter name: float
+    """
+    point = point or {}
+    hypers = {}
+    for hp_name, hyperpar in \
+            problem.config.problem_config.hyperparameters.items():
+        if hp_name in point:
+            value = point[hp_name]
+        elif num.array_equal(hyperpar.lower, hyperpar.upper):
+            value = hyperpar.lower
+        else:
+            value = hyperpar.testvalue
+
+        hypers[hp_name] = float(num.atleast_1d(value)[0])
+
+    return hypers
+
+
+def solve_regularized_lsq(design, data, regularization=None):
+    """
+    Solve the regularized least-squares problem
+    min ||design * x - data|| ** 2 + ||regularization * x|| ** 2
+    with the normal equations.
+
+    Parameters
+    ----------
+    design : :class:`numpy.ndarray` (n_data, n_parameters)
+        whitened design matrix
+    data : :class:`numpy.ndarray` (n_data)
+        whitened data
+    regularization : :class:`numpy.ndarray` (n_reg, n_parameters)
+        whitened regularization operator, i.e. square root of the prior
+        precision
+
+    Returns
+    -------
+    mean : :class:`numpy.ndarray`
+        least-squares solution, i.e. the posterior mean
+    normal_chol : :class:`numpy.ndarray`
+        lower triangular Cholesky factor of the normal matrix
+    """
+    normal_matrix = design.T.dot(design)
+    if regularization is not None:
+        normal_matrix += regularization.T.dot(regularization)
+
+    try:
+        normal_chol = linalg.cholesky(normal_matrix, lower=True)
+    except linalg.LinAlgError:
+        raise ValueError(
+            'Normal matrix is singular! The problem is underdetermined,'
+            ' a regularization is needed.')
+
+    mean = linalg.cho_solve((normal_chol, True), design.T.dot(data))
+    return mean, normal_chol
+
+
+def solve_bounded_lsq(
+        normal_matrix, rhs, lower, upper, x0=None, max_iter=10000,
+        rtol=1e-8):
+    """
+    Solve the bounded least-squares problem
+    min 0.5 * x.T * normal_matrix * x - rhs.T * x, lower <= x <= upper
+    by accelerated projected gradient descent [Beck2009]_.
+    Non-negative least-squares for lower=0 and upper=inf.
+
+    Parameters
+    ----------
+    normal_matrix : :class:`numpy.ndarray` (n_parameters, n_parameters)
+        e.g. design.T * design + regularization.T * regularization
+    rhs : :class:`numpy.ndarray` (n_parameters)
+        e.g. design.T * data
+    lower : :class:`numpy.ndarray` (n_parameters)
+        lower bounds
+    upper : :class:`numpy.ndarray` (n_parameters)
+        upper bounds
+    x0 : :class:`numpy.ndarray` (n_parameters)
+        starting point, default: lower bounds
+    max_iter : int
+        maximum number of iterations
+    rtol : float
+        relative change of the solution to stop the iterations
+
+    Returns
+    -------
+    :class:`numpy.ndarray` bounded solution
+    """
+    step = 1. / num.linalg.eigvalsh(normal_matrix)[-1]
+
+    if x0 is None:
+        x0 = lower
+
+    x = num.clip(x0, lower, upper)
+    y = x.copy()
+    t = 1.
+    for i in range(max_iter):
+        x_new = num.clip(
+            y - step * (normal_matrix.dot(y) - rhs), lower, upper)
+
+        t_new = (1. + num.sqrt(1. + 4. * t ** 2)) / 2.
+        y = x_new + ((t - 1.) / t_new) * (x_new - x)
+
+        change = num.linalg.norm(x_new - x)
+        x, t = x_new, t_new
+        if change <= rtol * max(num.linalg.norm(x), 1.):
+            logger.debug('Converged after %i iterations' % (i + 1))
+            break
+    else:
+        logger.warning(
+            'Bounded least-squares did not converge in %i iterations!' %
+            max_iter)
+
+    return x
+
+
+def get_ramp_columns(composite):
+    """
+    Get the design matrix columns of the residual ramps of the
+    interferograms, in the data ordering of the composite.
+
+    Returns
+    -------
+    list of (ramp name, :class:`numpy.ndarray` (n_data, 2))
+    """
+    n_data = composite.Bij.ordering.size
+    columns = []
+    for i, data in enumerate(composite.datasets):
+        if isinstance(data, heart.DiffIFG):
+            slc = composite.Bij.ordering.vmap[i].slc
+            column = num.zeros((n_data, 2))
+            column[slc, 0] = composite._slocy[i].get_value()
+            column[slc, 1] = composite._slocx[i].get_value()
+            columns.append((data.name + '_ramp', column))
+
+    return columns
+
+
+def solve_static_ffi(problem, point=None, bounded=True):
+    """
+    Solve the static distributed slip problem of the geodetic data in
+    closed form, for the Laplacian smoothing prior (if selected as
+    regularization) and fixed hyperparameters.
+
+    Parameters
+    ----------
+    problem : :class:`models.DistributionOptimizer`
+    point : dict
+        with hyperparameter values, see :func:`get_problem_hypers`
+    bounded : bool
+        if True the MAP is constrained to the bounds of the priors
+
+    Returns
+    -------
+    :class:`LinearSolution`
+    """
+    if 'geodetic' not in problem.composites:
+        raise ValueError(
+            'Closed-form solution requires geodetic data!')
+
+    if 'seismic' in problem.composites:
+        logger.warning(
+            'Seismic data are not included in the linear solution!')
+
+    composite = problem.composites['geodetic']
+    pc = problem.config.problem_config
+    ref_idx = composite.config.gf_config.reference_model_idx
+
+    if len(composite.gfs.keys()) == 0:
+        composite.load_gfs(crust_inds=[ref_idx], make_shared=False)
+
+    hypers = get_problem_hypers(problem, point)
+    odws = composite.sodws.get_value()
+
+    columns = []
+    lowers = []
+    uppers = []
+    slices = OrderedDict()
+    n_params = 0
+    slip_varnames = pc.get_slip_variables()
+    for varname in slip_varnames:
+        key = composite.get_gflibrary_key(
+            crust_ind=ref_idx, wavename='static', component=varname)
+        gfmatrix = composite.gfs[key].get_matrix()
+        columns.append(gfmatrix.T * odws[:, num.newaxis])
+        lowers.append(pc.priors[varname].lower)
+        uppers.append(pc.priors[varname].upper)
+        slices[varname] = slice(n_params, n_params + gfmatrix.shape[0])
+        n_params += gfmatrix.shape[0]
+
+    n_slip = n_params
+    if composite.config.fit_plane:
+        for ramp_name, column in get_ramp_columns(composite):
+            columns.append(column)
+            lowers.append(num.ones(2) * default_bounds['ramp'][0])
+            uppers.append(num.ones(2) * default_bounds['ramp'][1])
+            slices[ramp_name] = slice(n_params, n_params + 2)
+            n_params += 2
+
+    design = num.hstack(columns)
+    data = composite.sdata.get_value() * odws
+
+    for i, dataset in enumerate(composite.datasets):
+        slc = composite.Bij.ordering.vmap[i].slc
+        weight = dataset.covariance.chol_inverse * num.exp(
+            -hypers['_'.join(('h', dataset.typ))])
+        design[slc] = weight.dot(design[slc])
+        data[slc] = weight.dot(data[slc])
+
+    regularization = None
+    if 'laplacian' in problem.composites:
+        smoothing_op = problem.composites['laplacian'].smoothing_op * \
+            num.exp(-hypers[hyper_name_laplacian])
+        regularization = num.zeros((n_slip, n_params))
+        for varname in slip_varnames:
+            slc = slices[varname]
+            regularization[slc, slc] = smoothing_op
+
+    logger.info(
+        'Solving linear least-squares for %i parameters and %i data ...' % (
+            n_params, data.size))
+    mean, normal_chol = solve_regularized_lsq(
+        design, data, regularization=regularization)
+
+    lower = num.hstack(lowers)
+    upper = num.hstack(uppers)
+
+    solution_map = None
+    if bounded:
+        logger.info('Solving bounded least-squares ...')
+        normal_matrix = normal_chol.dot(normal_chol.T)
+        solution_map = solve_bounded_lsq(
+            normal_matrix, normal_matrix.dot(mean), lower, upper,
+            x0=mean)
+
+    return LinearSolution(
+        slices=slices, mean=mean, normal_chol=normal_chol,
+        lower=lower, upper=upper, map=solution_map)
+
+
+def get_initial_population(problem, solution, n_points):
+    """
+    Get starting points of sampler chains, where the linear parameters are
+    drawn from the Gaussian posterior of the closed-form solution and the
+    other parameters (e.g. hyperparameters) from their priors.
+
+    Parameters
+    ----------
+    problem : :class:`models.Problem`
+    solution : :class:`LinearSolution`
+    n_points : int
+        number of points, i.e. chains
+
+    Returns
+    -------
+    list of point dictionaries
+    """
+    population = []
+    for sample in solution.random(n_points):
+        point = problem.get_random_point()
+        point.update(solution.point(sample))
+        population.append(point)
+
+    return population
@@ -2,6 +2,8 @@ import os
 import time
 import copy
 import shutil
+import hashlib
+from glob import glob
 
 from pymc3 import Uniform, Model, Deterministic, Potential
 
@@ -13,6 +15,7 @@ from pyrocko import gf, util, trace
 import numpy as num
 
 import theano.tensor as tt
+import theano
 from theano import config as tconfig
 from theano import shared
 from theano.printing import Print
@@ -22,7 +25,7 @@ from beat import theanof, heart, utility, backend
 from beat import sampler
 from beat import covariance as cov
 from beat import config as bconfig
-from beat.parallel import get_process_id
+from beat.parallel import get_process_id, set_worker_threads
 from beat.interseismic import geo_backslip_synthetics, seperate_point
 
 import logging
@@ -40,6 +43,7 @@ __all__ = [
     'GeometryOptimizer',
     'DistributionOptimizer',
     'sample',
+    'get_memory_budget',
     'load_model']
 
 
@@ -71,7 +75,7 @@ def multivariate_normal(datasets, weights, hyperparams, residuals):
 
     for l, data in enumerate(datasets):
         M = tt.cast(shared(
-            data.samples, name='nsamples', borrow=True), 'int16')
+            data.samples, name='nsamples', borrow=True), 'int32')
         hp_name = '_'.join(('h', data.typ))
 
         logpts = tt.set_subtensor(
@@ -113,7 +117,7 @@ def multivariate_normal_chol(datasets, weights, hyperparams, residuals):
 
     for l, data in enumerate(datasets):
         M = tt.cast(shared(
-            data.samples, name='nsamples', borrow=True), 'int16')
+            data.samples, name='nsamples', borrow=True), 'int32')
         hp_name = '_'.join(('h', data.typ))
         tmp = weights[l].dot(residuals[l])
 
@@ -192,6 +196,65 @@ class Composite(object):
         self.name = None
         self._like_name = None
         self.config = None
+        self._weight_times = {}
+
+    def update_weight(self, dataset, weight, cov_pv, rtol=0.):
+        """
+        Update the velocity model prediction covariance of a dataset and
+        the respective weight matrix (in place). The update is skipped if the
+        relative change of the covariance (Frobenius norm) is below rtol.
+
+        Parameters
+        ----------
+        dataset : :class:`heart.SeismicDataset` or
+            :class:`heart.GeodeticDataset`
+        weight : :class:`theano.shared`
+            weight matrix of the dataset
+        cov_pv : :class:`numpy.ndarray`
+            new model prediction covariance matrix, velocity model
+        rtol : float
+            relative change threshold below which the update is skipped
+
+        Returns
+        -------
+        updated : boolean
+            True if weight has been updated
+        saved_time : float
+            time [s] the last update of that weight took, if update skipped
+        """
+        change = dataset.covariance.pred_v_change(cov_pv)
+
+        if change < rtol:
+            logger.debug(
+                'Skipping weight update of %s, relative change %f' % (
+                    weight.name, change))
+            return False, self._weight_times.get(weight.name, 0.)
+
+        dataset.covariance.pred_v = cov_pv
+
+        t0 = time.time()
+        choli = dataset.covariance.chol_inverse
+        weight.set_value(choli)
+        dataset.covariance.update_slnf()
+        t1 = time.time()
+
+        logger.debug('Calculate weight time %f' % (t1 - t0))
+        self._weight_times[weight.name] = t1 - t0
+        return True, 0.
+
+    def get_dataset_hypers(self):
+        """
+        Get the hyperparameter name, the number of samples and the
+        log-normalisation factor of the covariance of each dataset, in the
+        order of the composite likelihood vector.
+
+        Returns
+        -------
+        list of tuples (str, int, :class:`theano.shared`)
+        """
+        return [
+            ('_'.join(('h', data.typ)), data.samples, data.covariance.slnf)
+            for data in self.datasets]
 
     def get_hyper_formula(self, hyperparams):
         """
@@ -347,6 +410,29 @@ class GeodeticComposite(Composite):
 
         return results
 
+    def get_synthetics_batch(self, points):
+        """
+        Get synthetics for several points in solution space, e.g. posterior
+        samples. Evaluates the forward model point by point, composites
+        override this with batched forward models.
+
+        Parameters
+        ----------
+        points : list
+            of :func:`pymc3.Point` dictionaries with model parameters
+
+        Returns
+        -------
+        list with :class:`numpy.ndarray` (n_points, n_samples) synthetics
+        for each target
+        """
+        synths = [[] for _ in range(self.n_t)]
+        for point in points:
+            for i, synth in enumerate(self.get_synthetics(point)):
+                synths[i].append(synth)
+
+        return [num.vstack(synth) for synth in synths]
+
     def remove_ramps(self, residuals):
         """
         Remove an orbital ramp from the residual displacements
@@ -542,7 +628,47 @@ class GeodeticGeometryComposite(GeodeticSourceComposite):
 
         return synths
 
-    def update_weights(self, point, n_jobs=1, plot=False):
+    def get_synthetics_batch(self, points):
+        """
+        Get synthetics for several points in solution space, e.g. posterior
+        samples, with a single request to the engine.
+
+        Parameters
+        ----------
+        points : list
+            of :func:`pymc3.Point` dictionaries with model parameters
+
+        Returns
+        -------
+        list with :class:`numpy.ndarray` (n_points, n_samples) synthetics
+        for each target
+        """
+        sources = []
+        for point in points:
+            self.point2sources(point)
+            sources.extend(copy.deepcopy(self.sources))
+
+        displacements = heart.geo_synthetics(
+            engine=self.engine,
+            targets=self.targets,
+            sources=sources,
+            outmode='arrays')
+
+        npoints = len(points)
+        ns = len(self.sources)
+        nt = self.n_t
+
+        synths = []
+        for j, data in enumerate(self.datasets):
+            disp = num.array(
+                [displacements[j + k * nt] for k in range(npoints * ns)])
+            disp = disp.reshape(
+                (npoints, ns, data.samples, 3)).sum(axis=1)
+            synths.append((disp * data.los_vector).sum(axis=-1))
+
+        return synths
+
+    def update_weights(self, point, n_jobs=1, plot=False, rtol=0.):
         """
         Updates weighting matrixes (in place) with respect to the point in the
         solution space.
@@ -551,11 +677,20 @@ class GeodeticGeometryComposite(GeodeticSourceComposite):
         ----------
         point : dict
             with numpy array-like items and variable name keys
+        rtol : float
+            relative change (Frobenius norm) of the prediction covariance
+            below which the weight update of a dataset is skipped
+
+        Returns
+        -------
+        int, number of updated weight matrixes
         """
         gc = self.config
 
         self.point2sources(point)
 
+        n_updated = 0
+        saved_time = 0.
         for i, data in enumerate(self.datasets):
             crust_targets = heart.init_geodetic_targets(
                 datasets=[data],
@@ -576,10 +711,15 @@ class GeodeticGeometryComposite(GeodeticSourceComposite):
 
             cov_pv = utility.ensure_cov_psd(cov_pv)
 
-            data.covariance.pred_v = cov_pv
-            choli = data.covariance.chol_inverse
-            self.weights[i].set_value(choli)
-            data.covariance.update_slnf()
+            updated, t_saved = self.update_weight(
+                data, self.weights[i], cov_pv, rtol=rtol)
+            n_updated += int(updated)
+            saved_time += t_saved
+
+        logger.info(
+            'Updated %i of %i geodetic weights, time saved: %f [s]' % (
+                n_updated, self.n_t, saved_time))
+        return n_updated
 
 
 class GeodeticInterseismicComposite(GeodeticSourceComposite):
@@ -640,7 +780,7 @@ class GeodeticInterseismicComposite(GeodeticSourceComposite):
 
         return synths
 
-    def update_weights(self, point, n_jobs=1, plot=False):
+    def update_weights(self, point, n_jobs=1, plot=False, rtol=0.):
         logger.warning('Not implemented yet!')
         raise NotImplementedError('Not implemented yet!')
 
@@ -844,6 +984,41 @@ class SeismicComposite(Composite):
 
         return results
 
+    def get_synthetics_batch(self, points):
+        """
+        Get synthetics for several points in solution space, e.g. posterior
+        samples. Evaluates the forward model point by point, composites
+        override this with batched forward models.
+
+        Parameters
+        ----------
+        points : list
+            of :func:`pymc3.Point` dictionaries with model parameters
+
+        Returns
+        -------
+        synths : list
+            with :class:`numpy.ndarray` (n_points, n_targets, n_samples)
+            synthetics for each wavemap
+        tmins : list
+            with :class:`numpy.ndarray` (n_points, n_targets) start times of
+            the synthetics for each wavemap
+        """
+        synths = [[] for _ in self.wavemaps]
+        tmins = [[] for _ in self.wavemaps]
+        for point in points:
+            synth_traces, _ = self.get_synthetics(
+                point, outmode='stacked_traces')
+
+            i = 0
+            for w, wmap in enumerate(self.wavemaps):
+                traces = synth_traces[i:i + wmap.n_t]
+                i += wmap.n_t
+                synths[w].append(num.vstack([tr.ydata for tr in traces]))
+                tmins[w].append(num.array([tr.tmin for tr in traces]))
+
+        return [num.array(s) for s in synths], [num.array(t) for t in tmins]
+
     def update_llks(self, point):
         """
         Update posterior likelihoods of the composite with respect to one point
@@ -1030,7 +1205,57 @@ class SeismicGeometryComposite(SeismicComposite):
 
         return synths, obs
 
-    def update_weights(self, point, n_jobs=1, plot=False):
+    def get_synthetics_batch(self, points, nprocs=1):
+        """
+        Get synthetics for several points in solution space, e.g. posterior
+        samples, with one request to the engine for each wavemap.
+        If the GF traces are cut prior to stacking the points are evaluated
+        one by one.
+
+        Parameters
+        ----------
+        points : list
+            of :func:`pymc3.Point` dictionaries with model parameters
+        nprocs : int
+            number of processors the engine uses for the requests
+
+        Returns
+        -------
+        synths : list
+            with :class:`numpy.ndarray` (n_points, n_targets, n_samples)
+            synthetics for each wavemap
+        tmins : list
+            with :class:`numpy.ndarray` (n_points, n_targets) start times of
+            the synthetics for each wavemap
+        """
+        if self.config.pre_stack_cut:
+            return super(SeismicGeometryComposite, self).get_synthetics_batch(
+                points)
+
+        sources_list = []
+        for point in points:
+            self.point2sources(point)
+            sources_list.append(copy.deepcopy(self.sources))
+
+        synths = []
+        tmins = []
+        for wmap in self.wavemaps:
+            wc = wmap.config
+
+            synthetics, wtmins = heart.seis_synthetics_batch(
+                engine=self.engine,
+                sources_list=sources_list,
+                targets=wmap.targets,
+                arrival_taper=wc.arrival_taper,
+                wavename=wmap.name,
+                filterer=wc.filterer,
+                nprocs=nprocs)
+            synths.append(synthetics)
+            tmins.append(wtmins)
+
+        return synths, tmins
+
+    def update_weights(self, point, n_jobs=1, plot=False, rtol=0.):
         """
         Updates weighting matrixes (in place) with respect to the point in the
         solution space.
@@ -1039,11 +1264,20 @@ class SeismicGeometryComposite(SeismicComposite):
         ----------
         point : dict
             with numpy array-like items and variable name keys
+        rtol : float
+            relative change (Frobenius norm) of the prediction covariance
+            below which the weight update of a dataset is skipped
+
+        Returns
+        -------
+        int, number of updated weight matrixes
         """
         sc = self.config
 
         self.point2sources(point)
 
+        n_updated = 0
+        saved_time = 0.
         for wmap in self.wavemaps:
             wc = wmap.config
 
@@ -1063,7 +1297,8 @@ class SeismicGeometryComposite(SeismicComposite):
                         channels=channel,
                         sample_rate=sc.gf_config.sample_rate,
                         crust_inds=range(*sc.gf_config.n_variations),
-                        reference_location=sc.gf_config.reference_location)
+                        reference_location=sc.gf_config.reference_location,
+                        station_stores=sc.gf_config.station_stores)
 
                     cov_pv = cov.seismic_cov_velocity_models(
                         engine=self.engine,
@@ -1077,14 +1312,15 @@ class SeismicGeometryComposite(SeismicComposite):
 
                     self.engine.close_cashed_stores()
 
-                    dataset.covariance.pred_v = cov_pv
+                    updated, t_saved = self.update_weight(
+                        dataset, weight, cov_pv, rtol=rtol)
+                    n_updated += int(updated)
+                    saved_time += t_saved
 
-                    t0 = time.time()
-                    choli = dataset.covariance.chol_inverse
-                    t1 = time.time()
-                    logger.debug('Calculate weight time %f' % (t1 - t0))
-                    weight.set_value(choli)
-                    dataset.covariance.update_slnf()
+        logger.info(
+            'Updated %i of %i seismic weights, time saved: %f [s]' % (
+                n_updated, self.n_t, saved_time))
+        return n_updated
 
 
 class GeodeticDistributerComposite(GeodeticComposite):
@@ -1098,7 +1334,6 @@ class GeodeticDistributerComposite(GeodeticComposite):
         super(GeodeticDistributerComposite, self).__init__(
             gc, project_dir, event, hypers=hypers)
 
-        self.gfs = {}
         self.gf_names = {}
 
         self.slip_varnames = bconfig.static_dist_vars
@@ -1106,29 +1341,35 @@ class GeodeticDistributerComposite(GeodeticComposite):
         self.gfpath = os.path.join(
             project_dir, self._mode, bconfig.linear_gf_dir_name)
 
+        self.gfs = ffi.GFLibraryManager(
+            directory=self.gfpath, max_size=gc.gf_config.cache_size)
+
     def get_gflibrary_key(self, crust_ind, wavename, component):
         return '%i_%s_%s' % (crust_ind, wavename, component)
 
     def load_gfs(self, crust_inds=None, make_shared=True):
         """
         Load Greens Function matrixes for each variable to be inverted for.
-        Updates gfs and gf_names attributes.
+        Updates gfs and gf_names attributes. Only the libraries of the
+        reference velocity model are loaded, the libraries of the variants
+        are memory-mapped on demand, see :class:`ffi.GFLibraryManager`.
 
         Parameters
         ----------
         crust_inds : list
             of int to indexes of Green's Functions
         make_shared : bool
-            if True transforms gfs to :class:`theano.shared` variables
+            if True transforms gfs of the reference velocity model to
+            :class:`theano.shared` variables
         """
+        if crust_inds is None:
+            crust_inds = list(range(*self.config.gf_config.n_variations))
+
         if not isinstance(crust_inds, list):
             raise TypeError('crust_inds need to be a list!')
 
-        if crust_inds is None:
-            crust_inds = range(*self.config.gf_config.n_variations)
-
+        ref_idx = self.config.gf_config.reference_model_idx
         for crust_ind in crust_inds:
-            gfs = {}
             for var in self.slip_varnames:
                 gflib_name = ffi.get_gf_prefix(
                     datatype=self.name, component=var,
@@ -1136,19 +1377,16 @@ class GeodeticDistributerComposite(GeodeticComposite):
                 gfpath = os.path.join(
                     self.gfpath, gflib_name)
 
-                gfs = ffi.load_gf_library(
-                    directory=self.gfpath, filename=gflib_name)
-
-                if make_shared:
-                    gfs.init_optimization()
-
                 key = self.get_gflibrary_key(
                     crust_ind=crust_ind,
                     wavename='static',
                     component=var)
 
                 self.gf_names[key] = gfpath
-                self.gfs[key] = gfs
+                self.gfs.register(
+                    key, gflib_name,
+                    resident=crust_ind == ref_idx,
+                    make_shared=make_shared)
 
     def load_fault_geometry(self):
         """
@@ -1203,7 +1441,7 @@ class GeodeticDistributerComposite(GeodeticComposite):
 
         return llk.sum()
 
-    def get_synthetics(self, point, outmode='data'):
+    def get_synthetics(self, point, outmode='data', crust_ind=None):
         """
         Get synthetics for given point in solution space.
 
@@ -1212,6 +1450,8 @@ class GeodeticDistributerComposite(GeodeticComposite):
         point : :func:`pymc3.Point`
             Dictionary with model parameters
         kwargs especially to change output of the forward model
+        crust_ind : int
+            index of the velocity model, default: reference model
 
         Returns
         -------
@@ -1224,6 +1464,9 @@ class GeodeticDistributerComposite(GeodeticComposite):
                 crust_inds=[ref_idx],
                 make_shared=False)
 
+        if crust_ind is None:
+            crust_ind = ref_idx
+
         tpoint = copy.deepcopy(point)
 
         hps = self.config.get_hypernames()
@@ -1239,16 +1482,110 @@ class GeodeticDistributerComposite(GeodeticComposite):
         mu = num.zeros((self.Bij.ordering.size))
         for var, rv in tpoint.iteritems():
             key = self.get_gflibrary_key(
-                crust_ind=ref_idx,
+                crust_ind=crust_ind,
                 wavename='static',
                 component=var)
-            mu += self.gfs[key].stack_all(slips=rv)
+            gflibrary = self.gfs[key]
+            gflibrary.set_stack_mode('numpy')
+            mu += gflibrary.stack_all(slips=rv)
 
         return self.Bij.rmap(mu)
 
-    def update_weights(self, point, n_jobs=1, plot=False):
-        logger.warning('Not implemented yet!')
-        raise NotImplementedError('Not implemented yet!')
+    def get_synthetics_batch(self, points, crust_ind=None):
+        """
+        Get synthetics for several points in solution space, e.g. posterior
+        samples, as a matrix product of the slips with the Greens Functions.
+
+        Parameters
+        ----------
+        points : list
+            of :func:`pymc3.Point` dictionaries with model parameters
+        crust_ind : int
+            index of the velocity model, default: reference model
+
+        Returns
+        -------
+        list with :class:`numpy.ndarray` (n_points, n_samples) synthetics
+        for each target
+        """
+        ref_idx = self.config.gf_config.reference_model_idx
+        if len(self.gfs.keys()) == 0:
+            self.load_gfs(
+                crust_inds=[ref_idx],
+                make_shared=False)
+
+        if crust_ind is None:
+            crust_ind = ref_idx
+
+        mu = num.zeros((len(points), self.Bij.ordering.size))
+        for var in self.slip_varnames:
+            if var not in points[0]:
+                continue
+
+            key = self.get_gflibrary_key(
+                crust_ind=crust_ind,
+                wavename='static',
+                component=var)
+            slips = num.vstack([point[var] for point in points])
+            mu += slips.dot(self.gfs[key].get_matrix())
+
+        return [mu[:, vmap.slc] for vmap in self.Bij.ordering.vmap]
+
+    def update_weights(self, point, n_jobs=1, plot=False, rtol=0.):
+        """
+        Updates weighting matrixes (in place) with respect to the point in the
+        solution space. The model prediction covariance due to the velocity
+        model variations is accumulated over the variants, streaming over
+        their GF libraries.
+
+        Parameters
+        ----------
+        point : dict
+            with numpy array-like items and variable name keys
+        rtol : float
+            relative change (Frobenius norm) of the prediction covariance
+            below which the weight update of a dataset is skipped
+
+        Returns
+        -------
+        int, number of updated weight matrixes
+        """
+        crust_inds = list(range(*self.config.gf_config.n_variations))
+        n_variants = len(crust_inds)
+        if n_variants < 2:
+            logger.info(
+                'Less than two velocity model variants, no weight update!')
+            return 0
+
+        self.load_gfs(crust_inds=crust_inds, make_shared=False)
+
+        sums = [num.zeros(data.samples) for data in self.datasets]
+        outer_sums = [
+            num.zeros((data.samples, data.samples)) for data in self.datasets]
+        for crust_ind in crust_inds:
+            synths = self.get_synthetics(point, crust_ind=crust_ind)
+            for i, data in enumerate(self.datasets):
+                synth = synths[i] * data.odw
+                sums[i] += synth
+                outer_sums[i] += num.outer(synth, synth)
+
+        n_updated = 0
+        saved_time = 0.
+        for i, data in enumerate(self.datasets):
+            mean = sums[i] / n_variants
+            cov_pv = (outer_sums[i] - n_variants * num.outer(mean, mean)) / \
+                (n_variants - 1)
+            cov_pv = utility.ensure_cov_psd(cov_pv)
+
+            updated, t_saved = self.update_weight(
+                data, self.weights[i], cov_pv, rtol=rtol)
+            n_updated += int(updated)
+            saved_time += t_saved
+
+        logger.info(
+            'Updated %i of %i geodetic weights, time saved: %f [s]' % (
+                n_updated, self.n_t, saved_time))
+        return n_updated
 
 
 class LaplacianDistributerComposite():
@@ -1392,7 +1729,6 @@ class SeismicDistributerComposite(SeismicComposite):
         super(SeismicDistributerComposite, self).__init__(
             sc, event, project_dir, hypers=hypers)
 
-        self.gfs = {}
         self.gf_names = {}
         self.choppers = {}
         self.sweep_implementation = 'c'
@@ -1402,6 +1738,9 @@ class SeismicDistributerComposite(SeismicComposite):
         self.gfpath = os.path.join(
             project_dir, self._mode, bconfig.linear_gf_dir_name)
 
+        self.gfs = ffi.GFLibraryManager(
+            directory=self.gfpath, max_size=sc.gf_config.cache_size)
+
         self.config = sc
         sgfc = sc.gf_config
 
@@ -1451,24 +1790,27 @@ class SeismicDistributerComposite(SeismicComposite):
     def load_gfs(self, crust_inds=None, make_shared=True):
         """
         Load Greens Function matrixes for each variable to be inverted for.
-        Updates gfs and gf_names attributes.
+        Updates gfs and gf_names attributes. Only the libraries of the
+        reference velocity model are loaded, the libraries of the variants
+        are memory-mapped on demand, see :class:`ffi.GFLibraryManager`.
 
         Parameters
         ----------
         crust_inds : list
             of int to indexes of Green's Functions
         make_shared : bool
-            if True transforms gfs to :class:`theano.shared` variables
+            if True transforms gfs of the reference velocity model to
+            :class:`theano.shared` variables
         """
+        if crust_inds is None:
+            crust_inds = list(range(*self.config.gf_config.n_variations))
+
         if not isinstance(crust_inds, list):
             raise TypeError('crust_inds need to be a list!')
 
-        if crust_inds is None:
-            crust_inds = range(*self.config.gf_config.n_variations)
-
+        ref_idx = self.config.gf_config.reference_model_idx
         for wmap in self.wavemaps:
             for crust_ind in crust_inds:
-                gfs = {}
                 for var in self.slip_varnames:
                     gflib_name = ffi.get_gf_prefix(
                         datatype=self.name, component=var,
@@ -1476,19 +1818,16 @@ class SeismicDistributerComposite(SeismicComposite):
                     gfpath = os.path.join(
                         self.gfpath, gflib_name)
 
-                    gfs = ffi.load_gf_library(
-                        directory=self.gfpath, filename=gflib_name)
-
-                    if make_shared:
-                        gfs.init_optimization()
-
                     key = self.get_gflibrary_key(
                         crust_ind=crust_ind,
                         wavename=wmap.config.name,
                         component=var)
 
                     self.gf_names[key] = gfpath
-                    self.gfs[key] = gfs
+                    self.gfs.register(
+                        key, gflib_name,
+                        resident=crust_ind == ref_idx,
+                        make_shared=make_shared)
 
     def get_formula(self, input_rvs, fixed_rvs, hyperparams):
 
@@ -1646,7 +1985,7 @@ class SeismicDistributerComposite(SeismicComposite):
 
         return synth_traces, obs_traces
 
-    def update_weights(self, point, n_jobs=1, plot=False):
+    def update_weights(self, point, n_jobs=1, plot=False, rtol=0.):
         logger.warning('Not implemented yet!')
         raise NotImplementedError('Not implemented yet!')
 
@@ -1678,6 +2017,7 @@ class Problem(object):
     def __init__(self, config, hypers=False):
 
         self.model = None
+        self.trace_layout = None
 
         self._like_name = 'like'
 
@@ -1721,6 +2061,10 @@ class Problem(object):
             raise Exception(
                 'Model has to be built before initialising the sampler.')
 
+        function_cache = None
+        if sc.parameters.cache_compiled:
+            function_cache = self.get_function_cache()
+
         with self.model:
             if sc.name == 'Metropolis':
                 logger.info(
@@ -1737,13 +2081,21 @@ class Problem(object):
                         n_chains=sc.parameters.n_chains,
                         likelihood_name=self._like_name,
                         tune_interval=sc.parameters.tune_interval,
-                        proposal_name=sc.parameters.proposal_dist)
+                        proposal_name=sc.parameters.proposal_dist,
+                        function_cache=function_cache)
                 else:
                     step = sampler.SMC(
                         n_chains=sc.parameters.n_jobs,
                         tune_interval=sc.parameters.tune_interval,
                         likelihood_name=self._like_name,
-                        proposal_name=sc.parameters.proposal_dist)
+                        proposal_name=sc.parameters.proposal_dist,
+                        adaptive=sc.parameters.adaptive,
+                        delayed_acceptance=sc.parameters.delayed_acceptance,
+                        blocked_updates=sc.parameters.blocked_updates,
+                        hyper_datasets=self.get_hyper_datasets(),
+                        concurrent_composites=(
+                            sc.parameters.concurrent_composites),
+                        function_cache=function_cache)
                 t2 = time.time()
                 logger.info('Compilation time: %f' % (t2 - t1))
 
@@ -1759,11 +2111,49 @@ class Problem(object):
                     n_chains=sc.parameters.n_chains,
                     tune_interval=sc.parameters.tune_interval,
                     coef_variation=sc.parameters.coef_variation,
+                    target_ess=sc.parameters.target_ess,
+                    resampling_method=sc.parameters.resampling_method,
+                    resampling_threshold=sc.parameters.resampling_threshold,
                     proposal_dist=sc.parameters.proposal_dist,
+                    adaptive=sc.parameters.adaptive,
+                    delayed_acceptance=sc.parameters.delayed_acceptance,
+                    blocked_updates=sc.parameters.blocked_updates,
+                    hyper_datasets=self.get_hyper_datasets(),
+                    concurrent_composites=(
+                        sc.parameters.concurrent_composites),
+                    function_cache=function_cache,
                     likelihood_name=self._like_name)
                 t2 = time.time()
                 logger.info('Compilation time: %f' % (t2 - t1))
 
+            elif sc.name == 'PT':
+                logger.info(
+                    '... Initiate Parallel Tempering ... \n'
+                    ' n_chains=%i, swap_interval=%i, n_jobs=%i \n' % (
+                        sc.parameters.n_chains, sc.parameters.swap_interval,
+                        sc.parameters.n_jobs))
+
+                t1 = time.time()
+                step = sampler.Metropolis(
+                    n_chains=sc.parameters.n_chains,
+                    tune_interval=sc.parameters.tune_interval,
+                    likelihood_name=self._like_name,
+                    proposal_name=sc.parameters.proposal_dist,
+                    check_bound=sc.parameters.check_bnd,
+                    adaptive=sc.parameters.adaptive,
+                    delayed_acceptance=sc.parameters.delayed_acceptance,
+                    blocked_updates=sc.parameters.blocked_updates,
+                    hyper_datasets=self.get_hyper_datasets(),
+                    concurrent_composites=(
+                        sc.parameters.concurrent_composites),
+                    function_cache=function_cache)
+                t2 = time.time()
+                logger.info('Compilation time: %f' % (t2 - t1))
+
+        if function_cache is not None:
+            function_cache.layout = backend.get_trace_layout(self.model)
+            function_cache.dump()
+
         return step
 
     def built_model(self):
@@ -1894,6 +2284,85 @@ class Problem(object):
 
         return rvs, fixed_params
 
+    def get_input_files(self):
+        """
+        Get paths to the input files of the problem, i.e. the data, the
+        Greens Function libraries and the traces of the Greens Function
+        stores.
+
+        Returns
+        -------
+        list of str
+        """
+        project_dir = self.config.project_dir
+
+        paths = [
+            os.path.join(project_dir, bconfig.geodetic_data_name),
+            os.path.join(project_dir, bconfig.seismic_data_name)]
+
+        for datatype, composite in self.composites.items():
+            gfpath = getattr(composite, 'gfpath', None)
+            if gfpath is not None:
+                paths.extend(glob(os.path.join(gfpath, '*')))
+
+            data_config = getattr(self.config, datatype + '_config', None)
+            if data_config is not None:
+                store_superdir = getattr(
+                    data_config.gf_config, 'store_superdir', None)
+                if store_superdir is not None:
+                    paths.extend(
+                        glob(os.path.join(store_superdir, '*', 'traces')))
+
+        return sorted(path for path in paths if os.path.exists(path))
+
+    def get_cache_key(self):
+        """
+        Get key of the model inputs to validate cached compiled functions,
+        i.e. hash of the configuration and the modification times of the
+        input files.
+
+        Returns
+        -------
+        str
+        """
+        sha1 = hashlib.sha1()
+        sha1.update(self.config.dump().encode('utf-8'))
+        sha1.update(self.outfolder.encode('utf-8'))
+        sha1.update(theano.__version__.encode('utf-8'))
+        for path in self.get_input_files():
+            sha1.update(
+                ('%s %f' % (path, os.path.getmtime(path))).encode('utf-8'))
+
+        return sha1.hexdigest()
+
+    def get_function_cache(self):
+        """
+        Get cache of the compiled functions in the result directory.
+
+        Returns
+        -------
+        :class:`sampler.FunctionCache`
+        """
+        return sampler.FunctionCache(
+            path=os.path.join(
+                self.outfolder, bconfig.compiled_functions_name),
+            key=self.get_cache_key())
+
+    def get_hyper_datasets(self):
+        """
+        Get the hyperparameters, number of samples and covariance
+        log-normalisation factors of the datasets of each composite.
+
+        Returns
+        -------
+        dict of composite likelihood name: list of tuples, see
+        :meth:`Composite.get_dataset_hypers`
+        """
+        return dict(
+            (composite._like_name, composite.get_dataset_hypers())
+            for composite in self.composites.values()
+            if isinstance(composite, Composite))
+
     def get_hyperparams(self):
         """
         Evaluate problem setup and return hyperparameter dictionary.
@@ -1958,7 +2427,7 @@ class Problem(object):
         for composite in self.composites.values():
             self.composites[composite.name].point2sources(point)
 
-    def update_weights(self, point, n_jobs=1, plot=False):
+    def update_weights(self, point, n_jobs=1, plot=False, rtol=None):
         """
         Calculate and update model prediction uncertainty covariances of
         composites due to uncertainty in the velocity model with respect to
@@ -1973,9 +2442,30 @@ class Problem(object):
             Number of processors to use for calculation of seismic covariances
         plot : boolean
             Flag for opening the seismic waveforms in the snuffler
+        rtol : float
+            relative change of the covariances below which weight updates
+            are skipped, if None taken from the sampler config
+
+        Returns
+        -------
+        int, number of updated weight matrixes
         """
+        if rtol is None:
+            rtol = getattr(
+                self.config.sampler_config.parameters,
+                'covariance_update_rtol', 0.)
+
+        t0 = time.time()
+        n_updated = 0
         for composite in self.composites.itervalues():
-            composite.update_weights(point, n_jobs=n_jobs)
+            n_updated += composite.update_weights(
+                point, n_jobs=n_jobs, rtol=rtol)
+
+        t1 = time.time()
+        logger.info(
+            'Covariance update took %f [s], updated %i weights' % (
+                t1 - t0, n_updated))
+        return n_updated
 
     def get_synthetics(self, point, **kwargs):
         """
@@ -2001,6 +2491,30 @@ class Problem(object):
 
         return d
 
+    def get_synthetics_batch(self, points):
+        """
+        Get synthetics for several points in solution space, e.g. posterior
+        samples, with the batched forward models of the composites.
+
+        Parameters
+        ----------
+        points : list
+            of :func:`pymc3.Point` dictionaries with model parameters
+
+        Returns
+        -------
+        Dictionary with keys according to composites containing the
+        synthetics as arrays with the points along the first axis.
+        """
+
+        d = dict()
+
+        for composite in self.composites.itervalues():
+            if hasattr(composite, 'get_synthetics_batch'):
+                d[composite.name] = composite.get_synthetics_batch(points)
+
+        return d
+
 
 class SourceOptimizer(Problem):
     """
@@ -2164,7 +2678,7 @@ problem_catalog = {
     problem_modes[2]: InterseismicOptimizer}
 
 
-def sample(step, problem):
+def sample(step, problem, start=None):
     """
     Sample solution space with the previously initalised algorithm.
 
@@ -2174,11 +2688,17 @@ def sample(step, problem):
     step : :class:`SMC` or :class:`pymc3.metropolis.Metropolis`
         from problem.init_sampler()
     problem : :class:`Problem` with characteristics of problem to solve
+    start : list
+        of point dictionaries, starting points of the chains (length of
+        n_chains), e.g. from :func:`linear_solver.get_initial_population`,
+        defaults to random draws from the priors
     """
 
     sc = problem.config.sampler_config
     pa = sc.parameters
 
+    set_worker_threads(pa.threads_per_worker, pin=pa.pin_workers)
+
     if hasattr(pa, 'update_covariances'):
         if pa.update_covariances:
             update = problem
@@ -2199,21 +2719,47 @@ def sample(step, problem):
             thin=pa.thin,
             model=problem.model,
             n_jobs=pa.n_jobs,
-            rm_flag=pa.rm_flag)
+            rm_flag=pa.rm_flag,
+            start=start)
 
     elif sc.name == 'SMC':
         logger.info('... Starting ATMIP ...\n')
 
+        if start is not None:
+            logger.warning(
+                'Initial population is not drawn from the priors, the'
+                ' evidence estimate is not valid!')
+
         sampler.ATMIP_sample(
             pa.n_steps,
             step=step,
+            start=start,
             progressbar=sc.progressbar,
             model=problem.model,
             n_jobs=pa.n_jobs,
             stage=pa.stage,
             update=update,
             homepath=problem.outfolder,
-            rm_flag=pa.rm_flag)
+            rm_flag=pa.rm_flag,
+            adapt_n_steps=pa.adapt_n_steps)
+
+    elif sc.name == 'PT':
+        logger.info('... Starting Parallel Tempering ...\n')
+
+        sampler.PT_sample(
+            step=step,
+            n_chains=pa.n_chains,
+            n_samples=pa.n_steps,
+            swap_interval=pa.swap_interval,
+            n_chains_posterior=pa.n_chains_posterior,
+            tmax=pa.tmax,
+            adapt=pa.adapt_temperatures,
+            homepath=problem.outfolder,
+            progressbar=sc.progressbar,
+            model=problem.model,
+            n_jobs=pa.n_jobs,
+            rm_flag=pa.rm_flag,
+            start=start)
 
 
 def estimate_hypers(step, problem):
@@ -2280,7 +2826,92 @@ def estimate_hypers(step, problem):
     bconfig.dump(problem.config, filename=conf_out)
 
 
-def load_model(project_dir, mode, hypers=False, nobuild=False):
+# empirical memory factors for the estimation of the peak memory
+# interpreter, imported modules and compiled theano functions per worker [byte]
+worker_base_memory = 300. * 1024 ** 2
+# intermediate arrays of the compiled forward model relative to the data size
+forward_model_factor = 10.
+# data covariance, its inverse cholesky and the model prediction covariances
+n_covariance_matrixes = 4
+# python overhead per variable and sample in the trace buffers [byte]
+trace_buffer_overhead = 100.
+
+
+def get_memory_budget(problem):
+    """
+    Estimate the peak memory of sampling the problem. GF libraries, data,
+    covariance weight matrixes and the chain populations are allocated
+    before the workers are forked, the compiled forward model and the trace
+    buffers are allocated by each worker. GF stores are memory mapped and
+    are not counted.
+
+    Parameters
+    ----------
+    problem : :class:`Problem`
+
+    Returns
+    -------
+    :class:`parallel.MemoryBudget`
+    """
+    from beat.parallel import MemoryBudget
+
+    pc = problem.config.problem_config
+    sc = problem.config.sampler_config
+
+    budget = MemoryBudget()
+
+    ndata = 0
+    for datatype, composite in problem.composites.items():
+        if datatype == 'laplacian':
+            budget.add_shared(
+                'smoothing operator', composite.smoothing_op.nbytes)
+            continue
+
+        if datatype == 'seismic':
+            datasets = [
+                dataset for wmap in composite.wavemaps
+                for dataset in wmap.datasets]
+        else:
+            datasets = composite.datasets
+
+        nsamples = [dataset.samples for dataset in datasets]
+        ndata += sum(nsamples)
+
+        budget.add_shared(
+            '%s covariances (%i datasets)' % (datatype, len(datasets)),
+            n_covariance_matrixes * 8. * sum(n ** 2 for n in nsamples))
+
+        if hasattr(composite, 'gfpath'):
+            ref_idx = composite.config.gf_config.reference_model_idx
+            gf_files = glob(os.path.join(
+                composite.gfpath, '*_%i.*.npy' % ref_idx))
+            budget.add_shared(
+                '%s GF libraries' % datatype,
+                sum(os.path.getsize(fn) for fn in gf_files))
+
+    budget.add_per_worker('interpreter and compiled model', worker_base_memory)
+    budget.add_per_worker(
+        'forward model arrays', forward_model_factor * 8. * ndata)
+
+    params = list(pc.priors.values()) + list(pc.hyperparameters.values())
+    npoint = sum(num.size(param.testvalue) for param in params)
+    nvars = len(params) + 1
+
+    n_chains = getattr(sc.parameters, 'n_chains', 1)
+    budget.add_shared(
+        'chain population (%i chains)' % n_chains,
+        n_chains * 8. * npoint)
+
+    buffer_size = min(getattr(sc.parameters, 'n_steps', 1), 5000)
+    budget.add_per_worker(
+        'trace buffer (%i samples)' % buffer_size,
+        buffer_size * (8. * npoint + trace_buffer_overhead * nvars))
+
+    return budget
+
+
+def load_model(
+        project_dir, mode, hypers=False, nobuild=False, trace_only=False):
     """
     Load config from project directory and return BEAT problem including model.
 
@@ -2292,8 +2923,11 @@ def load_model(project_dir, mode, hypers=False, nobuild=False):
         problem name to be loaded
     hypers : boolean
         flag to return hyper parameter estimation model instead of main model.
-    built : boolean
+    nobuild : boolean
         flag to do not build models
+    trace_only : boolean
+        flag to do not build models if the trace layout of the model is
+        cached, e.g. for plotting of the traces
 
     Returns
     -------
@@ -2315,6 +2949,12 @@ def load_model(project_dir, mode, hypers=False, nobuild=False):
         logger.error('Modeling problem %s not supported' % pc.mode)
         raise ValueError('Model not supported')
 
+    if trace_only and not nobuild:
+        problem.trace_layout = problem.get_function_cache().layout
+        if problem.trace_layout is not None:
+            logger.info('Found cached trace layout, not building model!')
+            nobuild = True
+
     if not nobuild:
         if hypers:
             problem.built_hyper_model()
@@ -2346,7 +2986,8 @@ class Stage(object):
 
         self.number = stage_number
 
-    def load_results(self, model=None, stage_number=None, load='trace'):
+    def load_results(
+            self, model=None, stage_number=None, load='trace', layout=None):
         """
         Load stage results from sampling.
 
@@ -2357,6 +2998,9 @@ class Stage(object):
             Number of stage to load
         load : str
             what to load and return 'full', 'trace', 'params'
+        layout : :class:`collections.OrderedDict`
+            trace layout of the model, needed if the model is None,
+            see :func:`backend.get_trace_layout`
         """
         if stage_number is None:
             stage_number = self.number
@@ -2378,11 +3022,15 @@ class Stage(object):
         else:
             to_load = [load]
 
-        with model:
-            if 'trace' in to_load:
+        if 'trace' in to_load:
+            if model is None and layout is not None:
                 self.mtrace = self.handler.load_multitrace(
-                    stage_number, model=model)
+                    stage_number, layout=layout)
+            else:
+                with model:
+                    self.mtrace = self.handler.load_multitrace(
+                        stage_number, model=model)
 
-            if 'params' in to_load:
-                self.step, self.updates = self.handler.load_sampler_params(
-                    stage_number)
+        if 'params' in to_load:
+            self.step, self.updates = self.handler.load_sampler_params(
+                stage_number)
@@ -1,11 +1,15 @@
 import multiprocessing
+import time
+from multiprocessing.pool import ThreadPool
+import os
+from glob import glob
 from logging import getLogger
 import traceback
 from functools import wraps
 import signal
 from itertools import count
 import numpy as num
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
 
 logger = getLogger('parallel')
@@ -14,6 +18,19 @@ logger = getLogger('parallel')
 _shared_memory = OrderedDict()
 _tobememshared = set([])
 
+# thread pools of the current process
+_thread_pools = {}
+
+# threads of BLAS/ OpenMP and pinning of each worker to cores,
+# see set_worker_threads
+_threads_per_worker = None
+_pin_workers = False
+
+# heartbeats of the workers of a supervised pool, set in the workers
+_heartbeats = None
+_progress = None
+_heartbeat_slot = None
+
 
 def get_process_id():
     """
@@ -28,6 +45,256 @@ def get_process_id():
     return n
 
 
+def get_thread_pool(n_threads):
+    """
+    Get a pool of threads of the current process. Threads are not inherited
+    by forked child processes, so the pools are created once per process
+    and number of threads.
+
+    Parameters
+    ----------
+    n_threads : int
+        number of threads of the pool
+
+    Returns
+    -------
+    :class:`multiprocessing.pool.ThreadPool`
+    """
+    key = (os.getpid(), n_threads)
+    if key not in _thread_pools:
+        logger.debug(
+            'Starting pool of %i threads in process %i' % key[::-1])
+        _thread_pools[key] = ThreadPool(n_threads)
+
+    return _thread_pools[key]
+
+
+def set_worker_threads(threads_per_worker, pin=False):
+    """
+    Set the number of BLAS/ OpenMP threads of the workers of all subsequent
+    pools and whether the workers are pinned to cores. Only forked workers
+    are configured, serial runs in the current process keep its settings.
+
+    Parameters
+    ----------
+    threads_per_worker : int
+        number of threads of each worker, if None the threads are not changed
+    pin : bool
+        if True, each worker is pinned to threads_per_worker cores, cores of
+        the same NUMA node are assigned to neighbouring workers
+    """
+    global _threads_per_worker, _pin_workers
+    _threads_per_worker = threads_per_worker
+    _pin_workers = pin
+
+
+# functions of the BLAS and OpenMP libraries that set the number of threads,
+# numpy wheels ship openblas with suffixed symbols
+_thread_setters = [
+    'openblas_set_num_threads',
+    'openblas_set_num_threads64_',
+    'scipy_openblas_set_num_threads64_',
+    'MKL_Set_Num_Threads',
+    'omp_set_num_threads']
+
+
+def _set_library_threads(n_threads):
+    """
+    Set the number of threads of the BLAS and OpenMP libraries that are
+    loaded into the current process by calling them with ctypes.
+
+    Returns
+    -------
+    list of paths to the libraries whose threads were set
+    """
+    import ctypes
+
+    try:
+        with open('/proc/self/maps') as f:
+            paths = set(
+                line.split()[-1] for line in f if '.so' in line.split()[-1])
+    except IOError:
+        return []
+
+    libraries = []
+    for path in sorted(paths):
+        name = os.path.basename(path).lower()
+        if not any(key in name for key in ('blas', 'omp', 'mkl')):
+            continue
+
+        try:
+            library = ctypes.CDLL(path)
+        except OSError:
+            continue
+
+        for setter in _thread_setters:
+            function = getattr(library, setter, None)
+            if function is not None:
+                function(ctypes.c_int(n_threads))
+                libraries.append(path)
+                break
+
+    return libraries
+
+
+def set_blas_threads(n_threads):
+    """
+    Set the number of threads of BLAS and OpenMP of the current process.
+    Uses threadpoolctl or mkl-service if installed, otherwise the
+    libraries loaded into the process are called directly.
+    The environment variables are set for programs started from this
+    process.
+
+    Parameters
+    ----------
+    n_threads : int
+        number of threads
+
+    Returns
+    -------
+    bool, True if the threads of the current process could be set
+    """
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[var] = str(n_threads)
+
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        try:
+            import mkl
+        except ImportError:
+            libraries = _set_library_threads(n_threads)
+            if not libraries:
+                log = logger.warning if n_threads != 1 else logger.debug
+                log('Could not set the number of BLAS threads of process %i'
+                    ' to %i, install threadpoolctl or mkl-service!' % (
+                        os.getpid(), n_threads))
+                return False
+
+            logger.debug('Set %i threads of %s' % (
+                n_threads, ', '.join(libraries)))
+            return True
+
+        mkl.set_num_threads(n_threads)
+        return True
+
+    threadpool_limits(limits=n_threads)
+    return True
+
+
+def parse_cpulist(cpulist):
+    """
+    Parse linux cpu list format, e.g. "0-3,8-11".
+
+    Returns
+    -------
+    list of int
+    """
+    cores = []
+    for item in cpulist.strip().split(','):
+        if not item:
+            continue
+
+        if '-' in item:
+            start, stop = item.split('-')
+            cores.extend(range(int(start), int(stop) + 1))
+        else:
+            cores.append(int(item))
+
+    return cores
+
+
+def get_numa_cores():
+    """
+    Get the cores of the NUMA nodes that the current process may use.
+
+    Returns
+    -------
+    list of lists of core ids for each NUMA node
+    """
+    try:
+        import psutil
+        allowed = set(psutil.Process().cpu_affinity())
+    except (ImportError, AttributeError):
+        allowed = set(range(multiprocessing.cpu_count()))
+
+    nodes = []
+    node_dirs = glob('/sys/devices/system/node/node[0-9]*')
+    for node_dir in sorted(
+            node_dirs, key=lambda d: int(d.rsplit('node', 1)[1])):
+        try:
+            with open(os.path.join(node_dir, 'cpulist')) as f:
+                cores = parse_cpulist(f.read())
+        except IOError:
+            continue
+
+        cores = [core for core in cores if core in allowed]
+        if cores:
+            nodes.append(cores)
+
+    if not nodes:
+        nodes = [sorted(allowed)]
+
+    return nodes
+
+
+def get_worker_cores(slot, threads_per_worker):
+    """
+    Get cores of a worker. Workers get consecutive blocks of cores, ordered by
+    NUMA node, if there are more threads than cores the blocks wrap around.
+
+    Parameters
+    ----------
+    slot : int
+        index of the worker
+    threads_per_worker : int
+        number of cores of each worker
+
+    Returns
+    -------
+    list of int
+    """
+    cores = [core for node in get_numa_cores() for core in node]
+    ncores = len(cores)
+    start = slot * threads_per_worker
+    if start + threads_per_worker > ncores:
+        logger.warning(
+            'More worker threads than cores, cores are oversubscribed!')
+
+    return sorted(set(
+        cores[(start + i) % ncores] for i in range(threads_per_worker)))
+
+
+def configure_worker(slot=None):
+    """
+    Apply the thread settings of :func:`set_worker_threads` to the current
+    process.
+
+    Parameters
+    ----------
+    slot : int
+        index of the worker in its pool, if None the process is not pinned
+    """
+    if _threads_per_worker is None:
+        return
+
+    set_blas_threads(_threads_per_worker)
+
+    if _pin_workers and slot is not None:
+        cores = get_worker_cores(slot, _threads_per_worker)
+        try:
+            import psutil
+            psutil.Process().cpu_affinity(cores)
+        except (ImportError, AttributeError, ValueError, OSError):
+            logger.debug('Could not pin worker %i to cores!' % slot)
+        else:
+            logger.debug('Pinned worker %i to cores %s' % (slot, cores))
+
+
+def _init_pool_worker(nprocs):
+    configure_worker((get_process_id() - 1) % nprocs)
+
+
 def check_available_memory(filesize):
     """
     Checks if the system memory can handle the given filesize.
@@ -39,8 +306,8 @@ def check_available_memory(filesize):
     """
     from psutil import virtual_memory
     mem = virtual_memory()
-    avail_mem_mb = mem.available / (1080 ** 2)
-    phys_mem_mb = mem.total / (1080 ** 2)
+    avail_mem_mb = mem.available / (1024. ** 2)
+    phys_mem_mb = mem.total / (1024. ** 2)
 
     logger.debug(
         'Physical Memory [Mb] %f \n '
@@ -63,6 +330,136 @@ def check_available_memory(filesize):
             ' may result in extremely slowed down calculation times!')
 
 
+def get_available_memory():
+    """
+    Returns the available memory of the system [byte].
+    """
+    from psutil import virtual_memory
+    return virtual_memory().available
+
+
+class MemoryBudget(object):
+    """
+    Estimate of the peak memory of a parallel run. Items are either shared
+    by all workers (e.g. data in shared memory or allocated before forking)
+    or allocated by each worker.
+
+    Parameters
+    ----------
+    safety : float
+        fraction [0., 1.] of the available memory that may be used
+    """
+
+    def __init__(self, safety=0.8):
+        self.safety = safety
+        self.shared = OrderedDict()
+        self.per_worker = OrderedDict()
+
+    def add_shared(self, name, nbytes):
+        self.shared[name] = self.shared.get(name, 0.) + float(nbytes)
+
+    def add_per_worker(self, name, nbytes):
+        self.per_worker[name] = self.per_worker.get(name, 0.) + float(nbytes)
+
+    @property
+    def shared_size(self):
+        return sum(self.shared.values())
+
+    @property
+    def worker_size(self):
+        return sum(self.per_worker.values())
+
+    def total(self, n_jobs):
+        """
+        Peak memory [byte] for n_jobs workers.
+        """
+        return self.shared_size + n_jobs * self.worker_size
+
+    def max_n_jobs(self, available=None):
+        """
+        Largest number of workers that fit into the available memory.
+
+        Parameters
+        ----------
+        available : float
+            available memory [byte], default: available memory of the system
+
+        Returns
+        -------
+        int, zero if not even one worker fits
+        """
+        if available is None:
+            available = get_available_memory()
+
+        usable = available * self.safety - self.shared_size
+        if usable <= 0.:
+            return 0
+
+        if self.worker_size == 0.:
+            return multiprocessing.cpu_count()
+
+        return int(usable / self.worker_size)
+
+    def plan_n_jobs(self, n_jobs, available=None):
+        """
+        Get the largest safe number of workers up to n_jobs.
+
+        Parameters
+        ----------
+        n_jobs : int
+            requested number of workers
+        available : float
+            available memory [byte], default: available memory of the system
+
+        Returns
+        -------
+        int
+
+        Raises
+        ------
+        MemoryError if not even one worker fits into the memory
+        """
+        if available is None:
+            available = get_available_memory()
+
+        max_n_jobs = self.max_n_jobs(available)
+        if max_n_jobs < 1:
+            raise MemoryError(
+                'Estimated memory of a single worker exceeds the available'
+                ' memory!\n%s' % self.breakdown(1, available))
+
+        if max_n_jobs < n_jobs:
+            logger.warning(
+                'Estimated memory for %i workers exceeds the available'
+                ' memory, reducing to %i workers!' % (n_jobs, max_n_jobs))
+            return max_n_jobs
+
+        return n_jobs
+
+    def breakdown(self, n_jobs, available=None):
+        """
+        Table of the memory items for n_jobs workers in [MB].
+        """
+        if available is None:
+            available = get_available_memory()
+
+        mb = 1024. ** 2
+        lines = ['%-40s %12s' % ('Item', 'Memory [MB]')]
+        for name, nbytes in self.shared.items():
+            lines.append('%-40s %12.1f' % (name, nbytes / mb))
+
+        for name, nbytes in self.per_worker.items():
+            lines.append('%-40s %12.1f' % (
+                '%s (%i x %.1f)' % (name, n_jobs, nbytes / mb),
+                n_jobs * nbytes / mb))
+
+        lines.append('%-40s %12.1f' % ('Total', self.total(n_jobs) / mb))
+        lines.append('%-40s %12.1f' % (
+            'Usable (%i%% of available)' % (self.safety * 100.),
+            available * self.safety / mb))
+        return '\n'.join(lines)
+
+
 def exception_tracer(func):
     """
     Function decorator that returns a traceback if an Error is raised in
@@ -205,7 +602,9 @@ def paripool(
             yield [function(*work)]
 
     else:
-        pool = multiprocessing.Pool(processes=nprocs)
+        pool = multiprocessing.Pool(
+            processes=nprocs,
+            initializer=_init_pool_worker, initargs=(nprocs,))
 
         logger.info('Worker timeout after %i second(s)' % timeout)
 
@@ -240,6 +639,558 @@ def paripool(
             multiprocessing.process._current_process._counter = count(1)
 
 
+def heartbeat(progress=None):
+    """
+    Report that the task of the current process is alive. Tasks that are run
+    by :func:`supervised_pool` have to call this regularly, e.g. after each
+    draw of a Markov Chain. Does nothing outside of a supervised pool.
+
+    Parameters
+    ----------
+    progress : int
+        progress of the task, e.g. number of completed draws
+    """
+    if _heartbeats is not None:
+        _heartbeats[_heartbeat_slot] = time.time()
+        if progress is not None:
+            _progress[_heartbeat_slot] = progress
+
+
+def _supervised_worker(
+        function, workpackage, slot, heartbeats, progress, conn,
+        initializer, initargs, retry_work):
+    """
+    Worker process of a supervised pool. Receives indexes to the
+    workpackage, which is inherited from the parent process, and the attempt
+    of the task and sends back the results.
+    """
+    global _heartbeats, _progress, _heartbeat_slot
+    _heartbeats = heartbeats
+    _progress = progress
+    _heartbeat_slot = slot
+
+    configure_worker(slot)
+
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+
+        idx, attempt = task
+        heartbeat(0)
+        try:
+            if initializer is not None:
+                initializer(*initargs)
+
+            work = workpackage[idx]
+            if attempt > 0 and retry_work is not None:
+                work = retry_work(work, attempt)
+
+            result = function(*work)
+        except KeyboardInterrupt:
+            break
+        except Exception:
+            conn.send((idx, False, traceback.format_exc()))
+        else:
+            conn.send((idx, True, result))
+
+
+def supervised_pool(
+        function, workpackage, nprocs=None, heartbeat_timeout=600.,
+        max_retries=2, initializer=None, initargs=(), poll_interval=0.05,
+        retry_work=None):
+    """
+    Executes a function in parallel in a pool of supervised worker
+    processes and yields the results as they complete.
+
+    Tasks have to report their progress with :func:`heartbeat`. If a task
+    did not report for heartbeat_timeout seconds, its worker is killed and
+    replaced and the task is rescheduled, while the other workers keep
+    running. Tasks that raised an exception or whose worker died are
+    rescheduled as well.
+
+    Parameters
+    ----------
+    function : function
+        python function to be executed in parallel
+    workpackage : list
+        of iterables with the arguments of each task
+    nprocs : int
+        number of processors to be used in paralell process, default: all
+    heartbeat_timeout : float
+        time [s] without heartbeat after which a task is considered stalled
+    max_retries : int
+        number of times a task is rescheduled, if it still fails None is
+        yielded as its result
+    initializer : function
+        to be run before each task, e.g. to access shared arrays
+    initargs : tuple
+        of arguments for the initializer
+    poll_interval : float
+        time [s] between checks of the workers
+    retry_work : function
+        of the arguments of a task and the number of the retry, returns the
+        arguments for the rescheduled task, e.g. with a new random seed,
+        default: rerun with the same arguments
+
+    Returns
+    -------
+    generator of (index of the task in the workpackage, result)
+    """
+    if nprocs is None:
+        nprocs = multiprocessing.cpu_count()
+
+    if nprocs == 1:
+        for idx, work in enumerate(workpackage):
+            if initializer is not None:
+                initializer(*initargs)
+            yield idx, function(*work)
+
+        return
+
+    nprocs = min(nprocs, len(workpackage))
+    heartbeats = multiprocessing.RawArray('d', nprocs)
+    progress = multiprocessing.RawArray('l', nprocs)
+
+    pending = deque(range(len(workpackage)))
+    retries = {}
+    failed = []
+    workers = {}
+
+    def start_worker(slot):
+        conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_supervised_worker,
+            args=(function, workpackage, slot, heartbeats, progress,
+                  child_conn, initializer, initargs, retry_work))
+        process.daemon = True
+        process.start()
+        workers[slot] = [process, conn, None]
+        logger.debug('Started worker %i (pid %i)' % (slot, process.pid))
+
+    def stop_worker(slot):
+        process, conn, _ = workers.pop(slot)
+        process.terminate()
+        process.join()
+        conn.close()
+
+    def reschedule(idx, reason):
+        retries[idx] = retries.get(idx, 0) + 1
+        if retries[idx] > max_retries:
+            logger.error(
+                'Task %i failed %i times, giving up! Returning: None!\n%s' % (
+                    idx, retries[idx], reason))
+            failed.append(idx)
+        else:
+            logger.warning(
+                'Task %i failed, rescheduling (retry %i of %i) ...\n%s' % (
+                    idx, retries[idx], max_retries, reason))
+            pending.appendleft(idx)
+
+    logger.info(
+        'Starting %i supervised workers, heartbeat timeout after %i'
+        ' second(s)' % (nprocs, heartbeat_timeout))
+
+    for slot in range(nprocs):
+        start_worker(slot)
+
+    try:
+        while pending or any(
+                worker[2] is not None for worker in workers.values()):
+
+            for slot in list(workers.keys()):
+                process, conn, idx = workers[slot]
+
+                if idx is not None:
+                    if conn.poll():
+                        try:
+                            ridx, success, result = conn.recv()
+                        except (EOFError, IOError):
+                            stop_worker(slot)
+                            start_worker(slot)
+                            reschedule(idx, 'Worker %i died!' % slot)
+                        else:
+                            workers[slot][2] = None
+                            if success:
+                                yield ridx, result
+                            else:
+                                reschedule(ridx, result)
+
+                    elif not process.is_alive():
+                        stop_worker(slot)
+                        start_worker(slot)
+                        reschedule(
+                            idx, 'Worker %i died with exit code %s!' % (
+                                slot, process.exitcode))
+
+                    elif time.time() - heartbeats[slot] > heartbeat_timeout:
+                        stop_worker(slot)
+                        start_worker(slot)
+                        reschedule(
+                            idx, 'Task stalled after progress %i, no'
+                            ' heartbeat for %i second(s)! Worker %i'
+                            ' killed.' % (
+                                progress[slot], heartbeat_timeout, slot))
+
+                if workers[slot][2] is None and pending:
+                    idx = pending.popleft()
+                    heartbeats[slot] = time.time()
+                    progress[slot] = 0
+                    workers[slot][1].send((idx, retries.get(idx, 0)))
+                    workers[slot][2] = idx
+
+            while failed:
+                yield failed.pop(0), None
+
+            time.sleep(poll_interval)
+
+    except KeyboardInterrupt:
+        logger.error('Got Ctrl + C, terminating workers ...')
+        raise
+
+    finally:
+        for slot, (process, conn, idx) in list(workers.items()):
+            if idx is None and process.is_alive():
+                try:
+                    conn.send(None)
+                except (IOError, OSError):
+                    pass
+                process.join(1.)
+
+            stop_worker(slot)
+
+        # reset process counter for tqdm progressbar
+        multiprocessing.process._current_process._counter = count(1)
+
+
+def _pay_indexed_worker(indexed_worker):
+    """
+    Wrapping function for the pool start instance, that returns the index
+    of the task with the result.
+    """
+    idx, worker = indexed_worker
+    return idx, _pay_worker(worker)
+
+
+def iparipool(
+        function, workpackage, nprocs=None, chunksize=1, timeout=0xFFFF,
+        initializer=None, initargs=()):
+    """
+    Initialises a pool of workers and executes a function in parallel by
+    forking the process. Unlike :func:`paripool` the results are yielded
+    one by one as soon as they are completed, in the order of completion.
+
+    Parameters
+    ----------
+    function : function
+        python function to be executed in parallel
+    workpackage : list
+        of iterables that are to be looped over/ executed in parallel usually
+        these objects are different for each task.
+    nprocs : int
+        number of processors to be used in paralell process
+    chunksize : int
+        number of work packages to throw at workers in each instance
+    timeout : int
+        time [s] after which processes are killed, default: 65536s
+    initializer : function
+        to init pool with may be container for shared arrays
+    initargs : tuple
+        of arguments for the initializer
+
+    Returns
+    -------
+    generator of (index of the task in the workpackage, result), the result
+    of tasks that timed out is None
+    """
+    if nprocs is None:
+        nprocs = multiprocessing.cpu_count()
+
+    if chunksize is None:
+        chunksize = 1
+
+    if nprocs == 1:
+        for idx, work in enumerate(workpackage):
+            if initializer is not None:
+                initializer(*initargs)
+            yield idx, function(*work)
+
+        return
+
+    pool = multiprocessing.Pool(
+        processes=nprocs,
+        initializer=_init_pool_worker, initargs=(nprocs,))
+
+    logger.info('Worker timeout after %i second(s)' % timeout)
+
+    workers = [
+        (idx, WatchedWorker(
+            function, work,
+            initializer=initializer, initargs=initargs, timeout=timeout))
+        for idx, work in enumerate(workpackage)]
+
+    # the results of a chunk are returned together
+    result_timeout = max(timeout * chunksize, 100)
+
+    results = pool.imap_unordered(
+        _pay_indexed_worker, workers, chunksize=chunksize)
+
+    finished = False
+    try:
+        for _ in range(len(workers)):
+            yield results.next(result_timeout)
+
+        finished = True
+    except multiprocessing.TimeoutError:
+        logger.error('Overseer fell asleep. Fire everyone!')
+    except KeyboardInterrupt:
+        logger.error('Got Ctrl + C')
+        traceback.print_exc()
+    finally:
+        if finished:
+            pool.close()
+            pool.join()
+            # reset process counter for tqdm progressbar
+            multiprocessing.process._current_process._counter = count(1)
+        else:
+            pool.terminate()
+
+
+class Job(object):
+    """
+    Node of a :class:`JobGraph`, i.e. a task with dependencies.
+
+    Parameters
+    ----------
+    name : str
+        unique name of the job
+    function : function
+        python function to be executed
+    args : tuple
+        of arguments to the function
+    kwargs : dict
+        of keyword arguments to the function
+    depends : list
+        of names of the jobs that have to be completed before this job
+    nworkers : int
+        number of processors the job is using
+    marker : str
+        path to the completion marker file, jobs with existing markers are
+        being skipped, i.e. interrupted job graphs are resumed
+    """
+
+    def __init__(
+            self, name, function, args=(), kwargs=None, depends=None,
+            nworkers=1, marker=None):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.depends = depends or []
+        self.nworkers = nworkers
+        self.marker = marker
+
+    def __str__(self):
+        return 'Job %s (%i worker(s))' % (self.name, self.nworkers)
+
+    def run(self):
+        return self.function(*self.args, **self.kwargs)
+
+    @property
+    def done(self):
+        return self.marker is not None and os.path.exists(self.marker)
+
+    def mark_done(self):
+        if self.marker is not None:
+            with open(self.marker, 'w') as f:
+                f.write('%f\n' % time.time())
+
+    def reset(self):
+        if self.done:
+            os.remove(self.marker)
+
+
+class JobGraph(object):
+    """
+    Directed acyclic graph of jobs, executed in parallel in separate
+    processes with respect to the dependencies and the number of
+    processors each job is using.
+
+    Jobs are started as non-daemonic processes, so they may start
+    pools of processes themselves.
+    """
+
+    def __init__(self):
+        self.jobs = OrderedDict()
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def add(self, job):
+        if job.name in self.jobs:
+            raise ValueError('Job %s already in graph!' % job.name)
+
+        self.jobs[job.name] = job
+
+    def reset(self):
+        """
+        Remove all completion markers.
+        """
+        for job in self.jobs.itervalues():
+            job.reset()
+
+    def sorted_jobs(self):
+        """
+        Get jobs in topological order.
+
+        Returns
+        -------
+        list of :class:`Job`
+        """
+        for job in self.jobs.itervalues():
+            for dep in job.depends:
+                if dep not in self.jobs:
+                    raise ValueError(
+                        'Dependency %s of job %s not in graph!' % (
+                            dep, job.name))
+
+        sorted_jobs = []
+        visited = {}
+
+        def visit(job):
+            state = visited.get(job.name, None)
+            if state == 'done':
+                return
+            elif state == 'visiting':
+                raise ValueError(
+                    'Job graph has a cycle at job %s!' % job.name)
+
+            visited[job.name] = 'visiting'
+            for dep in job.depends:
+                visit(self.jobs[dep])
+
+            visited[job.name] = 'done'
+            sorted_jobs.append(job)
+
+        for job in self.jobs.itervalues():
+            visit(job)
+
+        return sorted_jobs
+
+    def run(self, nprocs=None, poll_interval=0.1):
+        """
+        Execute all jobs that are not done, yet.
+
+        Parameters
+        ----------
+        nprocs : int
+            number of processors to be used by all jobs together,
+            default: all
+        poll_interval : float
+            time [s] between checks for finished jobs
+
+        Returns
+        -------
+        list of names of the jobs that failed or could not be run due to
+        failed dependencies
+        """
+        if nprocs is None:
+            nprocs = multiprocessing.cpu_count()
+
+        todo = self.sorted_jobs()
+        done = set(job.name for job in todo if job.done)
+        todo = [job for job in todo if job.name not in done]
+
+        if done:
+            logger.info(
+                'Resuming job graph, %i of %i jobs are done' % (
+                    len(done), len(self)))
+
+        failed = set()
+        running = {}
+
+        def failed_deps(job):
+            return [dep for dep in job.depends if dep in failed]
+
+        def finish(job, success):
+            if success:
+                job.mark_done()
+                done.add(job.name)
+                logger.info('%s finished' % job)
+            else:
+                failed.add(job.name)
+                logger.error('%s failed!' % job)
+
+        if nprocs == 1:
+            for job in todo:
+                if failed_deps(job):
+                    failed.add(job.name)
+                    continue
+
+                logger.info('Starting %s' % job)
+                try:
+                    job.run()
+                except Exception:
+                    traceback.print_exc()
+                    finish(job, False)
+                else:
+                    finish(job, True)
+
+            return [job.name for job in todo if job.name in failed]
+
+        try:
+            while todo or running:
+                for name, process in list(running.items()):
+                    if not process.is_alive():
+                        process.join()
+                        finish(self.jobs[name], process.exitcode == 0)
+                        running.pop(name)
+
+                for job in list(todo):
+                    if failed_deps(job):
+                        failed.add(job.name)
+                        todo.remove(job)
+
+                # largest jobs first
+                ready = sorted(
+                    [job for job in todo
+                     if all(dep in done for dep in job.depends)],
+                    key=lambda job: job.nworkers, reverse=True)
+
+                nbusy = sum(
+                    self.jobs[name].nworkers for name in running.keys())
+                for job in ready:
+                    if running and nbusy + job.nworkers > nprocs:
+                        continue
+
+                    logger.info('Starting %s' % job)
+                    process = multiprocessing.Process(
+                        target=job.run, name=job.name)
+                    process.start()
+                    running[job.name] = process
+                    nbusy += job.nworkers
+                    todo.remove(job)
+
+                if todo and not ready and not running:
+                    logger.error(
+                        'Jobs %s can not be run, dependencies are not'
+                        ' done!' % ', '.join(job.name for job in todo))
+                    failed.update(job.name for job in todo)
+                    break
+
+                time.sleep(poll_interval)
+
+        except KeyboardInterrupt:
+            logger.error('Got Ctrl + C, terminating running jobs ...')
+            for process in running.values():
+                process.terminate()
+                process.join()
+
+            raise
+
+        return [name for name in self.jobs.keys() if name in failed]
+
+
 def memshare(parameternames):
     """
     Add parameters to set of variables that are to be put into shared
@@ -130,6 +130,10 @@ class PlotOptions(Object):
     force = Bool.T(default=False)
     varnames = List.T(
         default=[], optional=True, help='Names of variables to plot')
+    nensemble = Int.T(
+        default=0,
+        help='Number of posterior samples whose synthetics are plotted'
+             ' into the data fits')
 
 
 def str_dist(dist):
@@ -493,9 +497,56 @@ def get_result_point(stage, config, point_llk='max'):
         point = stage.mtrace.point(
             idx=n_steps, chain=posterior_idxs[point_llk])
 
+    elif config.sampler_config.name == 'PT':
+        sc = config.sampler_config.parameters
+        n_burn = int(sc.burn * len(stage.mtrace))
+        llks = num.vstack([llk.ravel() for llk in stage.mtrace.get_values(
+            varname=stage.step['likelihood_name'],
+            burn=n_burn,
+            thin=sc.thin,
+            combine=False)])
+
+        posterior_idxs = utility.get_fit_indexes(llks.ravel())
+        chain_idx, sample_idx = num.unravel_index(
+            posterior_idxs[point_llk], llks.shape)
+        point = stage.mtrace.point(
+            idx=n_burn + sample_idx * sc.thin,
+            chain=stage.mtrace.chains[chain_idx])
+
     return point
 
 
+def get_posterior_points(stage, config, n_points):
+    """
+    Return random points of a given stage result.
+
+    Parameters
+    ----------
+    stage : :class:`models.Stage`
+    config : :class:`config.BEATConfig`
+    n_points : int
+        number of points to draw
+
+    Returns
+    -------
+    list of dict
+    """
+    mtrace = stage.mtrace
+    sc = config.sampler_config.parameters
+
+    chains = num.random.choice(mtrace.chains, size=n_points)
+    if config.sampler_config.name == 'SMC':
+        # posterior samples are the last samples of the chains
+        idxs = num.repeat(sc.n_steps - 1, n_points)
+    else:
+        n_burn = int(sc.burn * len(mtrace))
+        idxs = num.random.randint(n_burn, len(mtrace), size=n_points)
+
+    return [
+        mtrace.point(idx=int(idx), chain=int(chain))
+        for idx, chain in zip(idxs, chains)]
+
+
 def plot_quadtree(ax, data, target, cmap, colim, alpha=0.8):
     """
     Plot UnwrappedIFG displacements on the respective quadtree rectangle.
@@ -587,6 +638,15 @@ def geodetic_fits(problem, stage, plot_options):
     results = composite.assemble_results(point)
     nrmax = len(results)
 
+    ensemble_stds = None
+    if po.nensemble > 0 and po.reference is None:
+        points = get_posterior_points(stage, problem.config, po.nensemble)
+        logger.info(
+            'Calculating synthetics of %i posterior samples ...' % len(points))
+        ensemble_stds = [
+            synths.std(axis=0)
+            for synths in composite.get_synthetics_batch(points)]
+
     dataset_to_result = {}
     for dataset, result in zip(composite.datasets, results):
         dataset_to_result[dataset] = result
@@ -785,6 +845,15 @@ def geodetic_fits(problem, stage, plot_options):
                 weight='bold',
                 fontsize=fontsize_title)
 
+            if ensemble_stds is not None:
+                axes[figidx][rowidx, 1].annotate(
+                    'max. std: %.3f m' % ensemble_stds[tidx].max(),
+                    xy=(titlex, titley - 0.08),
+                    xycoords='axes fraction',
+                    xytext=(2., 2.),
+                    textcoords='offset points',
+                    fontsize=fontsize)
+
             syn_color = scolor('plum1')
             ref_color = scolor('aluminium5')
 
@@ -931,6 +1000,18 @@ def seismic_fits(problem, stage, plot_options):
         source = composite.config.gf_config.reference_sources[0]
         source.time += problem.config.event.time
 
+    target_to_ensemble = {}
+    if po.nensemble > 0 and po.reference is None:
+        points = get_posterior_points(stage, problem.config, po.nensemble)
+        logger.info(
+            'Calculating synthetics of %i posterior samples ...' % len(points))
+        synths, tmins = composite.get_synthetics_batch(points)
+        for wmap, wsynths, wtmins in zip(composite.wavemaps, synths, tmins):
+            for j, target in enumerate(wmap.targets):
+                target_to_ensemble[target] = (wsynths[:, j, :], wtmins[:, j])
+
+    deltat = 1. / composite.config.gf_config.sample_rate
+
     logger.info('Plotting waveforms ...')
     target_to_result = {}
     all_syn_trs = []
@@ -1106,6 +1187,12 @@ def seismic_fits(problem, stage, plot_options):
                     axes, result.filtered_obs,
                     color=obs_color_light, lw=0.75)
 
+                if target in target_to_ensemble:
+                    for ydata, tmin in zip(*target_to_ensemble[target]):
+                        axes.plot(
+                            tmin + num.arange(ydata.size) * deltat, ydata,
+                            color=syn_color_light, lw=0.3, alpha=0.3)
+
                 plot_trace(
                     axes, result.processed_syn,
                     color=syn_color, lw=1.0)
@@ -1515,7 +1602,7 @@ def select_transform(sc, n_steps=None):
 
     if sc.name == 'SMC':
         return last_sample
-    elif sc.name == 'Metropolis':
+    elif sc.name in ['Metropolis', 'PT']:
         return burn_sample
 
 
@@ -1559,7 +1646,10 @@ def draw_posteriors(problem, plot_options):
         varnames = pc.hyperparameters.keys() + ['like']
     else:
         sc = problem.config.sampler_config
-        varnames = problem.rvs.keys() + pc.hyperparameters.keys() + ['like']
+        varnames = [
+            param.name for param in pc.priors.values()
+            if not num.array_equal(param.lower, param.upper)] + \
+            pc.hyperparameters.keys() + ['like']
 
     if len(po.varnames) > 0:
         varnames = po.varnames
@@ -1587,7 +1677,8 @@ def draw_posteriors(problem, plot_options):
         if not os.path.exists(outpath) or po.force:
             logger.info('plotting stage: %s' % stage.handler.stage_path(s))
             stage.load_results(
-                model=problem.model, stage_number=s, load='trace')
+                model=problem.model, stage_number=s, load='trace',
+                layout=problem.trace_layout)
 
             if sc.name == 'Metropolis' and po.post_llk != 'all':
                 chains = select_metropolis_chains(
@@ -1654,7 +1745,7 @@ def draw_correlation_hist(problem, plot_options):
         raise Exception('Need at least two parameters to compare!'
                         'Found only %i variables! ' % len(varnames))
 
-    if po.load_stage is None and not hypers and not sc.name == 'SMC':
+    if po.load_stage is None and not hypers and sc.name == 'Metropolis':
         draws = sc.parameters.n_steps * (sc.parameters.n_stages - 1) + 1
     if po.load_stage == -2:
         draws = None
@@ -1665,7 +1756,8 @@ def draw_correlation_hist(problem, plot_options):
 
     stage = Stage(homepath=problem.outfolder)
     stage.load_results(
-        model=problem.model, stage_number=po.load_stage, load='trace')
+        model=problem.model, stage_number=po.load_stage, load='trace',
+        layout=problem.trace_layout)
 
     if sc.name == 'Metropolis' and po.post_llk != 'all':
         chains = select_metropolis_chains(problem, stage.mtrace, po.post_llk)
@@ -1799,7 +1891,8 @@ def draw_earthmodels(problem, plot_options):
                         channels=sc.get_unique_channels()[0],
                         sample_rate=sc.gf_config.sample_rate,
                         crust_inds=range(*sc.gf_config.n_variations),
-                        interpolation='multilinear')
+                        interpolation='multilinear',
+                        station_stores=sc.gf_config.station_stores)
 
                     models = load_earthmodels(
                         composite.engine.store_superdirs[0], targets,
@@ -2072,7 +2165,7 @@ def draw_slip_dist(problem, po):
     fault = gc.load_fault_geometry()
 
     sc = problem.config.sampler_config
-    if po.load_stage is None and not sc.name == 'SMC':
+    if po.load_stage is None and sc.name == 'Metropolis':
         draws = sc.parameters.n_steps * (sc.parameters.n_stages - 1) + 1
     if po.load_stage == -2:
         raise ValueError('Slip distribution plot cannot be made for stage-2')
@@ -2120,5 +2213,11 @@ plots_catalog = {
                 }
 
 
+# plots that only need the sampling traces, not the model
+trace_plots = [
+    'correlation_hist',
+    'stage_posteriors']
+
+
 def available_plots():
     return list(plots_catalog.keys())
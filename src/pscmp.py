@@ -10,6 +10,7 @@ import os
 import shutil
 import signal
 import copy
+import atexit
 
 from beat.utility import adjust_fault_reference
 
@@ -608,16 +609,89 @@ class Interrupted(gf.store.StoreError):
         return 'Interrupted.'
 
 
+def read_output(fn):
+    """
+    Read pscmp snapshot output file. The whole file is parsed at once,
+    which is much faster than :func:`numpy.loadtxt` for many observation
+    points.
+
+    Parameters
+    ----------
+    fn : str
+        path to the snapshot file
+
+    Returns
+    -------
+    :class:`numpy.ndarray` (n_observations, n_columns)
+    """
+    with open(fn, 'r') as f:
+        f.readline()
+        first = f.readline()
+        body = first + f.read()
+
+    # header words need not match the columns, count the first row values
+    n_comp = len(first.split())
+    data = num.fromstring(body, dtype=num.float, sep=' ')
+    if n_comp == 0 or data.size % n_comp != 0:
+        logger.debug(
+            'Inconsistent number of values in %s, using loadtxt' % fn)
+        return num.atleast_2d(num.loadtxt(fn, skiprows=1, dtype=num.float))
+
+    return data.reshape((-1, n_comp))
+
+
+def split_output(output, sizes):
+    """
+    Split the results of a batched run into the results of the individual
+    observation sets.
+
+    Parameters
+    ----------
+    output : list
+        of :class:`numpy.ndarray` (n_observations, n_components),
+        one for each snapshot
+    sizes : list
+        of int, number of observation points of each set
+
+    Returns
+    -------
+    list of lists of :class:`numpy.ndarray`, for each observation set the
+    snapshot results
+    """
+    idxs = num.cumsum(sizes)[:-1]
+    return [list(results) for results in zip(
+        *[num.split(data, idxs) for data in output])]
+
+
 class PsCmpRunner:
 
     def __init__(self, tmp=None, keep_tmp=False):
         self.tempdir = mkdtemp(prefix='pscmprun-', dir=tmp)
         self.keep_tmp = keep_tmp
         self.config = None
+        self.pid = os.getpid()
         self.stdout = TemporaryFile(prefix='pscmprun-out-', dir=self.tempdir)
         self.stderr = TemporaryFile(prefix='pscmprun-err-', dir=self.tempdir)
 
+    def _reset(self, config):
+        """
+        Prepare temporary directory for a new run, output of previous runs
+        is removed.
+        """
+        for fn in config.get_output_filenames(self.tempdir):
+            if os.path.exists(fn):
+                os.remove(fn)
+
+        for f in (self.stdout, self.stderr):
+            f.seek(0)
+            f.truncate()
+
     def run(self, config):
+        """
+        Run pscmp for the given configuration. The runner may be used for
+        several runs, the results of the previous run are overwritten.
+        """
+        self._reset(config)
         self.config = config
 
         input_fn = pjoin(self.tempdir, 'input')
@@ -662,11 +736,13 @@ class PsCmpRunner:
         if interrupted:
             raise KeyboardInterrupt()
 
-        logger.debug('===== begin pscmp output =====\n'
-                     '%s===== end pscmp output =====' % self.stdout)
+        self.stderr.seek(0)
+        self.stdout.seek(0)
+        error_str = self.stderr.read()
+        output_str = self.stdout.read()
 
-	error_str = self.stderr.read()
-	output_str = self.stdout.read()
+        logger.debug('===== begin pscmp output =====\n'
+                     '%s===== end pscmp output =====' % output_str)
 
         errmess = []
         if proc.returncode != 0:
@@ -701,6 +777,47 @@ in the directory %s'''.lstrip() % (
 
         os.chdir(old_wd)
 
+    def run_batch(self, config, observations, component='displ', flip_z=False):
+        """
+        Calculate the results for several sets of observation points with a
+        single pscmp run. The scatter points of all sets are combined into
+        one observation and the results are split afterwards.
+
+        Parameters
+        ----------
+        config : :class:`PsCmpConfigFull`
+            observation of the config is ignored
+        observations : list
+            of :class:`PsCmpScatter`
+        component : str
+            see :meth:`get_results`
+        flip_z : bool
+            see :meth:`get_results`
+
+        Returns
+        -------
+        list of lists of :class:`numpy.ndarray`, for each observation set the
+        results of each snapshot
+        """
+        lats = []
+        lons = []
+        sizes = []
+        for observation in observations:
+            if not isinstance(observation, PsCmpScatter):
+                raise TypeError(
+                    'Batched runs are only possible for PsCmpScatter'
+                    ' observations!')
+
+            lats.extend(observation.lats)
+            lons.extend(observation.lons)
+            sizes.append(len(observation.lats))
+
+        config = copy.copy(config)
+        config.observation = PsCmpScatter(lats=lats, lons=lons)
+        self.run(config)
+        return split_output(
+            self.get_results(component=component, flip_z=flip_z), sizes)
+
     def get_results(self, component='displ', which='snapshot', flip_z=False):
         '''
         Be careful: The z-component is downward positive!
@@ -718,8 +835,7 @@ in the directory %s'''.lstrip() % (
             if not os.path.exists(fn):
                 continue
 
-            data = num.loadtxt(fn, skiprows=1, dtype=num.float)
-            nsamples, n_comp = data.shape
+            data = read_output(fn)
 
             if component == 'displ':
                 if flip_z:
@@ -739,11 +855,49 @@ in the directory %s'''.lstrip() % (
 
         return output
 
-    def __del__(self):
-        if self.tempdir:
+    def cleanup(self):
+        if self.tempdir and self.pid == os.getpid():
             if not self.keep_tmp:
                 shutil.rmtree(self.tempdir)
                 self.tempdir = None
             else:
                 logger.warn(
                     'not removing temporary directory: %s' % self.tempdir)
+
+    def __del__(self):
+        self.cleanup()
+
+
+_runners = {}
+
+
+def get_runner(tmp=None):
+    """
+    Get reusable :class:`PsCmpRunner` of the current process. Repeated runs,
+    e.g. for many velocity models or source configurations, share the same
+    temporary directory instead of creating a new one for each run.
+
+    Parameters
+    ----------
+    tmp : str
+        directory where the temporary directory is created
+
+    Returns
+    -------
+    :class:`PsCmpRunner`
+    """
+    key = (os.getpid(), tmp)
+    if key not in _runners or _runners[key].tempdir is None:
+        _runners[key] = PsCmpRunner(tmp=tmp)
+
+    return _runners[key]
+
+
+def cleanup_runners():
+    for runner in _runners.values():
+        runner.cleanup()
+
+    _runners.clear()
+
+
+atexit.register(cleanup_runners)
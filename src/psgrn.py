@@ -5,6 +5,8 @@ library and may be removed from the beat repository in the future.
 
 import logging
 import os
+import shutil
+import time
 
 import math
 
@@ -12,6 +14,8 @@ import signal
 
 from subprocess import Popen, PIPE
 from os.path import join as pjoin
+from hashlib import sha1
+from tempfile import mkdtemp
 
 from pyrocko.guts import Float, Int, Tuple, Object, String
 from pyrocko import cake
@@ -302,6 +306,155 @@ def remove_if_exists(fn, force=False):
             raise gf.CannotCreate('file %s already exists' % fn)
 
 
+def get_cache_key(config):
+    """
+    Get key of the psgrn results of a configuration. The input string does
+    not depend on the output directory, i.e. identical earth models and
+    grids have the same key.
+
+    Parameters
+    ----------
+    config : :class:`PsGrnConfigFull`
+
+    Returns
+    -------
+    str, sha1 hexdigest
+    """
+    program = program_bins['psgrn.%s' % config.psgrn_version]
+    return sha1(
+        (program + '\n' + config.string_for_config()).encode(
+            'utf-8')).hexdigest()
+
+
+def link_or_copy(src, dst):
+    """
+    Hard link file, copy it if linking is not possible, e.g. across
+    filesystems.
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+
+    try:
+        os.link(src, dst)
+    except (OSError, AttributeError):
+        shutil.copy2(src, dst)
+
+
+def unshare_files(dirname):
+    """
+    Remove hard linked files of a directory, so that a new run does not
+    overwrite the entries of the cache.
+    """
+    for fn in os.listdir(dirname):
+        path = pjoin(dirname, fn)
+        if os.path.isfile(path) and os.stat(path).st_nlink > 1:
+            os.remove(path)
+
+
+def get_dir_size(dirname):
+    return sum(
+        os.path.getsize(pjoin(dirname, fn)) for fn in os.listdir(dirname))
+
+
+class PsGrnCache(object):
+    """
+    Content-addressed cache of psgrn results, shared among projects.
+    Each entry is a directory named by :func:`get_cache_key`. The least
+    recently used entries are evicted if the cache exceeds its size.
+
+    Parameters
+    ----------
+    cache_dir : str
+        root directory of the cache
+    max_size : float
+        maximum size [GB] of the cache
+    """
+
+    def __init__(self, cache_dir, max_size=10.):
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+        self.max_size = max_size
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def entry_dir(self, key):
+        return pjoin(self.cache_dir, key)
+
+    def has(self, key):
+        return os.path.isdir(self.entry_dir(key))
+
+    def get(self, key, outdir):
+        """
+        Link the results of a cache entry into the output directory.
+
+        Returns
+        -------
+        bool, True if the entry exists
+        """
+        entry_dir = self.entry_dir(key)
+        if not self.has(key):
+            return False
+
+        for fn in os.listdir(entry_dir):
+            link_or_copy(pjoin(entry_dir, fn), pjoin(outdir, fn))
+
+        # access time for the eviction
+        now = time.time()
+        os.utime(entry_dir, (now, now))
+        return True
+
+    def put(self, key, outdir):
+        """
+        Add the results in the output directory to the cache and evict old
+        entries if necessary.
+        """
+        if self.has(key):
+            return
+
+        tmp_dir = mkdtemp(prefix='tmp-', dir=self.cache_dir)
+        try:
+            for fn in os.listdir(outdir):
+                path = pjoin(outdir, fn)
+                if os.path.isfile(path):
+                    link_or_copy(path, pjoin(tmp_dir, fn))
+
+            os.rename(tmp_dir, self.entry_dir(key))
+        except OSError:
+            # entry has been added by another process meanwhile
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache size is below the
+        maximum size.
+
+        Parameters
+        ----------
+        keep : str
+            key of an entry that must not be removed
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.entry_dir(key)
+            if os.path.isdir(entry_dir) and not key.startswith('tmp-'):
+                entries.append((
+                    os.path.getmtime(entry_dir), get_dir_size(entry_dir), key))
+
+        total_size = sum(entry[1] for entry in entries)
+        max_size = self.max_size * 1024. ** 3
+        for _, size, key in sorted(entries):
+            if total_size <= max_size:
+                break
+
+            if key == keep:
+                continue
+
+            logger.info('Evicting psgrn cache entry %s' % key)
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            total_size -= size
+
+
 class PsGrnRunner:
 
     def __init__(self, outdir):
@@ -310,12 +463,32 @@ class PsGrnRunner:
         self.outdir = outdir
         self.config = None
 
-    def run(self, config, force=False):
+    def run(self, config, force=False, cache=None):
+        """
+        Run psgrn for the given configuration.
+
+        Parameters
+        ----------
+        config : :class:`PsGrnConfigFull`
+        force : bool
+            overwrite existing results in the output directory
+        cache : :class:`PsGrnCache`
+            if given, results for identical configurations are taken from
+            the cache and new results are added to it
+        """
         self.config = config
 
         input_fn = pjoin(self.outdir, 'input')
 
         remove_if_exists(input_fn, force=force)
+        unshare_files(self.outdir)
+
+        if cache is not None:
+            key = get_cache_key(config)
+            if cache.get(key, self.outdir):
+                logger.info(
+                    'Found psgrn results in cache %s' % cache.entry_dir(key))
+                return
 
         f = open(input_fn, 'w')
         input_str = config.string_for_config()
@@ -387,3 +560,6 @@ in the directory %s'''.lstrip() % (
         self.psgrn_error = error_str
 
         os.chdir(old_wd)
+
+        if cache is not None:
+            cache.put(key, self.outdir)
@@ -1,3 +1,6 @@
 from .metropolis import * # noqa
 from .smc import * # noqa
 from .base import * # noqa
+from .resampling import * # noqa
+from .pt import * # noqa
+from .surrogate import * # noqa
@@ -1,7 +1,9 @@
 import logging
 from copy import deepcopy
+from collections import OrderedDict
 import os
 import shutil
+import cPickle as pickle
 
 from beat import parallel, backend
 from beat.utility import list2string
@@ -12,6 +14,8 @@ from numpy.random import normal, standard_cauchy, standard_exponential, \
 import numpy as np
 
 from theano import function
+from theano.gof.graph import inputs
+from theano.compile.pfunc import rebuild_collect_shared
 
 from pymc3.model import modelcontext, Point
 from pymc3 import CompoundStep
@@ -26,7 +30,10 @@ logger = logging.getLogger('base')
 
 
 __all__ = [
+    'FunctionCache',
     'choose_proposal',
+    'get_variable_dependencies',
+    'get_update_blocks',
     'iter_parallel_chains',
     'init_stage',
     'proposal_dists']
@@ -193,8 +200,8 @@ def _sample(draws, step=None, start=None, trace=None, chain=0, tune=None,
             leave=False,
             ncols=65)
     try:
-        for strace in sampling:
-            pass
+        for i, strace in enumerate(sampling):
+            parallel.heartbeat(i + 1)
 
     except KeyboardInterrupt:
         raise
@@ -269,15 +276,26 @@ def init_chain_hypers(problem):
     problem.update_llks(point)
 
 
+def _reseed_work(work, attempt):
+    """
+    Derive a new random seed for a chain that is rerun by the supervised
+    pool, so that a retry does not repeat the proposals of the failed run.
+    """
+    max_int = np.iinfo(np.int32).max
+    rseed = np.random.RandomState([work[-1], attempt]).randint(max_int)
+    return tuple(work[:-1]) + (rseed,)
+
+
 def iter_parallel_chains(
         draws, step, stage_path, progressbar, model, n_jobs,
-        chains=None, initializer=None, initargs=(), chunksize=None):
+        chains=None, initializer=None, initargs=(), chunksize=None,
+        heartbeat_timeout=None, max_retries=2):
     """
     Do Metropolis sampling over all the chains with each chain being
     sampled 'draws' times. Parallel execution according to n_jobs.
-    If jobs hang for any reason they are being killed after an estimated
-    timeout. The chains in question are being rerun and the estimated timeout
-    is added again.
+    Each chain reports a heartbeat after every draw. If a chain hangs for any
+    reason, only its worker is killed and the chain is being rerun with a
+    new random seed, while the other chains continue sampling.
 
     Parameters
     ----------
@@ -302,14 +320,17 @@ def iter_parallel_chains(
     initargs : tuple
         of arguments for the initializer
     chunksize : int
-        number of chains to sample within each process
+        not used anymore, chains are dispatched to the workers one by one
+    heartbeat_timeout : float
+        time [s] without a completed draw after which a chain is considered
+        stalled, default: estimated from the time per sample
+    max_retries : int
+        number of times a stalled or failed chain is rerun
 
     Returns
     -------
     MultiTrace object
     """
-    timeout = 0
-
     if chains is None:
         chains = list(range(step.n_chains))
 
@@ -334,18 +355,12 @@ def iter_parallel_chains(
                 for chain, rseed, trace in zip(
                     chains, random_seeds, trace_list)]
 
-        tps = step.time_per_sample(np.minimum(n_jobs, 10))
-        logger.info('Serial time per sample: %f' % tps)
-
-        if chunksize is None:
-            if draws < 10:
-                chunksize = int(np.ceil(float(n_chains) / n_jobs))
-            elif draws > 10 and tps < 1.:
-                chunksize = int(np.ceil(float(n_chains) / n_jobs))
-            else:
-                chunksize = n_jobs
-
-        timeout += int(np.ceil(tps * draws)) * n_jobs + 10
+        if heartbeat_timeout is None:
+            tps = step.time_per_sample(np.minimum(n_jobs, 10))
+            logger.info('Serial time per sample: %f' % tps)
+            timeout = max(int(np.ceil(tps * 10.)) * n_jobs, 100)
+        else:
+            timeout = heartbeat_timeout
 
         if n_jobs > 1:
             shared_params = [
@@ -369,18 +384,19 @@ def iter_parallel_chains(
         else:
             logger.info('Not using shared memory.')
 
-        p = parallel.paripool(
+        p = parallel.supervised_pool(
             _sample, work,
-            chunksize=chunksize,
-            timeout=timeout,
             nprocs=n_jobs,
+            heartbeat_timeout=timeout,
+            max_retries=max_retries,
             initializer=initializer,
-            initargs=initargs)
+            initargs=initargs,
+            retry_work=_reseed_work)
 
         logger.info('Sampling ...')
 
-        for res in p:
-            pass
+        for idx, res in p:
+            logger.debug('Chain %i finished' % chains[idx])
 
         # return chain indexes that have been corrupted
         mtrace = backend.load_multitrace(dirname=stage_path, model=model)
@@ -418,6 +434,244 @@ def logp_forw(out_vars, vars, shared):
     return f
 
 
+def get_shared_inputs(fn):
+    """
+    Get the shared variables and their storage containers of a compiled
+    Theano function, in the order of the function inputs.
+    """
+    return [
+        (fn_input.variable, container) for fn_input, container in zip(
+            fn.maker.inputs, fn.input_storage) if fn_input.shared]
+
+
+def rebind_shared_inputs(fn, out_list, inarray0):
+    """
+    Connect the shared inputs of an unpickled Theano function to the shared
+    variables of the current model graph. The values of the model shared
+    variables are transferred to the function and later updates of the
+    model shared variables (e.g. of the data weights) are seen by the
+    function.
+
+    Parameters
+    ----------
+    fn : :class:`theano.compile.function_module.Function`
+        unpickled function
+    out_list : list
+        of :class:`theano.tensor.Tensor` outputs of the current model graph
+    inarray0 : :class:`theano.tensor.Tensor`
+        joined input array of the current model graph
+
+    Returns
+    -------
+    bool, True if the function inputs match the current model graph
+    """
+    model_shared = rebuild_collect_shared(
+        out_list, inputs=[inarray0])[2][3]
+    fn_shared = get_shared_inputs(fn)
+
+    if len(model_shared) != len(fn_shared):
+        return False
+
+    for var, (fn_var, _) in zip(model_shared, fn_shared):
+        if var.type != fn_var.type:
+            return False
+
+    for var, (_, container) in zip(model_shared, fn_shared):
+        if var.container is not container:
+            container.storage[0] = var.get_value(borrow=True)
+            var.container = container
+
+    return True
+
+
+class FunctionCache(object):
+    """
+    Persistent cache of the compiled Theano functions of a model.
+
+    The functions are stored together with a key of the model inputs (e.g.
+    a hash of the configuration and the data files) and the trace layout
+    of the model. Cached functions are only reused if the key did not
+    change. Otherwise, or if no path is given, the functions are compiled.
+
+    Parameters
+    ----------
+    path : str
+        path to the cache file
+    key : str
+        key of the model inputs
+    """
+
+    def __init__(self, path=None, key=None):
+        self.path = path
+        self.key = key
+        self.layout = None
+        self.functions = OrderedDict()
+
+        self._cached_blob = None
+        self._cached = None
+        self._changed = False
+        self.load()
+
+    def load(self):
+        """
+        Load the cache file, if it exists and its key is valid.
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'rb') as f:
+                key, layout, blob = pickle.load(f)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError) as e:
+            logger.warning(
+                'Could not read compiled functions %s: %s' % (self.path, e))
+            return
+
+        if key != self.key:
+            logger.info(
+                'Model inputs changed, cached compiled functions are'
+                ' outdated!')
+            return
+
+        self.layout = layout
+        self._cached_blob = blob
+
+    @property
+    def cached(self):
+        """
+        Unpickled functions of the cache file, only unpickled on demand.
+        """
+        if self._cached is None:
+            self._cached = {}
+            if self._cached_blob is not None:
+                try:
+                    self._cached = pickle.loads(self._cached_blob)
+                except Exception as e:
+                    logger.warning(
+                        'Could not unpickle compiled functions: %s' % e)
+
+                self._cached_blob = None
+
+        return self._cached
+
+    def logp_forw(self, name, out_vars, vars, shared):
+        """
+        Get compiled function of the model and the input and output
+        variables from the cache, or compile it, see :func:`logp_forw`.
+
+        Parameters
+        ----------
+        name : str
+            name of the function in the cache
+        """
+        out_list, inarray0 = join_nonshared_inputs(out_vars, vars, shared)
+
+        f = self.cached.get(name, None)
+        if f is not None and rebind_shared_inputs(f, out_list, inarray0):
+            logger.debug('Loaded compiled function "%s" from cache' % name)
+        else:
+            # compiled functions have to share the storage of the model
+            # shared variables, following cached functions are invalid
+            self._cached = {}
+            self._changed = True
+
+            f = function([inarray0], out_list)
+            f.trust_input = True
+
+        self.functions[name] = f
+        return f
+
+    def dump(self):
+        """
+        Write the compiled functions and the trace layout to the cache file,
+        if any function had to be compiled. The values of the shared
+        variables are not stored.
+        """
+        if self.path is None or not self._changed:
+            return
+
+        containers = {}
+        for f in self.functions.values():
+            for var, container in get_shared_inputs(f):
+                containers[id(container)] = (var, container)
+
+        values = {}
+        for cid, (var, container) in containers.items():
+            value = container.storage[0]
+            values[cid] = value
+            if isinstance(value, np.ndarray):
+                container.storage[0] = np.zeros(
+                    (0,) * value.ndim, dtype=value.dtype)
+
+        logger.info('Writing compiled functions to %s' % self.path)
+        try:
+            blob = pickle.dumps(
+                self.functions, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(self.path, 'wb') as f:
+                pickle.dump(
+                    (self.key, self.layout, blob), f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+
+            self._changed = False
+        except (pickle.PicklingError, TypeError, RuntimeError) as e:
+            logger.warning('Could not pickle compiled functions: %s' % e)
+        finally:
+            for cid, (_, container) in containers.items():
+                container.storage[0] = values[cid]
+
+
+def get_variable_dependencies(variables, outputs):
+    """
+    Track which outputs of the model graph depend on which input variables.
+
+    Parameters
+    ----------
+    variables : list
+        of :class:`pymc3.FreeRV` input variables
+    outputs : list
+        of :class:`theano.tensor.Tensor` e.g. the composite likelihoods
+
+    Returns
+    -------
+    :class:`collections.OrderedDict`
+        variable name: set of names of the outputs that depend on it
+    """
+    output_inputs = [(output.name, set(inputs([output]))) for output in outputs]
+
+    dependencies = OrderedDict()
+    for var in variables:
+        dependencies[var.name] = set(
+            name for name, output_vars in output_inputs if var in output_vars)
+
+    return dependencies
+
+
+def get_update_blocks(dependencies, hypernames=()):
+    """
+    Group variables that affect the same outputs into blocks.
+    Hyperparameters are grouped into blocks of their own.
+
+    Parameters
+    ----------
+    dependencies : dict
+        variable name: set of output names, see `get_variable_dependencies`
+    hypernames : list
+        of names of the hyperparameters
+
+    Returns
+    -------
+    :class:`collections.OrderedDict`
+        (frozenset of output names, bool if hyperparameters):
+        list of variable names
+    """
+    blocks = OrderedDict()
+    for varname, output_names in dependencies.items():
+        key = (frozenset(output_names), varname in hypernames)
+        blocks.setdefault(key, []).append(varname)
+
+    return blocks
+
+
 def init_stage(
         stage_handler, step, stage, model,
         progressbar=False, update=None, rm_flag=False):
@@ -23,9 +23,11 @@ from pymc3.backends import text
 
 from pyrocko import util
 
-from beat import backend, utility
-from .base import iter_parallel_chains, choose_proposal, logp_forw, \
-    init_stage, update_last_samples
+from beat import backend, utility, parallel
+from .base import iter_parallel_chains, choose_proposal, FunctionCache, \
+    init_stage, update_last_samples, get_variable_dependencies, \
+    get_update_blocks
+from .surrogate import RBFSurrogate
 
 
 __all__ = [
@@ -38,6 +40,47 @@ __all__ = [
 logger = logging.getLogger('metropolis')
 
 
+def get_hypers(point, hp_names):
+    """
+    Get the values of the hyperparameters from a point, hyperparameters
+    that are not in the point are zero.
+    """
+    return num.array([
+        num.atleast_1d(point.get(hp_name, 0.))[0] for hp_name in hp_names])
+
+
+def update_hyper_llks(llks, hypers0, hypers, n_samples, slnfs):
+    """
+    Update the likelihoods of datasets with multivariate normal
+    distributions (see :func:`beat.models.multivariate_normal_chol`) for
+    changed hyperparameters, without evaluating the residuals.
+    The hyperparameter weighted residual norms are recovered from the
+    previous likelihoods.
+
+    Parameters
+    ----------
+    llks : :class:`numpy.ndarray`
+        previous likelihoods of the datasets
+    hypers0 : :class:`numpy.ndarray`
+        previous hyperparameters of the datasets
+    hypers : :class:`numpy.ndarray`
+        new hyperparameters of the datasets
+    n_samples : :class:`numpy.ndarray`
+        number of samples of the datasets
+    slnfs : :class:`numpy.ndarray`
+        log-normalisation factors of the covariance matrixes
+
+    Returns
+    -------
+    :class:`numpy.ndarray` of updated likelihoods
+    """
+    # exp(-2 * h0) * ||W r|| ** 2
+    wresiduals = -2. * llks - slnfs - 2. * n_samples * hypers0
+    return -0.5 * (
+        slnfs + 2. * n_samples * hypers +
+        wresiduals * num.exp(-2. * (hypers - hypers0)))
+
+
 class Metropolis(backend.ArrayStepSharedLLK):
     """
     Metropolis-Hastings sampler
@@ -68,6 +111,44 @@ class Metropolis(backend.ArrayStepSharedLLK):
         :module:`pymc3.step_methods.metropolis` for options
     tune : boolean
         Flag for adaptive scaling based on the acceptance rate
+    adaptive : boolean
+        Flag for Adaptive Metropolis; the full proposal covariance and the
+        step size are adapted online during each chain with diminishing
+        adaptation, replaces the tuning of the scaling.
+        Requires the 'MultivariateNormal' proposal.
+    delayed_acceptance : boolean
+        Flag for two-stage delayed acceptance; proposals are screened with
+        a surrogate likelihood fitted to the forward model evaluations of the
+        stage, only the ones that pass are evaluated with the forward model.
+        The surrogate is fitted at the start of each chain and kept fixed
+        during the chain, the second stage acceptance keeps the posterior
+        exact.
+    surrogate_max_points : int
+        Maximum number of (point, likelihood) pairs to fit the surrogate.
+    blocked_updates : boolean
+        Flag for blocked updates; variables are grouped into blocks that
+        affect the same composite likelihoods (model deterministics other
+        than the likelihood) and each step moves only one block. Only the
+        likelihoods of the affected composites are evaluated, the others
+        are reused from the previous point of the chain.
+    hyper_datasets : dict
+        composite likelihood name: list of (hyperparameter name,
+        number of samples, :class:`theano.shared` log-normalisation factor)
+        for each dataset of the composite, see
+        :meth:`beat.models.Problem.get_hyper_datasets`. In blocked updates,
+        the hyperparameters get blocks of their own, which are evaluated
+        from the weighted residual norms of the previous point, without
+        the forward model.
+    concurrent_composites : boolean
+        Flag for evaluating the likelihoods of the composites (model
+        deterministics other than the likelihood) concurrently in a pool of
+        threads of each process, instead of one after the other. Speeds up
+        sampling if the forward models release the GIL (numpy, BLAS and
+        the GF store extensions) and there are idle cores, e.g. n_jobs
+        below the number of cores.
+    function_cache : :class:`beat.sampler.base.FunctionCache`
+        Optional cache of compiled functions, cached functions of the model
+        are reused instead of compiling them.
     check_bound : boolean
         Check if current sample lies outside of variable definition
         speeds up computation as the forward model wont be executed
@@ -82,7 +163,11 @@ class Metropolis(backend.ArrayStepSharedLLK):
     def __init__(self, vars=None, out_vars=None, covariance=None, scale=1.,
                  n_chains=100, tune=True, tune_interval=100, model=None,
                  check_bound=True, likelihood_name='like',
-                 proposal_name='MultivariateNormal', **kwargs):
+                 proposal_name='MultivariateNormal', adaptive=False,
+                 delayed_acceptance=False, surrogate_max_points=500,
+                 blocked_updates=False, hyper_datasets=None,
+                 concurrent_composites=False, function_cache=None,
+                 **kwargs):
 
         model = modelcontext(model)
 
@@ -115,10 +200,22 @@ class Metropolis(backend.ArrayStepSharedLLK):
         self.proposal_dist = choose_proposal(
             self.proposal_name, scale=scale)
 
+        self.adaptive = adaptive
+        if self.adaptive and self.proposal_name != 'MultivariateNormal':
+            raise ValueError(
+                'Adaptive Metropolis requires the "MultivariateNormal"'
+                ' proposal distribution!')
+
+        self.delayed_acceptance = delayed_acceptance
+        self.surrogate = RBFSurrogate(max_points=surrogate_max_points)
+        self.da_proposed = 0
+        self.da_screened = 0
+
         self.proposal_samples_array = self.proposal_dist(n_chains)
 
         self.stage_sample = 0
         self.accepted = 0
+        self.am_target_rate = 0.234
 
         self.beta = 1.
         self.stage = 0
@@ -143,15 +240,167 @@ class Metropolis(backend.ArrayStepSharedLLK):
             self.population.append(
                 Point({v.name: v.random() for v in vars}, model=model))
 
+        if function_cache is None:
+            function_cache = FunctionCache()
+
         shared = make_shared_replacements(vars, model)
-        self.logp_forw = logp_forw(out_vars, vars, shared)
-        self.check_bnd = logp_forw([model.varlogpt], vars, shared)
+        self.logp_forw = function_cache.logp_forw(
+            'logp_forw', out_vars, vars, shared)
+        self.check_bnd = function_cache.logp_forw(
+            'check_bnd', [model.varlogpt], vars, shared)
 
         super(Metropolis, self).__init__(vars, out_vars, shared)
 
         self.chain_previous_lpoint = [
             self.lij.dmap(point) for point in self.population]
 
+        self.blocked_updates = blocked_updates
+        self.hyper_datasets = hyper_datasets or {}
+        self.concurrent_composites = concurrent_composites
+        if self.blocked_updates or self.concurrent_composites:
+            self.init_composites(
+                model, vars, out_vars, shared, function_cache)
+
+        if self.blocked_updates:
+            self.init_blocks(vars)
+
+    def init_composites(
+            self, model, vars, out_vars, shared, function_cache):
+        """
+        Compile the likelihood functions of the composites.
+        """
+        composite_llks = [
+            llk for llk in model.deterministics
+            if llk.name != self.likelihood_name]
+
+        out_varnames = [out_var.name for out_var in out_vars]
+        varnames = [var.name for var in vars]
+        composite_names = [llk.name for llk in composite_llks]
+
+        unknown = set(out_varnames).difference(
+            varnames + composite_names + [self.likelihood_name])
+        if unknown:
+            raise ValueError(
+                'Composite evaluation not supported for output'
+                ' variables: %s' % utility.list2string(list(unknown)))
+
+        self.composite_llks = composite_llks
+        self.composite_logp_forw = {
+            llk.name: function_cache.logp_forw(
+                llk.name, [llk], vars, shared)
+            for llk in composite_llks}
+        self._composite_llk_indexes = {
+            name: out_varnames.index(name) for name in composite_names}
+        self._var_lpoint_indexes = {
+            name: out_varnames.index(name)
+            for name in varnames if name in out_varnames}
+
+    def init_blocks(self, vars):
+        """
+        Initialise the update blocks of the variables.
+        """
+        hyper_names = set(
+            hp_name for datasets in self.hyper_datasets.values()
+            for hp_name, _, _ in datasets)
+
+        dependencies = get_variable_dependencies(vars, self.composite_llks)
+        self.blocks = []
+        for (llk_names, is_hyper), block_varnames in get_update_blocks(
+                dependencies, hyper_names).items():
+            mask = num.zeros(self.ordering.size, dtype='bool')
+            for var, slc, _, _ in self.ordering.vmap:
+                if var in block_varnames:
+                    mask[slc] = True
+
+            hyper_only = is_hyper and len(llk_names) > 0 and \
+                all(llk_name in self.hyper_datasets for llk_name in llk_names)
+
+            logger.info(
+                'Update block: %s affects: %s%s' % (
+                    utility.list2string(block_varnames),
+                    utility.list2string(sorted(llk_names)),
+                    ' (hyperparameters only)' if hyper_only else ''))
+            self.blocks.append((mask, sorted(llk_names), hyper_only))
+
+    def composites_logp_forw(self, q, llk_names):
+        """
+        Evaluate the likelihoods of the given composites, concurrently if
+        concurrent_composites is set.
+
+        Parameters
+        ----------
+        q : :class:`numpy.ndarray`
+            point in the solution space
+        llk_names : list
+            of names of the composite likelihoods to evaluate
+
+        Returns
+        -------
+        list of :class:`numpy.ndarray` likelihoods of the composites
+        """
+        def composite_logp_forw(llk_name):
+            return self.composite_logp_forw[llk_name](q)[0]
+
+        if self.concurrent_composites and len(llk_names) > 1:
+            pool = parallel.get_thread_pool(len(self.composite_logp_forw))
+            return pool.map(composite_logp_forw, llk_names)
+        else:
+            return [composite_logp_forw(llk_name) for llk_name in llk_names]
+
+    def blocked_logp_forw(self, q, l0, llk_names, q0=None, hyper_only=False):
+        """
+        Evaluate the output variables of the proposed point, where only the
+        given composite likelihoods are calculated and the others are taken
+        from the previous point. If only hyperparameters changed, the
+        composite likelihoods are updated from the weighted residual norms
+        of the previous point.
+
+        Parameters
+        ----------
+        q : :class:`numpy.ndarray`
+            proposed point
+        l0 : list
+            output variables of the previous point
+        llk_names : list
+            of names of the composite likelihoods to evaluate
+        q0 : :class:`numpy.ndarray`
+            previous point, needed for hyper_only
+        hyper_only : bool
+            if True, only hyperparameters changed
+
+        Returns
+        -------
+        list of output variables
+        """
+        lp = list(l0)
+        point = self.bij.rmap(q)
+        for varname, idx in self._var_lpoint_indexes.items():
+            lp[idx] = point[varname]
+
+        if hyper_only:
+            point0 = self.bij.rmap(q0)
+            for llk_name in llk_names:
+                idx = self._composite_llk_indexes[llk_name]
+                hp_names, n_samples, slnfs = zip(
+                    *self.hyper_datasets[llk_name])
+                lp[idx] = update_hyper_llks(
+                    l0[idx],
+                    hypers0=get_hypers(point0, hp_names),
+                    hypers=get_hypers(point, hp_names),
+                    n_samples=num.array(n_samples),
+                    slnfs=num.array(
+                        [slnf.get_value() for slnf in slnfs]).ravel()
+                    ).astype(l0[idx].dtype)
+        else:
+            for llk_name, llk in zip(
+                    llk_names, self.composites_logp_forw(q, llk_names)):
+                lp[self._composite_llk_indexes[llk_name]] = llk
+
+        total_llk = sum(
+            lp[idx].sum() for idx in self._composite_llk_indexes.values())
+        lp[self._llk_index] = num.full_like(l0[self._llk_index], total_llk)
+        return lp
+
     def _sampler_state_blacklist(self):
         """
         Returns sampler attributes that are not saved.
@@ -160,7 +409,11 @@ class Metropolis(backend.ArrayStepSharedLLK):
               'array_population',
               'check_bnd',
               'logp_forw',
+              'composite_logp_forw',
+              'composite_llks',
+              'hyper_datasets',
               'proposal_samples_array',
+              'surrogate',
               'vars',
               '_BlockedStep__newargs']
         return bl
@@ -200,6 +453,146 @@ class Metropolis(backend.ArrayStepSharedLLK):
             tps[i] = t1 - t0
         return tps.mean()
 
+    def init_adaptation(self, q0):
+        """
+        Initialise the online adaptation of the Adaptive Metropolis for a
+        chain starting at q0. The proposal covariance is initialised with
+        the current proposal distribution covariance.
+
+        Parameters
+        ----------
+        q0 : :class:`numpy.ndarray`
+            starting point of the chain
+        """
+        ndim = q0.size
+        self.proposal_samples_array = num.random.normal(
+            size=(self.n_steps, ndim)).astype(tconfig.floatX)
+
+        self.am_chol = num.linalg.cholesky(
+            num.atleast_2d(self.proposal_dist.s))
+        self.am_mean = num.array(q0, dtype=num.float64)
+        self.am_log_scaling = num.log(2.38 / num.sqrt(ndim))
+        self.am_n = 0
+
+    def adapt(self, q, accepted):
+        """
+        Diminishing adaptation of the proposal step size towards the target
+        acceptance rate and of the proposal covariance, which is updated
+        by a rank-one update of its cholesky factor for each accepted sample.
+
+        Parameters
+        ----------
+        q : :class:`numpy.ndarray`
+            current point of the chain
+        accepted : boolean
+            whether the last proposal has been accepted
+
+        References
+        ----------
+        .. [Andrieu2008] Andrieu, C. and Thoms, J. (2008).
+            A tutorial on adaptive MCMC.
+            Statistics and Computing, 18(4), 343-373.
+        """
+        self.am_n += 1
+        self.am_log_scaling += num.power(self.am_n, -0.6) * (
+            float(accepted) - self.am_target_rate)
+
+        if accepted:
+            gamma = 1. / (self.tune_interval + self.am_n)
+            diff = q - self.am_mean
+            self.am_mean += gamma * diff
+            self.am_chol = num.sqrt(1. - gamma) * \
+                utility.cholesky_rank_one_update(
+                    self.am_chol, num.sqrt(gamma) * diff)
+
+    def select(self, q, q0, l0, llk_names=None, hyper_only=False):
+        """
+        Evaluate the forward model at the proposed point and select with the
+        Metropolis criterion. With delayed acceptance, the proposal is
+        screened with the surrogate likelihood first and the forward model is
+        only evaluated if it passes; the second stage acceptance corrects
+        for the surrogate.
+
+        Parameters
+        ----------
+        q : :class:`numpy.ndarray`
+            proposed point
+        q0 : :class:`numpy.ndarray`
+            current point
+        l0 : list
+            output variables of the current point
+        llk_names : list
+            of names of the composite likelihoods to evaluate in blocked
+            updates, if None the full forward model is evaluated
+        hyper_only : bool
+            if True, only hyperparameters changed in the blocked update
+
+        Returns
+        -------
+        q_new : :class:`numpy.ndarray`
+        l_new : list of output variables of q_new
+        accepted : bool
+        """
+        log_surrogate_ratio = 0.
+        if self.delayed_acceptance and self.surrogate.fitted:
+            log_surrogate_ratio = self.beta * (
+                self.surrogate.predict(q) - self.surrogate.predict(q0))
+
+            self.da_proposed += 1
+            _, passed = metrop_select(log_surrogate_ratio, q, q0)
+            if not passed:
+                logger.debug('Screened: Chain_%i step_%i' % (
+                    self.chain_index, self.stage_sample))
+                self.da_screened += 1
+                return q0, l0, False
+
+        logger.debug('Calc llk: Chain_%i step_%i' % (
+            self.chain_index, self.stage_sample))
+
+        if llk_names is None and self.concurrent_composites:
+            lp = self.blocked_logp_forw(
+                q, l0, list(self._composite_llk_indexes.keys()))
+        elif llk_names is None:
+            lp = self.logp_forw(q)
+        else:
+            lp = self.blocked_logp_forw(
+                q, l0, llk_names, q0=q0, hyper_only=hyper_only)
+
+        if self.delayed_acceptance:
+            self.surrogate.add(q, lp[self._llk_index])
+
+        logger.debug('Select llk: Chain_%i step_%i' % (
+            self.chain_index, self.stage_sample))
+
+        q_new, accepted = metrop_select(
+            self.beta * (lp[self._llk_index] - l0[self._llk_index]) -
+            log_surrogate_ratio, q, q0)
+
+        logger.debug('proposed: %f previous: %f' % (
+            lp[self._llk_index], l0[self._llk_index]))
+        if accepted:
+            logger.debug('Accepted: Chain_%i step_%i' % (
+                self.chain_index, self.stage_sample))
+            self.accepted += 1
+            l_new = lp
+            self.chain_previous_lpoint[self.chain_index] = l_new
+        else:
+            logger.debug('Rejected: Chain_%i step_%i' % (
+                self.chain_index, self.stage_sample))
+            l_new = l0
+
+        return q_new, l_new, accepted
+
+    def screening_ratio(self):
+        """
+        Fraction of the proposals of the current chain that have been
+        rejected by the surrogate without forward model evaluation.
+        """
+        if self.da_proposed == 0:
+            return 0.
+
+        return self.da_screened / float(self.da_proposed)
+
     def astep(self, q0):
         if self.stage == 0:
             l_new = self.logp_forw(q0)
@@ -212,10 +605,19 @@ class Metropolis(backend.ArrayStepSharedLLK):
 
         else:
             if self.stage_sample == 0:
-                self.proposal_samples_array = self.proposal_dist(
-                    self.n_steps).astype(tconfig.floatX)
+                if self.delayed_acceptance:
+                    self.da_proposed = 0
+                    self.da_screened = 0
+                    self.surrogate.fit()
+
+                if self.adaptive:
+                    self.init_adaptation(q0)
+                else:
+                    self.proposal_samples_array = self.proposal_dist(
+                        self.n_steps).astype(tconfig.floatX)
 
-            if not self.steps_until_tune and self.tune:
+            if not self.steps_until_tune and self.tune and \
+                    not self.adaptive:
                 # Tune scaling parameter
                 logger.debug('Tuning: Chain_%i step_%i' % (
                     self.chain_index, self.stage_sample))
@@ -232,8 +634,19 @@ class Metropolis(backend.ArrayStepSharedLLK):
             logger.debug(
                 'Get delta: Chain_%i step_%i' % (
                     self.chain_index, self.stage_sample))
-            delta = self.proposal_samples_array[self.stage_sample, :] * \
-                self.scaling
+            if self.adaptive:
+                delta = num.exp(self.am_log_scaling) * self.am_chol.dot(
+                    self.proposal_samples_array[self.stage_sample, :])
+            else:
+                delta = self.proposal_samples_array[self.stage_sample, :] * \
+                    self.scaling
+
+            llk_names = None
+            hyper_only = False
+            if self.blocked_updates:
+                mask, llk_names, hyper_only = self.blocks[
+                    self.stage_sample % len(self.blocks)]
+                delta = delta * mask
 
             if self.any_discrete:
                 if self.all_discrete:
@@ -257,54 +670,19 @@ class Metropolis(backend.ArrayStepSharedLLK):
                 varlogp = self.check_bnd(q)
 
                 if num.isfinite(varlogp):
-                    logger.debug('Calc llk: Chain_%i step_%i' % (
-                        self.chain_index, self.stage_sample))
-
-                    lp = self.logp_forw(q)
-
-                    logger.debug('Select llk: Chain_%i step_%i' % (
-                        self.chain_index, self.stage_sample))
-
-                    q_new, accepted = metrop_select(
-                        self.beta * (
-                            lp[self._llk_index] - l0[self._llk_index]),
-                        q, q0)
-
-                    if accepted:
-                        logger.debug('Accepted: Chain_%i step_%i' % (
-                            self.chain_index, self.stage_sample))
-                        logger.debug('proposed: %f previous: %f' % (
-                            lp[self._llk_index], l0[self._llk_index]))
-                        self.accepted += 1
-                        l_new = lp
-                        self.chain_previous_lpoint[self.chain_index] = l_new
-                    else:
-                        logger.debug('Rejected: Chain_%i step_%i' % (
-                            self.chain_index, self.stage_sample))
-                        logger.debug('proposed: %f previous: %f' % (
-                            lp[self._llk_index], l0[self._llk_index]))
-                        l_new = l0
+                    q_new, l_new, accepted = self.select(
+                        q, q0, l0, llk_names, hyper_only)
                 else:
                     q_new = q0
                     l_new = l0
+                    accepted = False
 
             else:
-                logger.debug('Calc llk: Chain_%i step_%i' % (
-                    self.chain_index, self.stage_sample))
+                q_new, l_new, accepted = self.select(
+                    q, q0, l0, llk_names, hyper_only)
 
-                lp = self.logp_forw(q)
-                logger.debug('Select: Chain_%i step_%i' % (
-                    self.chain_index, self.stage_sample))
-                q_new, accepted = metrop_select(
-                    self.beta * (lp[self._llk_index] - l0[self._llk_index]),
-                    q, q0)
-
-                if accepted:
-                    self.accepted += 1
-                    l_new = lp
-                    self.chain_previous_lpoint[self.chain_index] = l_new
-                else:
-                    l_new = l0
+            if self.adaptive:
+                self.adapt(q_new, accepted)
 
             logger.debug(
                 'Counters: Chain_%i step_%i' % (
@@ -314,6 +692,11 @@ class Metropolis(backend.ArrayStepSharedLLK):
 
             # reset sample counter
             if self.stage_sample == self.n_steps:
+                if self.delayed_acceptance:
+                    logger.info(
+                        'Chain_%i screening ratio: %f' % (
+                            self.chain_index, self.screening_ratio()))
+
                 self.stage_sample = 0
 
             logger.debug(
@@ -363,7 +746,6 @@ def Metropolis_sample(
     # hardcoded stage here as there are no stages
     stage = 1
     model = modelcontext(model)
-    step.n_steps = int(n_steps)
 
     if n_steps < 1:
         raise TypeError('Argument `n_steps` should be above 0.', exc_info=1)
@@ -371,6 +753,8 @@ def Metropolis_sample(
     if step is None:
         raise TypeError('Argument `step` has to be a Metropolis step object.')
 
+    step.n_steps = int(n_steps)
+
     if homepath is None:
         raise TypeError(
             'Argument `homepath` should be path to result_directory.')
@@ -435,10 +819,15 @@ def Metropolis_sample(
 
         if update is not None:
             logger.info('Updating Covariances ...')
-            update.update_weights(pdict['dist_mean'], n_jobs=n_jobs)
+            n_updated = update.update_weights(
+                pdict['dist_mean'], n_jobs=n_jobs)
 
-            mtrace = update_last_samples(
-                homepath, step, progressbar, model, n_jobs, rm_flag)
+            if n_updated > 0:
+                mtrace = update_last_samples(
+                    homepath, step, progressbar, model, n_jobs, rm_flag)
+            else:
+                logger.info(
+                    'No weights changed, skipping update of last samples!')
 
         elif update is not None and stage == 0:
             update.engine.close_cashed_stores()
@@ -506,7 +895,12 @@ def get_trace_stats(mtrace, step, burn=0.5, thin=2):
     avar = array_population.var(axis=0)
     if avar.sum() == 0.:
         logger.warn('Trace std not valid not enough samples! Use 1.')
-        avar = 1.
+        cov = num.eye(step.ordering.dimensions)
+    elif getattr(step, 'adaptive', False):
+        # full covariance for the correlations of the Adaptive Metropolis
+        cov = utility.ensure_cov_psd(
+            num.atleast_2d(num.cov(array_population, rowvar=0)))
+    else:
+        cov = num.eye(step.ordering.dimensions) * avar
 
-    cov = num.eye(step.ordering.dimensions) * avar
     return d, cov
@@ -0,0 +1,515 @@
+"""
+Parallel Tempering algorithm module.
+Metropolis chains are sampled at different tempering parameters (beta)
+in persistent worker processes. After each swap interval the worker
+processes return the current chain states to the master process, which
+proposes swaps of the states between chains of neighbouring temperatures
+and adapts the spacing of the temperature ladder. Only the chain states and
+the tempering parameters are exchanged between the processes.
+"""
+
+import logging
+import traceback
+from multiprocessing import Process, Pipe
+
+import numpy as np
+from numpy.random import seed, randint
+
+from pymc3.model import modelcontext
+from tqdm import tqdm
+
+from beat import backend, parallel
+
+
+__all__ = [
+    'PT_sample',
+    'get_beta_ladder',
+    'adapt_betas',
+    'TemperedChain']
+
+
+logger = logging.getLogger('pt')
+
+
+def get_beta_ladder(n_chains, n_chains_posterior=1, tmax=100.):
+    """
+    Initialise the tempering parameters (beta = 1 / temperature) of the
+    chains with geometric spacing of the temperatures.
+
+    Parameters
+    ----------
+    n_chains : int
+        total number of chains
+    n_chains_posterior : int
+        number of chains at beta = 1. that sample the posterior
+    tmax : float
+        temperature of the hottest chain
+
+    Returns
+    -------
+    :class:`numpy.ndarray` of betas, decreasing with chain index
+    """
+    if n_chains_posterior < 1 or n_chains_posterior > n_chains:
+        raise ValueError(
+            'Number of posterior chains has to be between 1 and the number'
+            ' of chains: %i' % n_chains)
+
+    if tmax <= 1.:
+        raise ValueError('Maximum temperature has to be larger than 1.!')
+
+    n_hot = n_chains - n_chains_posterior
+    betas = np.ones(n_chains)
+    betas[n_chains_posterior:] = 1. / np.logspace(
+        0., np.log10(tmax), n_hot + 1)[1:]
+    return betas
+
+
+def adapt_betas(
+        betas, swap_accepted, n_chains_posterior, t, nu=100., t0=1000.):
+    """
+    Adapt the spacing of the temperatures of the tempered chains towards
+    equal swap acceptance rates between neighbouring chains after
+    [Vousden2016]_. The temperatures of the posterior chains and of the
+    hottest chain are fixed.
+
+    Parameters
+    ----------
+    betas : :class:`numpy.ndarray`
+        current tempering parameters, decreasing with chain index
+    swap_accepted : :class:`numpy.ndarray`
+        of the swaps between the chains n_chains_posterior - 1 + i and
+        n_chains_posterior + i, 1. if accepted, 0. if rejected
+    n_chains_posterior : int
+        number of chains at beta = 1.
+    t : int
+        number of the current adaptation step
+    nu : float
+        inverse initial amplitude of the adaptation
+    t0 : float
+        decay timescale of the adaptation
+
+    Returns
+    -------
+    :class:`numpy.ndarray` of adapted betas
+
+    References
+    ----------
+    .. [Vousden2016] Vousden, W. D. and Farr, W. M. and Mandel, I. (2016).
+        Dynamic temperature selection for parallel tempering in Markov chain
+        Monte Carlo simulations. Monthly Notices of the Royal Astronomical
+        Society, 455(2), pp. 1919-1937.
+    """
+    temps = 1. / betas[n_chains_posterior - 1:]
+    gaps = np.diff(temps)
+    if gaps.size < 2:
+        return betas
+
+    kappa = 1. / nu * t0 / (t + t0)
+    gaps *= np.exp(kappa * (swap_accepted - swap_accepted.mean()))
+    gaps *= (temps[-1] - temps[0]) / gaps.sum()
+
+    new_betas = betas.copy()
+    new_betas[n_chains_posterior:-1] = 1. / (temps[0] + np.cumsum(gaps[:-1]))
+    return new_betas
+
+
+class TemperedChain(object):
+    """
+    Metropolis chain at a tempering parameter that is set for each swap
+    interval. The step object is shared by all the chains of a worker
+    process, the tuning state of the step size is kept for each chain.
+
+    Parameters
+    ----------
+    step : :class:`beat.sampler.Metropolis`
+    chain : int
+        chain index
+    trace : :class:`beat.backend.TextChain`
+        if given, all the samples of the chain are recorded
+    draws : int
+        number of samples to be recorded
+    buffer_size : int
+        number of samples to keep in memory before writing to disk
+    """
+
+    _tuning_attributes = ['scaling', 'accepted', 'steps_until_tune']
+
+    def __init__(self, step, chain, trace=None, draws=0, buffer_size=5000):
+        self.step = step
+        self.chain = chain
+        self.trace = trace
+        self.draws = draws
+        self.buffer_size = buffer_size
+        self.n_recorded = 0
+        self.tuning_state = {
+            attr: getattr(step, attr) for attr in self._tuning_attributes}
+
+    def setup(self):
+        if self.trace is not None:
+            self.trace.setup(
+                self.draws, self.chain, buffer_size=self.buffer_size)
+
+    def sample(self, beta, n_steps, q, lpoint=None):
+        """
+        Sample the chain for n_steps at given beta starting from q.
+
+        Parameters
+        ----------
+        beta : float
+            tempering parameter
+        n_steps : int
+            number of Metropolis steps
+        q : :class:`numpy.ndarray`
+            starting point of the chain
+        lpoint : list
+            output variables of the starting point, if None they are
+            calculated
+
+        Returns
+        -------
+        q : :class:`numpy.ndarray` last point of the chain
+        lpoint : list of output variables of the last point
+        n_accepted : int number of accepted steps
+        """
+        step = self.step
+        step.apply_sampler_state(self.tuning_state)
+        step.beta = beta
+        step.n_steps = n_steps
+        step.stage_sample = 0
+        step.chain_index = self.chain
+
+        if lpoint is None:
+            lpoint = step.logp_forw(q)
+
+        step.chain_previous_lpoint[self.chain] = lpoint
+
+        n_accepted = 0
+        for _ in range(n_steps):
+            q_new, lpoint = step.astep(q)
+            if q_new is not q:
+                n_accepted += 1
+
+            q = q_new
+            if self.trace is not None:
+                self.trace.write(lpoint, self.n_recorded)
+                self.n_recorded += 1
+
+        self.tuning_state = {
+            attr: getattr(step, attr) for attr in self._tuning_attributes}
+        return q, lpoint, n_accepted
+
+    def finish(self):
+        if self.trace is not None:
+            self.trace.record_buffer()
+
+
+def _pt_worker(conn, chains, random_seed):
+    """
+    Worker process loop, samples the tempered chains for the work packages
+    received from the master process until receiving None.
+    """
+    seed(random_seed)
+
+    step = list(chains.values())[0].step
+    shared_params = [
+        sparam for sparam in step.logp_forw.get_shared()
+        if sparam.name in parallel._tobememshared]
+
+    if len(shared_params) > 0:
+        logger.debug('Accessing shared memory')
+        parallel.borrow_all_memories(
+            shared_params, parallel._shared_memory.values())
+
+    try:
+        for tchain in chains.values():
+            tchain.setup()
+
+        while True:
+            work = conn.recv()
+            if work is None:
+                break
+
+            conn.send({
+                chain: chains[chain].sample(*args)
+                for chain, args in work.items()})
+
+    except Exception:
+        conn.send(RuntimeError(
+            'Exception in worker process:\n%s' % traceback.format_exc()))
+
+    finally:
+        for tchain in chains.values():
+            tchain.finish()
+
+        conn.close()
+
+
+class TemperingWorkers(object):
+    """
+    Distributes the tempered chains to n_jobs persistent worker processes
+    and exchanges the work packages and chain states through pipes.
+    For n_jobs = 1 the chains are sampled in the master process.
+
+    Parameters
+    ----------
+    tempered_chains : list
+        of :class:`TemperedChain`
+    n_jobs : int
+        number of worker processes
+    """
+
+    def __init__(self, tempered_chains, n_jobs=1):
+        self.n_jobs = n_jobs
+        self.chains = {tchain.chain: tchain for tchain in tempered_chains}
+        self.processes = []
+        self.conns = []
+
+        if self.n_jobs == 1:
+            for tchain in tempered_chains:
+                tchain.setup()
+        else:
+            max_int = np.iinfo(np.int32).max
+            for i in range(self.n_jobs):
+                worker_chains = {
+                    tchain.chain: tchain
+                    for tchain in tempered_chains[i::self.n_jobs]}
+                parent_conn, child_conn = Pipe()
+                process = Process(
+                    target=_pt_worker,
+                    args=(child_conn, worker_chains, randint(max_int)))
+                process.daemon = True
+                process.start()
+                child_conn.close()
+
+                self.processes.append(process)
+                self.conns.append((parent_conn, list(worker_chains.keys())))
+
+    def sample(self, work):
+        """
+        Sample the tempered chains.
+
+        Parameters
+        ----------
+        work : dict
+            chain index: (beta, n_steps, q, lpoint)
+
+        Returns
+        -------
+        dict of chain index: (q, lpoint, n_accepted)
+        """
+        if self.n_jobs == 1:
+            return {
+                chain: self.chains[chain].sample(*args)
+                for chain, args in work.items()}
+
+        for conn, chains in self.conns:
+            conn.send({chain: work[chain] for chain in chains})
+
+        results = {}
+        for (conn, _), process in zip(self.conns, self.processes):
+            while not conn.poll(1.):
+                if not process.is_alive():
+                    self.close()
+                    raise RuntimeError(
+                        'Worker process %s died!' % process.name)
+
+            result = conn.recv()
+            if isinstance(result, Exception):
+                self.close()
+                raise result
+
+            results.update(result)
+
+        return results
+
+    def close(self):
+        if self.n_jobs == 1:
+            for tchain in self.chains.values():
+                tchain.finish()
+        else:
+            for (conn, _), process in zip(self.conns, self.processes):
+                if process.is_alive():
+                    try:
+                        conn.send(None)
+                    except (IOError, EOFError):
+                        pass
+
+                process.join()
+                conn.close()
+
+            self.processes = []
+            self.conns = []
+
+
+def PT_sample(
+        step, n_chains, n_samples=100000, swap_interval=100,
+        n_chains_posterior=1, tmax=100., adapt=True, homepath=None,
+        progressbar=True, buffer_size=5000, model=None, n_jobs=1,
+        rm_flag=False, start=None):
+    """
+    Parallel Tempering algorithm
+
+    Samples n_chains Metropolis chains at a ladder of tempering parameters
+    (beta) in parallel. After each swap interval swaps of the states of
+    chains at neighbouring temperatures are proposed, from the hottest to
+    the coldest chains. The n_chains_posterior chains at beta = 1. sample
+    the posterior and are recorded in the final stage, all samples of these
+    chains are written.
+
+    Parameters
+    ----------
+    step : :class:`beat.sampler.Metropolis`
+        sampler object with n_chains
+    n_chains : int
+        number of chains of the temperature ladder
+    n_samples : int
+        number of samples of each posterior chain
+    swap_interval : int
+        number of Metropolis steps between swap proposals
+    n_chains_posterior : int
+        number of chains at beta = 1.
+    tmax : float
+        temperature of the hottest chain
+    adapt : bool
+        flag for adapting the temperature spacing of the tempered chains
+        towards equal swap acceptance rates
+    homepath : string
+        result folder for storing the final stage
+    progressbar : bool
+        flag for displaying a progressbar
+    buffer_size : int
+        number of samples to keep in memory before writing to disk
+    model : :class:`pymc3.Model`
+        (optional if in `with` context)
+    n_jobs : int
+        number of worker processes
+    rm_flag : bool
+        if True existing results are deleted prior to sampling
+    start : list
+        of point dictionaries with length of n_chains, starting points of
+        the chains, defaults to random draws from the priors
+    """
+
+    model = modelcontext(model)
+
+    if homepath is None:
+        raise TypeError(
+            'Argument `homepath` should be path to result_directory.')
+
+    if step.n_chains != n_chains:
+        raise ValueError(
+            'Step object has %i chains, PT needs %i!' % (
+                step.n_chains, n_chains))
+
+    if n_jobs > n_chains:
+        raise ValueError('n_jobs has to be smaller or equal to n_chains!')
+
+    if start is not None:
+        if len(start) != n_chains:
+            raise ValueError(
+                'Argument `start` should have dicts equal the number of'
+                ' chains (n_chains)')
+        else:
+            step.population = start
+
+    if not any(
+            step.likelihood_name in var.name for var in model.deterministics):
+            raise TypeError('Model (deterministic) variables need to contain '
+                            'a variable %s '
+                            'as defined in `step`.' % step.likelihood_name)
+
+    stage_handler = backend.TextStage(homepath)
+    stage_handler.clean_directory(-1, None, rm_flag)
+    stage_path = stage_handler.stage_path(-1)
+
+    betas = get_beta_ladder(n_chains, n_chains_posterior, tmax)
+    logger.info('Initial beta ladder: %s' % betas)
+
+    step.stage = 1
+    step.n_steps = swap_interval
+
+    with model:
+        tempered_chains = []
+        for chain in range(n_chains):
+            if chain < n_chains_posterior:
+                trace = backend.TextChain(stage_path, model=model)
+            else:
+                trace = None
+
+            tempered_chains.append(
+                TemperedChain(
+                    step, chain, trace=trace, draws=n_samples,
+                    buffer_size=buffer_size))
+
+    if n_jobs > 1:
+        shared_params = [
+            sparam for sparam in step.logp_forw.get_shared()
+            if sparam.name in parallel._tobememshared]
+
+        if len(shared_params) > 0 and \
+                len(parallel._shared_memory.keys()) == 0:
+            logger.info('Putting data into shared memory ...')
+            parallel.memshare_sparams(shared_params)
+
+    states = [[step.bij.map(point), None] for point in step.population]
+
+    n_hot = n_chains - n_chains_posterior
+    swaps_proposed = np.zeros(n_hot)
+    swaps_accepted = np.zeros(n_hot)
+
+    n_rounds = int(np.ceil(float(n_samples) / swap_interval))
+    rounds = range(n_rounds)
+    if progressbar:
+        rounds = tqdm(rounds, total=n_rounds, desc='PT swap rounds')
+
+    logger.info(
+        'Sampling %i chains on %i worker(s) ...' % (n_chains, n_jobs))
+    workers = TemperingWorkers(tempered_chains, n_jobs=n_jobs)
+    try:
+        for r in rounds:
+            n_steps = min(swap_interval, n_samples - r * swap_interval)
+            results = workers.sample({
+                chain: (betas[chain], n_steps, q, lpoint)
+                for chain, (q, lpoint) in enumerate(states)})
+
+            for chain, (q, lpoint, _) in results.items():
+                states[chain] = [q, lpoint]
+
+            swap_accepted = np.zeros(n_hot)
+            for i in range(n_hot - 1, -1, -1):
+                if i == 0:
+                    lower = randint(n_chains_posterior)
+                else:
+                    lower = n_chains_posterior - 1 + i
+
+                upper = n_chains_posterior + i
+                log_alpha = (betas[lower] - betas[upper]) * (
+                    states[upper][1][step._llk_index] -
+                    states[lower][1][step._llk_index])
+
+                swaps_proposed[i] += 1
+                if np.log(np.random.rand()) < log_alpha:
+                    states[lower], states[upper] = \
+                        states[upper], states[lower]
+                    swap_accepted[i] = 1.
+                    swaps_accepted[i] += 1
+
+            if adapt:
+                betas = adapt_betas(
+                    betas, swap_accepted, n_chains_posterior, t=r)
+
+            logger.debug('Swap round %i, betas: %s' % (r, betas))
+    finally:
+        workers.close()
+
+    step.betas = betas
+    step.swap_acceptance_rates = swaps_accepted / swaps_proposed
+    step.n_steps = n_samples
+    step.stage = -1
+
+    logger.info('Final beta ladder: %s' % betas)
+    logger.info('Swap acceptance rates: %s' % step.swap_acceptance_rates)
+
+    outparam_list = [step.get_sampler_state(), None]
+    stage_handler.dump_atmip_params(-1, outparam_list)
+    logger.info('Finished sampling!')
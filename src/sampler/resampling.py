@@ -0,0 +1,205 @@
+"""
+Resampling module for the SMC sampler. Provides vectorized resampling
+schemes of particles (chains) based on their importance weights.
+
+References
+----------
+.. [Douc2005] Douc, R. and Cappe, O. and Moulines, E. (2005).
+    Comparison of resampling schemes for particle filtering.
+    Proceedings of the 4th International Symposium on Image and Signal
+    Processing and Analysis, pp. 64-69.
+"""
+
+import logging
+
+import numpy as np
+
+
+__all__ = [
+    'resampling_catalog',
+    'resample',
+    'effective_sample_size',
+    'parents2children']
+
+
+logger = logging.getLogger('resampling')
+
+
+def _cumulative_weights(weights):
+    """
+    Cumulative sum of the weights, last element set to one to prevent
+    index overflow due to round-off errors.
+    """
+    cum_dist = np.cumsum(weights)
+    cum_dist /= cum_dist[-1]
+    cum_dist[-1] = 1.
+    return cum_dist
+
+
+def multinomial_resampling(weights, n_samples=None):
+    """
+    Draw n_samples indexes independently from the categorical distribution
+    defined by the weights.
+
+    Parameters
+    ----------
+    weights : :class:`numpy.ndarray`
+        normalised importance weights
+    n_samples : int
+        number of indexes to draw, default: number of weights
+
+    Returns
+    -------
+    :class:`numpy.ndarray` of int, indexes to the parents
+    """
+    if n_samples is None:
+        n_samples = weights.size
+
+    positions = np.sort(np.random.rand(n_samples))
+    return np.searchsorted(_cumulative_weights(weights), positions)
+
+
+def stratified_resampling(weights, n_samples=None):
+    """
+    Draw one uniform random position in each of n_samples equal strata of
+    the cumulative weights.
+
+    Parameters
+    ----------
+    weights : :class:`numpy.ndarray`
+        normalised importance weights
+    n_samples : int
+        number of indexes to draw, default: number of weights
+
+    Returns
+    -------
+    :class:`numpy.ndarray` of int, indexes to the parents
+    """
+    if n_samples is None:
+        n_samples = weights.size
+
+    positions = (np.arange(n_samples) + np.random.rand(n_samples)) / \
+        n_samples
+    return np.searchsorted(_cumulative_weights(weights), positions)
+
+
+def systematic_resampling(weights, n_samples=None):
+    """
+    Kitagawa's deterministic resampling, with one uniform random offset
+    that is shared by n_samples equal strata of the cumulative weights.
+
+    Parameters
+    ----------
+    weights : :class:`numpy.ndarray`
+        normalised importance weights
+    n_samples : int
+        number of indexes to draw, default: number of weights
+
+    Returns
+    -------
+    :class:`numpy.ndarray` of int, indexes to the parents
+    """
+    if n_samples is None:
+        n_samples = weights.size
+
+    positions = (np.arange(n_samples) + np.random.rand(1)) / n_samples
+    return np.searchsorted(_cumulative_weights(weights), positions)
+
+
+def residual_resampling(weights, n_samples=None):
+    """
+    Deterministically copy each parent floor(n_samples * weight) times,
+    the remaining indexes are drawn from the residual weights with
+    systematic resampling.
+
+    Parameters
+    ----------
+    weights : :class:`numpy.ndarray`
+        normalised importance weights
+    n_samples : int
+        number of indexes to draw, default: number of weights
+
+    Returns
+    -------
+    :class:`numpy.ndarray` of int, indexes to the parents
+    """
+    if n_samples is None:
+        n_samples = weights.size
+
+    n_copies = np.floor(n_samples * weights).astype(int)
+    outindex = np.repeat(np.arange(weights.size), n_copies)
+
+    n_residual = n_samples - n_copies.sum()
+    if n_residual > 0:
+        residuals = n_samples * weights - n_copies
+        outindex = np.concatenate(
+            (outindex, systematic_resampling(
+                residuals / residuals.sum(), n_residual)))
+
+    return np.sort(outindex)
+
+
+resampling_catalog = {
+    'multinomial': multinomial_resampling,
+    'stratified': stratified_resampling,
+    'systematic': systematic_resampling,
+    'residual': residual_resampling}
+
+
+def resample(weights, method='systematic'):
+    """
+    Resample particles based on their importance weights.
+
+    Parameters
+    ----------
+    weights : :class:`numpy.ndarray`
+        normalised importance weights
+    method : str
+        name of the resampling scheme, see `resampling_catalog`
+
+    Returns
+    -------
+    :class:`numpy.ndarray` of int, index to the parent of each particle
+    """
+    try:
+        resampler = resampling_catalog[method]
+    except KeyError:
+        raise ValueError(
+            'Resampling method "%s" not implemented! Options: %s' % (
+                method, ', '.join(resampling_catalog.keys())))
+
+    return resampler(np.asarray(weights, dtype=np.float64))
+
+
+def effective_sample_size(weights):
+    """
+    Effective sample size of normalised importance weights.
+
+    Parameters
+    ----------
+    weights : :class:`numpy.ndarray`
+        normalised importance weights
+
+    Returns
+    -------
+    float
+    """
+    return 1. / np.sum(weights ** 2)
+
+
+def parents2children(parents):
+    """
+    Get the mapping of each parent to its children after resampling.
+
+    Parameters
+    ----------
+    parents : :class:`numpy.ndarray` of int
+        index to the parent of each particle
+
+    Returns
+    -------
+    dict of parent index: :class:`numpy.ndarray` of children indexes
+    """
+    order = np.argsort(parents, kind='mergesort')
+    uparents, starts = np.unique(parents[order], return_index=True)
+    return dict(zip(uparents, np.split(order, starts[1:])))
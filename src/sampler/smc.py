@@ -15,10 +15,13 @@ Various significant updates July, August 2016
 import numpy as np
 
 import logging
+from time import time
+from collections import OrderedDict
 
 from pymc3.model import modelcontext
 
 from beat import backend, utility
+from . import resampling
 from .base import iter_parallel_chains, update_last_samples, init_stage, \
     choose_proposal
 from .metropolis import Metropolis
@@ -32,6 +35,22 @@ __all__ = [
 logger = logging.getLogger('smc')
 
 
+def log_sum_exp(x):
+    """
+    Numerically stable calculation of log(sum(exp(x))).
+
+    Parameters
+    ----------
+    x : :class:`numpy.ndarray`
+
+    Returns
+    -------
+    float
+    """
+    xmax = x.max()
+    return xmax + np.log(np.sum(np.exp(x - xmax)))
+
+
 class SMC(Metropolis):
     """
     Adaptive Transitional Markov-Chain Monte-Carlo sampler class.
@@ -69,6 +88,19 @@ class SMC(Metropolis):
         from stage to stage, i.e.indirectly the number of stages,
         low coef_variation --> slow beta change,
         results in many stages and vice verca (default: 1.)
+    target_ess : scalar, float
+        Target effective sample size as fraction [0., 1.] of n_chains,
+        determines the change of beta from stage to stage instead of the
+        coef_variation if larger than zero (default: 0.)
+    resampling_method : str
+        Name of the resampling scheme, see
+        :data:`resampling.resampling_catalog` (default: 'systematic')
+    resampling_threshold : scalar, float
+        Resample only if the effective sample size of the importance weights
+        drops below this fraction [0., 1.] of n_chains, otherwise the
+        weights are carried over to the next stage. The default (1.)
+        resamples every stage. Ignored if the target_ess is used, then it
+        resamples every stage.
     check_bound : boolean
         Check if current sample lies outside of variable definition
         speeds up computation as the forward model wont be executed
@@ -93,7 +125,9 @@ class SMC(Metropolis):
                  n_chains=100, tune=True, tune_interval=100, model=None,
                  check_bound=True, likelihood_name='like',
                  proposal_name='MultivariateNormal',
-                 coef_variation=1., **kwargs):
+                 coef_variation=1., target_ess=0.,
+                 resampling_method='systematic', resampling_threshold=1.,
+                 **kwargs):
 
         super(SMC, self).__init__(
             vars=vars, out_vars=out_vars, covariance=covariance, scale=scale,
@@ -105,8 +139,24 @@ class SMC(Metropolis):
         self.beta = 0
 
         self.coef_variation = coef_variation
+        self.target_ess = target_ess
         self.likelihoods = np.zeros(n_chains)
 
+        if resampling_method not in resampling.resampling_catalog:
+            raise ValueError(
+                'Resampling method "%s" not implemented! Options: %s' % (
+                    resampling_method,
+                    ', '.join(resampling.resampling_catalog.keys())))
+
+        self.resampling_method = resampling_method
+        self.resampling_threshold = resampling_threshold
+        self.log_chain_weights = np.ones(n_chains) * -np.log(n_chains)
+
+        self.log_evidence = 0.
+        self.acceptance_rate = None
+        self.autocorrelation = None
+        self.stage_statistics = []
+
     def _sampler_state_blacklist(self):
         """
         Returns sampler attributes that are not saved.
@@ -116,11 +166,68 @@ class SMC(Metropolis):
               'likelihoods',
               'check_bnd',
               'logp_forw',
+              'composite_logp_forw',
+              'composite_llks',
+              'hyper_datasets',
               'proposal_samples_array',
+              'surrogate',
               'vars',
               '_BlockedStep__newargs']
         return bl
 
+    def calc_weights(self, delta_beta):
+        """
+        Calculate normalised importance weights of the current sample
+        likelihoods for a change in the tempering parameter, including the
+        weights carried over from stages that have not been resampled.
+
+        Parameters
+        ----------
+        delta_beta : scalar, float
+            change of the tempering parameter
+
+        Returns
+        -------
+        weights : :class:`numpy.ndarray`
+            Importance weights (floats)
+        """
+        log_weights = self.log_chain_weights + delta_beta * self.likelihoods
+        return np.exp(log_weights - log_sum_exp(log_weights))
+
+    def calc_ess(self, delta_beta):
+        """
+        Calculate the effective sample size of the importance weights for
+        a change in the tempering parameter.
+
+        Parameters
+        ----------
+        delta_beta : scalar, float
+            change of the tempering parameter
+
+        Returns
+        -------
+        float, effective sample size
+        """
+        return resampling.effective_sample_size(
+            self.calc_weights(delta_beta))
+
+    def calc_log_evidence_increment(self, delta_beta):
+        """
+        Calculate the increment of the logarithm of the marginal likelihood
+        (evidence) for a change in the tempering parameter.
+
+        Parameters
+        ----------
+        delta_beta : scalar, float
+            change of the tempering parameter
+
+        Returns
+        -------
+        float
+        """
+        return log_sum_exp(
+            self.log_chain_weights + delta_beta * self.likelihoods)
+
     def calc_beta(self):
         """
         Calculate next tempering beta and importance weights based on
@@ -136,25 +243,140 @@ class SMC(Metropolis):
             Importance weights (floats)
         """
 
-        low_beta = self.beta
-        up_beta = 2.
         old_beta = self.beta
 
-        while up_beta - low_beta > 1e-6:
-            current_beta = (low_beta + up_beta) / 2.
-            temp = np.exp(
-                (current_beta - self.beta) *
-                (self.likelihoods - self.likelihoods.max()))
-            cov_temp = np.std(temp) / np.mean(temp)
-            if cov_temp > self.coef_variation:
-                up_beta = current_beta
+        if self.target_ess > 0.:
+            n_target = self.target_ess * self.n_chains
+            low_beta = self.beta
+            up_beta = 1.
+
+            if self.calc_ess(up_beta - self.beta) >= n_target:
+                current_beta = up_beta
             else:
-                low_beta = current_beta
+                while up_beta - low_beta > 1e-6:
+                    current_beta = (low_beta + up_beta) / 2.
+                    ess = self.calc_ess(current_beta - self.beta)
+                    if ess < n_target:
+                        up_beta = current_beta
+                    else:
+                        low_beta = current_beta
+
+        else:
+            low_beta = self.beta
+            up_beta = 2.
+
+            while up_beta - low_beta > 1e-6:
+                current_beta = (low_beta + up_beta) / 2.
+                temp = self.calc_weights(current_beta - self.beta)
+                cov_temp = np.std(temp) / np.mean(temp)
+                if cov_temp > self.coef_variation:
+                    up_beta = current_beta
+                else:
+                    low_beta = current_beta
 
         beta = current_beta
-        weights = temp / np.sum(temp)
+        weights = self.calc_weights(beta - self.beta)
         return beta, old_beta, weights
 
+    def update_chain_statistics(self, mtrace):
+        """
+        Update the acceptance rate and the mean lag-one autocorrelation of
+        the sampled chains.
+
+        Parameters
+        ----------
+        mtrace : :class:`pymc3.backend.base.MultiTrace`
+        """
+        n_steps = len(mtrace)
+        if n_steps < 2:
+            return
+
+        n_chains = len(mtrace.chains)
+        samples = np.zeros((n_chains, n_steps, self.ordering.size))
+
+        for var, slc, shp, _ in self.ordering.vmap:
+            chain_values = mtrace.get_values(
+                varname=var, combine=False, squeeze=False)
+
+            for i, values in enumerate(chain_values):
+                samples[i, :, slc] = values.reshape((n_steps, -1))
+
+        moved = np.any(np.diff(samples, axis=1) != 0., axis=2)
+        self.acceptance_rate = moved.mean()
+
+        dev = samples - samples.mean(axis=1)[:, np.newaxis, :]
+        variance = (dev ** 2).sum(axis=1)
+        valid = variance > 0.
+        if valid.any():
+            lag_cov = (dev[:, 1:, :] * dev[:, :-1, :]).sum(axis=1)
+            self.autocorrelation = (lag_cov[valid] / variance[valid]).mean()
+        else:
+            self.autocorrelation = 1.
+
+        logger.info(
+            'Acceptance rate: %f, lag-one autocorrelation: %f' % (
+                self.acceptance_rate, self.autocorrelation))
+
+    def adapt_n_steps(self, max_steps, min_steps=10, p_move=0.99):
+        """
+        Estimate the number of steps for the next stage from the acceptance
+        rate and the autocorrelation of the chains of the current stage.
+
+        Parameters
+        ----------
+        max_steps : int
+            maximum number of steps
+        min_steps : int
+            minimum number of steps
+        p_move : float
+            probability for each chain to move at least once
+
+        Returns
+        -------
+        int, number of steps
+        """
+        if self.acceptance_rate is None:
+            return max_steps
+
+        acc_rate = np.clip(self.acceptance_rate, 1e-6, 1. - 1e-6)
+        n_acc = np.log(1. - p_move) / np.log(1. - acc_rate)
+
+        rho = np.clip(self.autocorrelation, -0.99, 0.99)
+        n_corr = (1. + rho) / (1. - rho)
+
+        n_steps = int(np.ceil(max(n_acc, n_corr)))
+        return int(np.clip(n_steps, min(min_steps, max_steps), max_steps))
+
+    def record_stage_statistics(self, delta_beta, draws):
+        """
+        Update log-evidence and record tempering statistics of the current
+        stage.
+
+        Parameters
+        ----------
+        delta_beta : scalar, float
+            change of the tempering parameter
+        draws : int
+            number of steps that have been sampled in the stage
+        """
+        log_ev_inc = self.calc_log_evidence_increment(delta_beta)
+        self.log_evidence += log_ev_inc
+
+        stats = OrderedDict([
+            ('stage', self.stage),
+            ('beta', self.beta),
+            ('ess', resampling.effective_sample_size(self.weights)),
+            ('log_evidence_increment', log_ev_inc),
+            ('log_evidence', self.log_evidence),
+            ('n_steps', draws),
+            ('acceptance_rate', self.acceptance_rate),
+            ('autocorrelation', self.autocorrelation)])
+
+        logger.info(
+            'Stage statistics: %s' % ', '.join(
+                '%s: %s' % (k, v) for k, v in stats.items()))
+        self.stage_statistics.append(stats)
+
     def calc_covariance(self):
         """
         Calculate trace covariance matrix based on importance weights.
@@ -230,6 +452,8 @@ class SMC(Metropolis):
         """
         Read trace results and take end points for each chain and set as
         previous chain result for comparison of metropolis select.
+        Only the end points of the resampling parents are loaded and mapped,
+        children of the same parent share the parents lpoint.
 
         Parameters
         ----------
@@ -241,8 +465,11 @@ class SMC(Metropolis):
             all unobservedRV values, including dataset likelihoods
         """
 
+        children = resampling.parents2children(self.resampling_indexes)
+        parents = sorted(children.keys())
+
         array_population = np.zeros(
-            (self.n_chains, self.lordering.size))
+            (len(parents), self.lordering.size))
 
         n_steps = len(mtrace)
 
@@ -251,19 +478,21 @@ class SMC(Metropolis):
             slc_population = mtrace.get_values(
                 varname=var,
                 burn=n_steps - 1,
-                combine=True)
+                combine=True,
+                chains=parents)
 
             if len(shp) == 0:
                 array_population[:, slc] = np.atleast_2d(slc_population).T
             else:
                 array_population[:, slc] = slc_population
 
-        chain_previous_lpoint = []
+        chain_previous_lpoint = [None] * self.n_chains
 
         # map end array_endpoints to list lpoints and apply resampling
-        for r_idx in self.resampling_indexes:
-            chain_previous_lpoint.append(
-                self.lij.rmap(array_population[r_idx, :]))
+        for i, parent in enumerate(parents):
+            lpoint = self.lij.rmap(array_population[i, :])
+            for child in children[parent]:
+                chain_previous_lpoint[child] = lpoint
 
         return chain_previous_lpoint
 
@@ -278,41 +507,45 @@ class SMC(Metropolis):
 
         return self.bij.rmap(self.array_population.mean(axis=0))
 
-    def resample(self):
+    def resample(self, force=False):
         """
-        Resample pdf based on importance weights.
-        based on Kitagawas deterministic resampling algorithm.
+        Resample pdf based on importance weights with the resampling scheme
+        defined in `resampling_method`. Resampling is skipped if the
+        effective sample size is above the `resampling_threshold`, then the
+        importance weights are carried over to the next stage. If the
+        `target_ess` determines the beta steps it always resamples.
+
+        Parameters
+        ----------
+        force : bool
+            If True, resample regardless of the effective sample size
 
         Returns
         -------
         outindex : :class:`numpy.ndarray`
-            Array of resampled trace indexes
+            Array of resampled trace indexes, i.e. the parent of each chain
         """
 
-        parents = np.arange(self.n_chains)
-        N_childs = np.zeros(self.n_chains, dtype=int)
-
-        cum_dist = np.cumsum(self.weights)
-        aux = np.random.rand(1)
-        u = parents + aux
-        u /= self.n_chains
-        j = 0
-        for i in parents:
-            while u[i] > cum_dist[j]:
-                j += 1
+        ess = resampling.effective_sample_size(self.weights)
 
-            N_childs[j] += 1
+        # the beta step brings the ess down to the target_ess, carried
+        # weights would leave no room for the beta step of the next stage
+        if self.target_ess > 0.:
+            force = True
 
-        indx = 0
-        outindx = np.zeros(self.n_chains, dtype=int)
-        for i in parents:
-            if N_childs[i] > 0:
-                for j in range(indx, (indx + N_childs[i])):
-                    outindx[j] = parents[i]
+        if not force and ess >= self.resampling_threshold * self.n_chains:
+            logger.info(
+                'Effective sample size %f above threshold, skipping '
+                'resampling' % ess)
+            with np.errstate(divide='ignore'):
+                self.log_chain_weights = np.log(self.weights)
 
-            indx += N_childs[i]
+            return np.arange(self.n_chains)
 
-        return outindx
+        self.log_chain_weights = np.ones(self.n_chains) * \
+            -np.log(self.n_chains)
+        return resampling.resample(
+            self.weights, method=self.resampling_method)
 
     def __getstate__(self):
         return self.__dict__
@@ -324,7 +557,8 @@ class SMC(Metropolis):
 def ATMIP_sample(
         n_steps, step=None, start=None, homepath=None, chain=0,
         stage=0, n_jobs=1, tune=None, progressbar=False,
-        model=None, update=None, random_seed=None, rm_flag=False):
+        model=None, update=None, random_seed=None, rm_flag=False,
+        adapt_n_steps=False):
     """
     (C)ATMIP sampling algorithm
     (Cascading - (C) not always relevant)
@@ -380,6 +614,10 @@ def ATMIP_sample(
     rm_flag : bool
         If True existing stage result folders are being deleted prior to
         sampling.
+    adapt_n_steps : bool
+        If True the number of steps of the next stage is estimated from the
+        acceptance rate and autocorrelation of the current stage, where
+        n_steps is the upper limit.
 
     References
     ----------
@@ -391,7 +629,6 @@ def ATMIP_sample(
     """
 
     model = modelcontext(model)
-    step.n_steps = int(n_steps)
 
     if n_steps < 1:
         raise TypeError('Argument `n_steps` should be above 0.', exc_info=1)
@@ -399,6 +636,8 @@ def ATMIP_sample(
     if step is None:
         raise TypeError('Argument `step` has to be a SMC step object.')
 
+    step.n_steps = int(n_steps)
+
     if homepath is None:
         raise TypeError(
             'Argument `homepath` should be path to result_directory.')
@@ -431,6 +670,9 @@ def ATMIP_sample(
         model=model,
         rm_flag=rm_flag)
 
+    # time of the last re-evaluation of the stage end-points
+    t_last_update = 0.
+
     with model:
         while step.beta < 1.:
             if step.stage == 0:
@@ -438,7 +680,7 @@ def ATMIP_sample(
                 logger.info('Sample initial stage: ...')
                 draws = 1
             else:
-                draws = n_steps
+                draws = step.n_steps
 
             logger.info('Beta: %f Stage: %i' % (step.beta, step.stage))
 
@@ -459,19 +701,28 @@ def ATMIP_sample(
             step.population, step.array_population, step.likelihoods = \
                 step.select_end_points(mtrace)
 
+            step.update_chain_statistics(mtrace)
+
             if update is not None:
                 logger.info('Updating Covariances ...')
                 mean_pt = step.mean_end_points()
-                update.update_weights(mean_pt, n_jobs=n_jobs)
-                mtrace = update_last_samples(
-                    homepath, step, progressbar, model, n_jobs, rm_flag)
-                step.population, step.array_population, step.likelihoods = \
-                    step.select_end_points(mtrace)
+                n_updated = update.update_weights(mean_pt, n_jobs=n_jobs)
+                if n_updated > 0:
+                    t0 = time()
+                    mtrace = update_last_samples(
+                        homepath, step, progressbar, model, n_jobs, rm_flag)
+                    step.population, step.array_population, \
+                        step.likelihoods = step.select_end_points(mtrace)
+                    t_last_update = time() - t0
+                else:
+                    logger.info(
+                        'No weights changed, skipping update of last'
+                        ' samples, time saved: %f [s]' % t_last_update)
 
             step.beta, step.old_beta, step.weights = step.calc_beta()
 
-            if step.beta > 1.:
-                logger.info('Beta > 1.: %f' % step.beta)
+            if step.beta >= 1.:
+                logger.info('Beta >= 1.: %f' % step.beta)
                 step.beta = 1.
                 outparam_list = [step.get_sampler_state(), update]
                 stage_handler.dump_atmip_params(step.stage, outparam_list)
@@ -480,6 +731,14 @@ def ATMIP_sample(
                 else:
                     chains = None
             else:
+                step.record_stage_statistics(
+                    step.beta - step.old_beta, draws)
+
+                if adapt_n_steps:
+                    step.n_steps = step.adapt_n_steps(max_steps=int(n_steps))
+                    logger.info(
+                        'Number of steps for next stage: %i' % step.n_steps)
+
                 step.covariance = step.calc_covariance()
                 step.proposal_dist = choose_proposal(
                     step.proposal_name, scale=step.covariance)
@@ -497,17 +756,21 @@ def ATMIP_sample(
         logger.info('Sample final stage')
         step.stage = -1
 
-        temp = np.exp((1 - step.old_beta) *
-                      (step.likelihoods - step.likelihoods.max()))
-        step.weights = temp / np.sum(temp)
+        step.weights = step.calc_weights(1. - step.old_beta)
+        step.record_stage_statistics(1. - step.old_beta, draws)
+
+        if adapt_n_steps:
+            step.n_steps = step.adapt_n_steps(max_steps=int(n_steps))
+
         step.covariance = step.calc_covariance()
         step.proposal_dist = choose_proposal(
             step.proposal_name, scale=step.covariance)
 
-        step.resampling_indexes = step.resample()
+        step.resampling_indexes = step.resample(force=True)
         step.chain_previous_lpoint = step.get_chain_previous_lpoint(mtrace)
 
         sample_args['step'] = step
+        sample_args['draws'] = step.n_steps
         sample_args['stage_path'] = stage_handler.stage_path(step.stage)
         sample_args['chains'] = chains
         iter_parallel_chains(**sample_args)
@@ -0,0 +1,146 @@
+"""
+Surrogate models of the likelihood, fitted to (point, likelihood) pairs
+that have been evaluated with the full forward model.
+"""
+
+import logging
+from collections import deque
+
+import numpy as num
+
+
+__all__ = [
+    'RBFSurrogate']
+
+
+logger = logging.getLogger('surrogate')
+
+
+class RBFSurrogate(object):
+    """
+    Gaussian radial basis function interpolation of the likelihood.
+    Far from the training points the prediction returns to the mean of the
+    training likelihoods.
+
+    Parameters
+    ----------
+    max_points : int
+        maximum number of training points, the most recent are kept
+    min_points : int
+        minimum number of training points that are needed for a fit
+    nugget : float
+        relative regularisation of the kernel matrix
+    """
+
+    def __init__(self, max_points=500, min_points=20, nugget=1e-6):
+        self.max_points = max_points
+        self.min_points = min_points
+        self.nugget = nugget
+
+        self.points = deque(maxlen=max_points)
+        self.llks = deque(maxlen=max_points)
+        self.reset_fit()
+
+    def reset_fit(self):
+        self._train = None
+        self._weights = None
+        self._mean = None
+        self._offset = None
+        self._scale = None
+        self._length = None
+
+    def __len__(self):
+        return len(self.llks)
+
+    @property
+    def fitted(self):
+        return self._weights is not None
+
+    def add(self, q, llk):
+        """
+        Add training pair, only finite likelihoods are used.
+
+        Parameters
+        ----------
+        q : :class:`numpy.ndarray`
+            point in the solution space
+        llk : float
+            likelihood of the point
+        """
+        if num.isfinite(llk):
+            self.points.append(num.array(q, dtype='float64'))
+            self.llks.append(float(llk))
+
+    def clear(self):
+        self.points.clear()
+        self.llks.clear()
+        self.reset_fit()
+
+    def _normalise(self, q):
+        return (q - self._offset) / self._scale
+
+    def _kernel(self, a, b):
+        sqdist = (a ** 2).sum(1)[:, None] + (b ** 2).sum(1)[None, :] - \
+            2. * a.dot(b.T)
+        return num.exp(-num.maximum(sqdist, 0.) / (2. * self._length ** 2))
+
+    def fit(self):
+        """
+        Fit the surrogate to the current training pairs.
+
+        Returns
+        -------
+        bool, True if the surrogate could be fitted
+        """
+        self.reset_fit()
+        if len(self) < self.min_points:
+            return False
+
+        points = num.vstack(self.points)
+        llks = num.array(self.llks)
+
+        self._offset = points.mean(0)
+        self._scale = points.std(0)
+        self._scale[self._scale == 0.] = 1.
+        train = self._normalise(points)
+
+        sqdist = (train[:, None, :] - train[None, :, :]) ** 2
+        dist = num.sqrt(sqdist.sum(-1))
+        self._length = num.median(dist[num.triu_indices_from(dist, k=1)])
+        if not self._length > 0.:
+            self.reset_fit()
+            return False
+
+        kernel = self._kernel(train, train)
+        kernel[num.diag_indices_from(kernel)] += self.nugget * llks.size
+
+        self._mean = llks.mean()
+        try:
+            self._weights = num.linalg.solve(kernel, llks - self._mean)
+        except num.linalg.LinAlgError:
+            logger.debug('Surrogate kernel matrix singular!')
+            self.reset_fit()
+            return False
+
+        self._train = train
+        return True
+
+    def predict(self, q):
+        """
+        Predict the likelihood of a point.
+
+        Parameters
+        ----------
+        q : :class:`numpy.ndarray`
+            point in the solution space
+
+        Returns
+        -------
+        float
+        """
+        if not self.fitted:
+            raise ValueError('Surrogate has not been fitted!')
+
+        x = self._normalise(num.atleast_2d(q))
+        return self._mean + self._kernel(x, self._train).dot(
+            self._weights)[0]
@@ -154,6 +154,66 @@ class RectangularSource(gf.RectangularSource):
             (bd[2] * num.sin(d2r * self.strike) / num.tan(d2r * self.dip))
         return num.array([xtrace, ytrace, 0.])
 
+    def patch_centers(self, nl, nw):
+        """
+        Get center coordinates of n by m sub-faults, computed at once for all
+        sub-faults. Ordering as in :meth:`patches`.
+        REQUIRES: self.depth to be TOP DEPTH!!!
+
+        Parameters
+        ----------
+        nl : int
+            number of patches in length direction (strike)
+        nw : int
+            number of patches in width direction (dip)
+
+        Returns
+        -------
+        :class:`numpy.ndarray` (nw * nl, 3) with east_shift, north_shift and
+        center depth [m] of the sub-faults
+        """
+        length = self.length / float(nl)
+        width = self.width / float(nw)
+
+        strike_offsets = (num.arange(nl) + 0.5 - 0.5 * nl) * length
+        dip_offsets = (num.arange(nw) + 0.5 - 0.5 * nw) * width
+
+        centers = self.center(self.width)[num.newaxis, num.newaxis, :] + \
+            self.strikevector[num.newaxis, num.newaxis, :] * \
+            strike_offsets[num.newaxis, :, num.newaxis] + \
+            self.dipvector[num.newaxis, num.newaxis, :] * \
+            dip_offsets[:, num.newaxis, num.newaxis]
+
+        return centers.reshape((nw * nl, 3))
+
+    def patch_source(self, center, length, width):
+        """
+        Get sub-fault at center coordinates with the other attributes of the
+        source.
+
+        Parameters
+        ----------
+        center : :class:`numpy.ndarray`
+            east_shift, north_shift and center depth [m] of the sub-fault
+        length : float
+            length [m] of the sub-fault
+        width : float
+            width [m] of the sub-fault
+
+        Returns
+        -------
+        :class:`pyrocko.gf.seismosizer.RectangularSource`
+        """
+        return gf.RectangularSource(
+            lat=float(self.lat),
+            lon=float(self.lon),
+            east_shift=float(center[0]),
+            north_shift=float(center[1]),
+            depth=float(center[2]),
+            strike=self.strike, dip=self.dip, rake=self.rake,
+            length=length, width=width, stf=self.stf,
+            time=self.time, slip=self.slip, anchor='center')
+
     def patches(self, nl, nw, datatype):
         """
         Cut source into n by m sub-faults and return n times m
@@ -180,26 +240,9 @@ class RectangularSource(gf.RectangularSource):
         length = self.length / float(nl)
         width = self.width / float(nw)
 
-        patches = []
-        for j in range(nw):
-            for i in range(nl):
-                sub_center = self.center(self.width) + \
-                    self.strikevector * ((i + 0.5 - 0.5 * nl) * length) + \
-                    self.dipvector * ((j + 0.5 - 0.5 * nw) * width)
-
-                patch = gf.RectangularSource(
-                    lat=float(self.lat),
-                    lon=float(self.lon),
-                    east_shift=float(sub_center[0]),
-                    north_shift=float(sub_center[1]),
-                    depth=float(sub_center[2]),
-                    strike=self.strike, dip=self.dip, rake=self.rake,
-                    length=length, width=width, stf=self.stf,
-                    time=self.time, slip=self.slip, anchor='center')
-
-                patches.append(patch)
-
-        return patches
+        return [
+            self.patch_source(center, length, width)
+            for center in self.patch_centers(nl=nl, nw=nw)]
 
     def get_n_patches(self, patch_size=1000., dimension='length'):
         """
@@ -10,6 +10,7 @@ and many more ...
 import logging
 
 import os
+import sys
 import re
 import collections
 import copy
@@ -21,7 +22,6 @@ from pyrocko.cake import m2d, LayeredModel, read_nd_model_str
 from pyrocko.gf.seismosizer import RectangularSource
 
 import numpy as num
-from theano import config as tconfig
 
 from pyproj import Proj
 
@@ -994,6 +994,51 @@ def repair_covariance(x, epsilon=num.finfo(num.float64).eps):
     return vec * num.diag(val) * vec.T
 
 
+def cholesky_rank_one_update(L, x, sign=1.):
+    """
+    Rank-one update (or downdate) of a Cholesky decomposition.
+    Returns the lower triangular cholesky factor of L * L.T + sign * x * x.T
+    in O(n**2) instead of O(n**3) operations for the new decomposition.
+
+    Parameters
+    ----------
+    L : :class:`numpy.ndarray`
+        lower triangular cholesky factor (n x n)
+    x : :class:`numpy.ndarray`
+        update vector of size n
+    sign : float
+        1. for update, -1. for downdate
+
+    Returns
+    -------
+    L_new : :class:`numpy.ndarray`
+        updated lower triangular cholesky factor
+
+    Notes
+    -----
+    Algorithm after Golub & Van Loan, 'Matrix Computations'
+    """
+    L = num.array(L, dtype=num.float64)
+    x = num.array(x, dtype=num.float64).ravel()
+
+    n = x.size
+    for k in range(n):
+        r2 = L[k, k] ** 2 + sign * x[k] ** 2
+        if r2 <= 0.:
+            raise num.linalg.LinAlgError(
+                'Downdated matrix is not positive definite!')
+
+        r = num.sqrt(r2)
+        c = r / L[k, k]
+        s = x[k] / L[k, k]
+        L[k, k] = r
+        if k < n - 1:
+            L[k + 1:, k] = (L[k + 1:, k] + sign * s * x[k + 1:]) / c
+            x[k + 1:] = c * x[k + 1:] - s * L[k + 1:, k]
+
+    return L
+
+
 def list2string(l):
     """
     Convert list of string to single string.
@@ -1187,14 +1232,52 @@ def error_not_whole(f, errstr=''):
         raise ValueError('%s : %f is not a whole number!' % (errstr, f))
 
 
-def scalar2floatX(a, floatX=tconfig.floatX):
+def get_floatX():
+    """
+    Get the floatX of theano without importing theano, which is slow. If
+    theano is not loaded yet, the floatX is read like theano does from the
+    THEANO_FLAGS environment variable or the theanorc files.
+
+    Returns
+    -------
+    str, 'float32' or 'float64'
+    """
+    theano = sys.modules.get('theano', None)
+    if theano is not None:
+        return theano.config.floatX
+
+    for flag in os.environ.get('THEANO_FLAGS', '').split(','):
+        key, _, value = flag.partition('=')
+        if key.strip() == 'floatX':
+            return value.strip()
+
+    from ConfigParser import SafeConfigParser, Error
+
+    parser = SafeConfigParser()
+    rcfiles = os.environ.get(
+        'THEANORC', os.pathsep.join(['~/.theanorc', '~/.theanorc.txt']))
+    try:
+        parser.read([
+            os.path.expanduser(fn) for fn in rcfiles.split(os.pathsep)])
+        return parser.get('global', 'floatX')
+    except Error:
+        return 'float64'
+
+
+def scalar2floatX(a, floatX=None):
+    if floatX is None:
+        floatX = get_floatX()
+
     if floatX == 'float32':
         return num.float32(a)
     elif floatX == 'float64':
         return num.float64(a)
 
 
-def scalar2int(a, floatX=tconfig.floatX):
+def scalar2int(a, floatX=None):
+    if floatX is None:
+        floatX = get_floatX()
+
     if floatX == 'float32':
         return num.int16(a)
     elif floatX == 'float64':
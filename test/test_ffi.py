@@ -2,8 +2,12 @@ import unittest
 import logging
 from time import time
 from beat import ffi
+from beat.config import GeodeticGFLibraryConfig
 from beat.heart import DynamicTarget, WaveformMapping
 from beat.utility import get_random_uniform
+from beat.sources import RectangularSource
+from tempfile import mkdtemp
+import shutil
 
 import numpy as num
 
@@ -179,6 +183,93 @@ class FFITest(unittest.TestCase):
             starttimeidxs=[0], plot=True)
 
 
+class GFLibraryManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp(prefix='beat_gfs')
+
+        npatches = 10
+        nsamples = 1000
+        self.filenames = []
+        for crust_ind in range(4):
+            gfs = ffi.GeodeticGFLibrary(config=GeodeticGFLibraryConfig(
+                component='uparr', dimensions=(npatches, nsamples),
+                crust_ind=crust_ind, datatype='geodetic'))
+            gfs.setup(npatches, nsamples, allocate=True)
+            for patchidx in range(npatches):
+                gfs.put(num.ones(nsamples) * crust_ind, patchidx)
+
+            gfs.save(outdir=self.tmpdir)
+            self.filenames.append(gfs.filename)
+
+        self.filesize = gfs.filesize
+
+    def test_lru_cache(self):
+        manager = ffi.GFLibraryManager(
+            directory=self.tmpdir, max_size=2.5 * self.filesize)
+
+        for crust_ind, filename in enumerate(self.filenames):
+            manager.register(crust_ind, filename, resident=crust_ind == 0)
+
+        assert len(manager) == 4
+        assert manager.cache_size == 0.
+
+        for crust_ind in [1, 2, 1, 3]:
+            gfs = manager[crust_ind]
+            num.testing.assert_allclose(gfs.get_matrix(), crust_ind)
+
+        assert list(manager._cache.keys()) == [1, 3]
+        assert manager.cache_size <= manager.max_size
+        num.testing.assert_allclose(manager[0].get_matrix(), 0.)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+class FaultGeometryTest(unittest.TestCase):
+
+    def test_patch_geometry(self):
+        source = RectangularSource(
+            lat=10., lon=20., east_shift=1. * km, north_shift=-2. * km,
+            depth=3. * km, strike=33., dip=60., rake=90.,
+            length=20. * km, width=10. * km, slip=1.)
+
+        fault = ffi.discretize_sources(
+            sources=[source], extension_width=0.1, extension_length=0.1,
+            patch_width=2., patch_length=2., datatypes=['geodetic'],
+            varnames=['uparr', 'uperp'])
+
+        ext_source = fault.get_subfault(0, component='uperp')
+        assert ext_source.rake == 0.
+
+        npw, npl = fault.get_subfault_discretization(0)
+        t0 = time()
+        patches = fault.get_all_patches(component='uperp')
+        logger.info('Created %i patches in %f s' % (len(patches), time() - t0))
+
+        # reference centers patch by patch, along strike first and row-wise
+        # deeper, ext_source.depth is the top depth
+        length = ext_source.length / npl
+        width = ext_source.width / npw
+        reference = []
+        for j in range(npw):
+            for i in range(npl):
+                reference.append(
+                    ext_source.center(ext_source.width) +
+                    ext_source.strikevector * (i + 0.5 - 0.5 * npl) * length +
+                    ext_source.dipvector * (j + 0.5 - 0.5 * npw) * width)
+
+        assert len(patches) == len(reference) == fault.npatches
+
+        centers = fault.get_patch_centers(component='uperp')
+        num.testing.assert_allclose(centers, num.array(reference), atol=1e-6)
+        for center, patch in zip(centers, patches):
+            num.testing.assert_allclose(
+                center, [patch.east_shift, patch.north_shift, patch.depth])
+            assert patch.length == length
+            assert patch.width == width
+
+
 if __name__ == '__main__':
     util.setup_logging('test_ffi', 'debug')
     unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from beat import heart, models
+from beat import heart, models, config
 import theano.tensor as tt
 from theano import function, shared
 from copy import deepcopy
@@ -11,7 +11,7 @@ import logging
 import shutil
 
 from pyrocko import util, trace
-from pyrocko import plot, orthodrome
+from pyrocko import plot, orthodrome, model
 
 
 logger = logging.getLogger('test_heart')
@@ -108,6 +108,26 @@ class TestSeisComposite(unittest.TestCase):
         assert_allclose(cov.slnf.get_value(), f(), rtol=1e-06, atol=0)
         assert_allclose(cov.log_norm_factor, f(), rtol=1e-06, atol=0)
 
+    def test_weight_update_skip(self):
+        logger.info('Test weight update skipping')
+        dataset = deepcopy(self.sc.datasets[0])
+        weight = shared(
+            dataset.covariance.chol_inverse, name='test_weight', borrow=True)
+
+        cov_pv = num.eye(dataset.covariance.data.shape[0]) * \
+            dataset.covariance.data.max() * 1e-2
+
+        updated, _ = self.sc.update_weight(
+            dataset, weight, cov_pv, rtol=1e-2)
+        assert updated
+
+        updated, _ = self.sc.update_weight(
+            dataset, weight, cov_pv * (1. + 1e-4), rtol=1e-2)
+        assert not updated
+        assert_allclose(
+            weight.get_value(), dataset.covariance.chol_inverse,
+            rtol=1e-08, atol=0)
+
 
 class TestGeoComposite(unittest.TestCase):
 
@@ -147,6 +167,75 @@ class TestGeoComposite(unittest.TestCase):
                 rtol=1e-08, atol=0)
 
 
+class TestStorePlanning(unittest.TestCase):
+
+    def test_plan_seis_stores(self):
+        event = model.Event(lat=10., lon=10., depth=10. * km)
+
+        sc = config.SeismicConfig()
+        sc.init_waveforms(['any_P'])
+        sc.gf_config.use_crust2 = False
+        sc.gf_config.source_distance_radius = 20.
+
+        stations = []
+        for i, north in enumerate([100., 105., 110., 300., 310., 700.]):
+            lat, lon = orthodrome.ne_to_latlon(
+                event.lat, event.lon, north * km, 0.)
+            stations.append(model.Station(
+                network='XX', station='S%i' % i,
+                lat=float(lat), lon=float(lon),
+                channels=[model.Channel('Z', azimuth=0., dip=-90.)]))
+
+        station_stores = heart.plan_seis_stores(stations, event, sc)
+        sc.gf_config.station_stores = station_stores
+
+        assert station_stores['S0'] == station_stores['S2']
+        assert station_stores['S3'] == station_stores['S4']
+        assert station_stores['S0'] != station_stores['S3']
+        assert station_stores['S5'] == 'S5'
+
+        locations = heart.get_store_locations(stations, event, sc.gf_config)
+        assert len(locations) == 3
+
+        location, distance_range = locations[0]
+        assert location.station == station_stores['S0']
+        assert_allclose(
+            distance_range, (80. * km, 130. * km), rtol=0., atol=1. * km)
+
+        targets = heart.init_seismic_targets(
+            stations, channels=['Z'], station_stores=station_stores)
+        assert len(set(target.store_id for target in targets)) == 3
+
+
+class TestVelocityModels(unittest.TestCase):
+
+    def test_velocity_model_variations(self):
+        gfc = config.SeismicGFConfig(use_crust2=False)
+        location = model.Station(lat=10., lon=10.)
+        cache_dir = mkdtemp(prefix='beat_velocity_models')
+
+        models = heart.get_velocity_models(
+            location, gfc.earth_model_name, crust_inds=[0, 1, 2],
+            gf_config=gfc, cache_dir=cache_dir)
+        assert len(os.listdir(cache_dir)) == 1
+        assert str(models[0]) != str(models[1])
+        assert str(models[1]) != str(models[2])
+
+        # realisations are reproducible, independent of order and cache
+        reproduced = heart.get_velocity_models(
+            location, gfc.earth_model_name, crust_inds=[2, 1],
+            gf_config=gfc)
+        assert str(models[2]) == str(reproduced[0])
+        assert str(models[1]) == str(reproduced[1])
+
+        cached = heart.get_velocity_model(
+            location, gfc.earth_model_name, crust_ind=1,
+            gf_config=gfc, cache_dir=cache_dir)
+        assert str(models[1]) == str(cached)
+
+        shutil.rmtree(cache_dir)
+
+
 if __name__ == "__main__":
     util.setup_logging('test_heart', 'warning')
     unittest.main()
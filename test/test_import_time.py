@@ -0,0 +1,133 @@
+"""
+Import time benchmark of the beat commands.
+
+Every command is started in a fresh interpreter with "--help", i.e. it
+imports its dependencies, parses the options and exits. The cumulative
+import times of the top-level modules are recorded, similar to
+"python -X importtime".
+"""
+import os
+import sys
+import json
+import logging
+import unittest
+import subprocess
+
+from pyrocko import util
+
+
+logger = logging.getLogger('test_import_time')
+
+
+beat_app = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'apps', 'beat')
+
+# total import time of a command [s]
+import_budget = float(os.environ.get('BEAT_IMPORT_BUDGET', 10.))
+
+heavy_modules = [
+    'beat.models', 'beat.plotting', 'pymc3', 'theano', 'matplotlib']
+
+# commands that must not import the heavy modules
+light_commands = ['init', 'import', 'clone', 'build_gfs']
+
+profile_marker = 'BEAT_IMPORT_PROFILE'
+
+probe = '''
+import sys
+import time
+import json
+import runpy
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+_import = builtins.__import__
+depth = [0]
+times = []
+
+
+def timed_import(name, *args, **kwargs):
+    new = name not in sys.modules
+    depth[0] += 1
+    t0 = time.time()
+    try:
+        return _import(name, *args, **kwargs)
+    finally:
+        depth[0] -= 1
+        if new and depth[0] == 0:
+            times.append((name, time.time() - t0))
+
+
+builtins.__import__ = timed_import
+sys.argv = ['beat', %r, '--help']
+
+t0 = time.time()
+try:
+    runpy.run_path(%r, run_name='__main__')
+except SystemExit:
+    pass
+
+profile = {
+    'total': time.time() - t0,
+    'imports': times,
+    'modules': sorted(sys.modules.keys())}
+sys.stdout.write('\\n%s' + json.dumps(profile) + '\\n')
+'''
+
+
+def profile_command(command):
+    """
+    Profile the imports of a beat command in a fresh interpreter.
+
+    Parameters
+    ----------
+    command : str
+        name of the beat subcommand
+
+    Returns
+    -------
+    dict with the total time 'total' [s], the cumulative import times of
+    the top-level modules 'imports' and the names of all loaded 'modules'
+    """
+    code = probe % (command, beat_app, profile_marker)
+    output = subprocess.check_output(
+        [sys.executable, '-c', code], stderr=subprocess.STDOUT)
+
+    for line in output.decode('utf-8').splitlines():
+        if line.startswith(profile_marker):
+            return json.loads(line[len(profile_marker):])
+
+    raise ValueError('No import profile of command %s!' % command)
+
+
+class ImportTimeTest(unittest.TestCase):
+
+    def test_import_time(self):
+        for command in light_commands + ['sample', 'plot']:
+            profile = profile_command(command)
+
+            logger.info('Command "%s": %f s' % (command, profile['total']))
+            for name, t in sorted(
+                    profile['imports'], key=lambda x: x[1],
+                    reverse=True)[:5]:
+                logger.info('    %10.0f us | %s' % (t * 1e6, name))
+
+            if command in light_commands:
+                loaded = [
+                    module for module in heavy_modules
+                    if module in profile['modules']]
+                assert len(loaded) == 0, \
+                    'Command "%s" imports %s' % (command, ', '.join(loaded))
+
+            assert profile['total'] < import_budget, \
+                'Command "%s" exceeds import budget: %f s' % (
+                    command, profile['total'])
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_import_time', 'info')
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import logging
+from collections import OrderedDict
+
+from beat import linear_solver, ffi
+
+import numpy as num
+
+from pyrocko import util
+
+
+logger = logging.getLogger('test_linear_solver')
+
+
+class LinearSolverTest(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self, *args, **kwargs)
+
+        n_patch_strike = 8
+        n_patch_dip = 4
+        self.npatches = n_patch_strike * n_patch_dip
+        ndata = 200
+
+        self.design = num.random.randn(ndata, self.npatches)
+        self.slip = num.random.rand(self.npatches) * 2.
+        self.data = self.design.dot(self.slip) + \
+            num.random.randn(ndata) * 0.1
+
+        self.regularization = 1e-3 * ffi.get_smoothing_operator(
+            n_patch_strike=n_patch_strike, n_patch_dip=n_patch_dip,
+            patch_size_strike=1., patch_size_dip=1.)
+
+    def test_regularized_lsq(self):
+        mean, normal_chol = linear_solver.solve_regularized_lsq(
+            self.design, self.data, self.regularization)
+
+        normal_matrix = self.design.T.dot(self.design) + \
+            self.regularization.T.dot(self.regularization)
+        num.testing.assert_allclose(
+            normal_matrix.dot(mean), self.design.T.dot(self.data),
+            rtol=0., atol=1e-8)
+        num.testing.assert_allclose(mean, self.slip, rtol=0., atol=0.1)
+
+        solution = linear_solver.LinearSolution(
+            slices=OrderedDict(uparr=slice(0, self.npatches)),
+            mean=mean, normal_chol=normal_chol,
+            lower=num.zeros(self.npatches),
+            upper=num.ones(self.npatches))
+
+        samples = solution.random(100)
+        assert samples.shape == (100, self.npatches)
+        assert (samples >= 0.).all() and (samples <= 1.).all()
+        num.testing.assert_allclose(
+            solution.covariance.dot(normal_matrix), num.eye(self.npatches),
+            rtol=0., atol=1e-8)
+
+    def test_bounded_lsq(self):
+        normal_matrix = self.design.T.dot(self.design) + \
+            self.regularization.T.dot(self.regularization)
+        rhs = self.design.T.dot(self.data)
+
+        lower = num.zeros(self.npatches)
+        upper = num.ones(self.npatches)
+        x = linear_solver.solve_bounded_lsq(
+            normal_matrix, rhs, lower, upper, rtol=1e-12)
+
+        assert (x >= lower).all() and (x <= upper).all()
+
+        # projected gradient vanishes at the bounded minimum
+        gradient = normal_matrix.dot(x) - rhs
+        projected = x - num.clip(x - gradient, lower, upper)
+        num.testing.assert_allclose(projected, 0., rtol=0., atol=1e-6)
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_linear_solver', 'info')
+    unittest.main()
@@ -1,8 +1,11 @@
+import os
+import shutil
 import logging
 import time
 import unittest
+from tempfile import mkdtemp
 
-from beat import paripool
+from beat import paripool, parallel
 import numpy as num
 from pyrocko import util
 
@@ -16,6 +19,42 @@ def add(x,y):
     return x + y
 
 
+def write_time(path):
+    time.sleep(0.2)
+    with open(path, 'w') as f:
+        f.write('%f' % time.time())
+
+
+def fail():
+    raise ValueError('Failing job!')
+
+
+def beating_add(x, y, stall_marker=None):
+    for i in range(x):
+        parallel.heartbeat(i)
+        time.sleep(0.1)
+
+    if stall_marker is not None and not os.path.exists(stall_marker):
+        # stall at the first attempt
+        with open(stall_marker, 'w') as f:
+            f.write('stalled')
+
+        time.sleep(100)
+
+    return x + y
+
+
+def seeded(x, seed):
+    if seed == 0:
+        raise ValueError('Failing seed!')
+
+    return x + seed
+
+
+def reseed(work, attempt):
+    return work[0], attempt
+
+
 class ParipoolTestCase(unittest.TestCase):
 
     def __init__(self, *args, **kwargs):
@@ -33,6 +72,150 @@ class ParipoolTestCase(unittest.TestCase):
             for val, rval in zip(e, ref_values):
                 assert val == rval
 
+    def test_ipool(self):
+        featureClass = [[k, 1] for k in self.factors]
+        p = parallel.iparipool(
+            add, featureClass, chunksize=1, nprocs=4, timeout=3)
+
+        ref_values = (self.factors + 1).tolist()
+        ref_values[3] = None
+
+        t0 = time.time()
+        first_idx, _ = next(p)
+        assert time.time() - t0 < 1.
+        assert self.factors[first_idx] == 0
+
+        results = dict([(first_idx, _)] + list(p))
+        assert sorted(results.keys()) == list(range(len(self.factors)))
+        for idx, rval in enumerate(ref_values):
+            assert results[idx] == rval
+
+    def test_thread_pool(self):
+        pool = parallel.get_thread_pool(3)
+        assert pool is parallel.get_thread_pool(3)
+
+        t0 = time.time()
+        results = pool.map(lambda x: add(x, 1), [1, 1, 1])
+        assert results == [2, 2, 2]
+        assert time.time() - t0 < 2.
+
+    def test_job_graph(self):
+        tmpdir = mkdtemp(prefix='beat_jobs')
+
+        def path(name):
+            return os.path.join(tmpdir, name)
+
+        graph = parallel.JobGraph()
+        for name, depends in [
+                ('c', ['a', 'b']), ('a', []), ('b', ['a']), ('d', [])]:
+            graph.add(parallel.Job(
+                name=name, function=write_time, args=(path(name),),
+                depends=depends, marker=path(name + '.done')))
+
+        graph.add(parallel.Job(name='fail', function=fail))
+        graph.add(parallel.Job(
+            name='after_fail', function=write_time,
+            args=(path('after_fail'),), depends=['fail']))
+
+        assert [job.name for job in graph.sorted_jobs()][:3] == \
+            ['a', 'b', 'c']
+
+        failed = graph.run(nprocs=2)
+        assert failed == ['fail', 'after_fail']
+        assert not os.path.exists(path('after_fail'))
+
+        times = {}
+        for name in ['a', 'b', 'c', 'd']:
+            with open(path(name)) as f:
+                times[name] = float(f.read())
+
+        assert times['a'] < times['b'] < times['c']
+
+        # resume, completed jobs are not repeated
+        os.remove(path('d'))
+        graph.jobs['d'].reset()
+        os.remove(path('a'))
+        graph.run(nprocs=2)
+        assert os.path.exists(path('d'))
+        assert not os.path.exists(path('a'))
+
+        shutil.rmtree(tmpdir)
+
+    def test_supervised_pool(self):
+        tmpdir = mkdtemp(prefix='beat_supervised')
+        stall_marker = os.path.join(tmpdir, 'stalled')
+
+        work = [(int(k), 1) for k in self.factors]
+        work.append((2, 1, stall_marker))
+        work.append((1, 'fail'))
+
+        t0 = time.time()
+        results = dict(parallel.supervised_pool(
+            beating_add, work, nprocs=4, heartbeat_timeout=1.,
+            max_retries=1))
+
+        assert time.time() - t0 < 10.
+        assert os.path.exists(stall_marker)
+        for idx, (x, y) in enumerate(work[:len(self.factors)]):
+            assert results[idx] == x + y
+
+        assert results[len(self.factors)] == 3
+        assert results[len(self.factors) + 1] is None
+
+        shutil.rmtree(tmpdir)
+
+    def test_supervised_pool_retry_work(self):
+        work = [(1, 0), (2, 5)]
+        results = dict(parallel.supervised_pool(
+            seeded, work, nprocs=2, max_retries=2, retry_work=reseed))
+
+        assert results[0] == 2
+        assert results[1] == 7
+
+    def test_memory_budget(self):
+        mb = 1024. ** 2
+        budget = parallel.MemoryBudget(safety=0.5)
+        budget.add_shared('gfs', 100 * mb)
+        budget.add_per_worker('model', 50 * mb)
+        budget.add_per_worker('model', 50 * mb)
+
+        assert budget.total(4) == 500 * mb
+        assert budget.max_n_jobs(available=1000 * mb) == 4
+        assert budget.plan_n_jobs(2, available=1000 * mb) == 2
+        assert budget.plan_n_jobs(8, available=1000 * mb) == 4
+        self.assertRaises(
+            MemoryError, budget.plan_n_jobs, 1, available=300 * mb)
+
+        logger.info('\n' + budget.breakdown(4, available=1000 * mb))
+
+    def test_worker_cores(self):
+        assert parallel.parse_cpulist('0-3,8,10-11\n') == \
+            [0, 1, 2, 3, 8, 10, 11]
+
+        cores = [
+            core for node in parallel.get_numa_cores() for core in node]
+        assert len(cores) > 0
+
+        assert parallel.get_worker_cores(0, 1) == [cores[0]]
+        assert len(parallel.get_worker_cores(1, 2)) == min(2, len(cores))
+
+    def test_serial_worker_threads(self):
+        var = 'OMP_NUM_THREADS'
+        before = os.environ.get(var)
+
+        parallel.set_worker_threads(3)
+        try:
+            for pool in (parallel.paripool, parallel.iparipool):
+                list(pool(add, [(0, 1), (0, 2)], nprocs=1))
+
+            list(parallel.supervised_pool(
+                beating_add, [(1, 1)], nprocs=1))
+        finally:
+            parallel.set_worker_threads(None)
+
+        assert os.environ.get(var) == before
+
+
 if __name__ == "__main__":
     util.setup_logging('test_paripool', 'debug')
     unittest.main()
@@ -0,0 +1,102 @@
+import os
+import logging
+import unittest
+
+import numpy as num
+from numpy.testing import assert_allclose
+
+from beat import pscmp
+
+from pyrocko import util
+
+
+logger = logging.getLogger('test_pscmp')
+
+
+def write_snapshot(fn, data):
+    with open(fn, 'w') as f:
+        # header words do not match the number of columns
+        f.write('   Lat[deg]  Lon[deg]  Ux [m]  Uy [m]  Uz [m]\n')
+        for row in data:
+            f.write(' '.join('%15.6E' % value for value in row) + '\n')
+
+
+class PsCmpOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = pscmp.get_runner()
+
+    def test_read_output(self):
+        data = num.random.randn(7, 16)
+        fn = os.path.join(self.runner.tempdir, 'snapshot_test.txt')
+        write_snapshot(fn, data)
+
+        output = pscmp.read_output(fn)
+        assert output.shape == data.shape
+        assert_allclose(output, data, rtol=1e-6)
+
+    def test_split_output(self):
+        output = [num.random.randn(10, 3) for _ in range(2)]
+        results = pscmp.split_output(output, [3, 0, 7])
+
+        assert len(results) == 3
+        for snapshots, (start, stop) in zip(
+                results, [(0, 3), (3, 3), (3, 10)]):
+            assert len(snapshots) == 2
+            for data, snapshot in zip(output, snapshots):
+                assert_allclose(snapshot, data[start:stop])
+
+    def test_get_runner(self):
+        assert pscmp.get_runner() is self.runner
+
+        self.runner.cleanup()
+        runner = pscmp.get_runner()
+        assert runner is not self.runner
+        assert os.path.exists(runner.tempdir)
+
+    def test_run_batch(self):
+        runner = self.runner
+        observations = [
+            pscmp.PsCmpScatter(lats=[10., 10.1], lons=[12., 12.1]),
+            pscmp.PsCmpScatter(lats=[11.], lons=[13.])]
+
+        def run(config):
+            # stands in for the pscmp binary, one row per observation point
+            runner.config = config
+            lats = num.array(config.observation.lats)
+            lons = num.array(config.observation.lons)
+            for i, fn in enumerate(config.get_output_filenames(
+                    runner.tempdir)):
+                data = num.zeros((lats.size, 16))
+                data[:, 0] = lats
+                data[:, 1] = lons
+                data[:, 2:5] = i + 1.
+                write_snapshot(fn, data)
+
+        runner.run = run
+
+        config = pscmp.PsCmpConfigFull()
+        config.times_snapshots = [0., 1.]
+        results = runner.run_batch(config, observations, flip_z=True)
+
+        assert len(results) == len(observations)
+        for snapshots, observation in zip(results, observations):
+            assert len(snapshots) == 2
+            for i, displ in enumerate(snapshots):
+                assert displ.shape == (len(observation.lats), 3)
+                assert_allclose(displ[:, :2], i + 1.)
+                assert_allclose(displ[:, 2], -(i + 1.))
+
+        # the observation of the passed config is not changed
+        assert config.observation.lats == pscmp.PsCmpScatter().lats
+
+        self.assertRaises(
+            TypeError, runner.run_batch, config, [pscmp.PsCmpProfile()])
+
+    def tearDown(self):
+        pscmp.cleanup_runners()
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_pscmp', 'info')
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import time
+import shutil
+import logging
+import unittest
+from tempfile import mkdtemp
+
+from beat import psgrn
+
+from pyrocko import util
+
+
+logger = logging.getLogger('test_psgrn')
+
+
+class PsGrnCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = mkdtemp(prefix='beat-test-psgrn-')
+        self.outdir = os.path.join(self.tempdir, 'psgrn_green_0')
+        util.ensuredir(self.outdir)
+        for fn in ['uz.ss', 'ur.ss', 'ut.ss']:
+            with open(os.path.join(self.outdir, fn), 'w') as f:
+                f.write('0' * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_cache(self):
+        cache = psgrn.PsGrnCache(
+            os.path.join(self.tempdir, 'cache'), max_size=5000 / 1024. ** 3)
+
+        assert not cache.get('a', self.outdir)
+        cache.put('a', self.outdir)
+        assert cache.has('a')
+
+        outdir = os.path.join(self.tempdir, 'psgrn_green_1')
+        util.ensuredir(outdir)
+        assert cache.get('a', outdir)
+        assert sorted(os.listdir(outdir)) == sorted(os.listdir(self.outdir))
+
+        # new runs must not overwrite the cache entry
+        psgrn.unshare_files(outdir)
+        assert len(os.listdir(outdir)) == 0
+        assert len(os.listdir(cache.entry_dir('a'))) == 3
+
+        # least recently used entry is evicted
+        time.sleep(0.01)
+        cache.put('b', self.outdir)
+        assert not cache.has('a')
+        assert cache.has('b')
+
+    def test_cache_key(self):
+        c = psgrn.PsGrnConfigFull.example()
+        key = psgrn.get_cache_key(c)
+
+        c.psgrn_outdir = 'other_psgrn_functions/'
+        assert psgrn.get_cache_key(c) == key
+
+        c.sampling_interval = 2.
+        assert psgrn.get_cache_key(c) != key
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_psgrn', 'info')
+    unittest.main()
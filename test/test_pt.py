@@ -0,0 +1,128 @@
+import pymc3 as pm
+import numpy as num
+from beat import backend
+from beat.sampler import Metropolis, pt
+from tempfile import mkdtemp
+import shutil
+import logging
+import theano.tensor as tt
+import unittest
+from pyrocko import util
+
+
+logger = logging.getLogger('test_pt')
+
+
+class TestPT(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        unittest.TestCase.__init__(self, *args, **kwargs)
+
+        self.test_folder_one = mkdtemp(prefix='PT_TEST')
+        self.test_folder_multi = mkdtemp(prefix='PT_TEST')
+
+        logger.info('Test result in: \n %s, \n %s ' % (
+            self.test_folder_one, self.test_folder_multi))
+
+        self.n_chains = 8
+        self.n_samples = 20000
+        self.tune_interval = 50
+        self.swap_interval = 20
+
+    def _test_sample(self, n_jobs, test_folder):
+        logger.info('Running on %i cores...' % n_jobs)
+
+        n = 4
+
+        mu1 = num.ones(n) * (1. / 2)
+        mu2 = -mu1
+
+        stdev = 0.1
+        sigma = num.power(stdev, 2) * num.eye(n)
+        isigma = num.linalg.inv(sigma)
+        dsigma = num.linalg.det(sigma)
+
+        w1 = stdev
+        w2 = (1 - stdev)
+
+        def two_gaussians(x):
+            log_like1 = - 0.5 * n * tt.log(2 * num.pi) \
+                        - 0.5 * tt.log(dsigma) \
+                        - 0.5 * (x - mu1).T.dot(isigma).dot(x - mu1)
+            log_like2 = - 0.5 * n * tt.log(2 * num.pi) \
+                        - 0.5 * tt.log(dsigma) \
+                        - 0.5 * (x - mu2).T.dot(isigma).dot(x - mu2)
+            return tt.log(w1 * tt.exp(log_like1) + w2 * tt.exp(log_like2))
+
+        with pm.Model() as PT_test:
+            X = pm.Uniform('X',
+                           shape=n,
+                           lower=-2. * num.ones_like(mu1),
+                           upper=2. * num.ones_like(mu1),
+                           testval=-1. * num.ones_like(mu1),
+                           transform=None)
+            like = pm.Deterministic('like', two_gaussians(X))
+            pm.Potential('like', like)
+
+        with PT_test:
+            step = Metropolis(
+                n_chains=self.n_chains,
+                tune_interval=self.tune_interval,
+                likelihood_name=PT_test.deterministics[0].name)
+
+        pt.PT_sample(
+            step=step,
+            n_chains=self.n_chains,
+            n_samples=self.n_samples,
+            swap_interval=self.swap_interval,
+            n_chains_posterior=2,
+            n_jobs=n_jobs,
+            progressbar=False,
+            homepath=test_folder,
+            model=PT_test,
+            rm_flag=True)
+
+        stage_handler = backend.TextStage(test_folder)
+
+        mtrace = stage_handler.load_multitrace(-1, model=PT_test)
+        assert len(mtrace.chains) == 2
+        assert len(mtrace) == self.n_samples
+
+        d = mtrace.get_values(
+            'X', burn=int(self.n_samples / 2), combine=True, squeeze=True)
+        mu1d = num.abs(d).mean(axis=0)
+
+        num.testing.assert_allclose(mu1, mu1d, rtol=0., atol=0.03)
+
+        # both modes have to be visited with the right weights
+        frac_mu1 = (d.mean(axis=1) > 0.).mean()
+        num.testing.assert_allclose(frac_mu1, w1, rtol=0., atol=0.05)
+
+    def test_beta_ladder(self):
+        betas = pt.get_beta_ladder(6, n_chains_posterior=2, tmax=10.)
+        num.testing.assert_allclose(betas[:2], 1.)
+        num.testing.assert_allclose(betas[-1], 0.1)
+
+        for t in range(100):
+            swap_accepted = num.random.randint(0, 2, 4).astype('float64')
+            betas = pt.adapt_betas(
+                betas, swap_accepted, n_chains_posterior=2, t=t)
+
+        assert (num.diff(betas) <= 0.).all()
+        num.testing.assert_allclose(betas[:2], 1.)
+        num.testing.assert_allclose(betas[-1], 0.1)
+
+    def test_one_core(self):
+        self._test_sample(1, self.test_folder_one)
+
+    def test_multicore(self):
+        self._test_sample(4, self.test_folder_multi)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_folder_one)
+        shutil.rmtree(self.test_folder_multi)
+
+
+if __name__ == '__main__':
+    util.setup_logging('test_pt', 'info')
+    unittest.main()
@@ -1,10 +1,17 @@
 import unittest
 import logging
+import os
+import shutil
+from tempfile import mkdtemp
 
 from pymc3.plots import kdeplot
+from pymc3.theanof import make_shared_replacements
+import pymc3 as pm
 import numpy as num
+from theano import shared
+import theano.tensor as tt
 
-from beat.sampler import base
+from beat.sampler import base, resampling, surrogate, metropolis
 from pyrocko import util
 
 import matplotlib.pyplot as plt
@@ -51,6 +58,204 @@ class SamplerTestCase(unittest.TestCase):
         ax.set_xlim([-10., 10.])
         plt.show()
 
+    def test_resampling(self):
+        n_chains = 1000
+        weights = num.random.dirichlet(num.ones(n_chains) * 0.3)
+
+        for method in resampling.resampling_catalog.keys():
+            logger.info('Testing resampling: %s' % method)
+            parents = resampling.resample(weights, method=method)
+            assert parents.size == n_chains
+            assert parents.min() >= 0 and parents.max() < n_chains
+
+            n_childs = num.bincount(parents, minlength=n_chains)
+            if method != 'multinomial':
+                # low variance schemes, number of children within +-1
+                assert (num.abs(n_childs - n_chains * weights) < 2.).all()
+
+            children = resampling.parents2children(parents)
+            for parent, childs in children.items():
+                assert (parents[childs] == parent).all()
+
+            assert sum(len(c) for c in children.values()) == n_chains
+
+    def test_rbf_surrogate(self):
+        def llk(q):
+            return -0.5 * ((q - 0.3) ** 2 / 0.1).sum()
+
+        sur = surrogate.RBFSurrogate(max_points=300, min_points=20)
+        assert not sur.fit()
+
+        for q in num.random.randn(400, 3):
+            sur.add(q, llk(q))
+
+        assert len(sur) == 300
+        assert sur.fit()
+
+        tests = num.random.randn(50, 3) * 0.7
+        errors = num.array([sur.predict(q) - llk(q) for q in tests])
+        assert num.median(num.abs(errors)) < 0.5
+
+    def test_variable_dependencies(self):
+        with pm.Model() as model:
+            a = pm.Uniform('a', lower=-1., upper=1., transform=None)
+            b = pm.Uniform('b', lower=-1., upper=1., transform=None)
+            c = pm.Uniform('c', lower=-1., upper=1., transform=None)
+            h = pm.Uniform('h', lower=-1., upper=1., transform=None)
+            seis = pm.Deterministic('seis_like', a + b + h)
+            geo = pm.Deterministic('geo_like', a * b + c)
+
+        dependencies = base.get_variable_dependencies(
+            model.vars, [seis, geo])
+        assert dependencies['a'] == set(['seis_like', 'geo_like'])
+        assert dependencies['c'] == set(['geo_like'])
+        assert dependencies['h'] == set(['seis_like'])
+
+        blocks = base.get_update_blocks(dependencies)
+        assert blocks[
+            (frozenset(['seis_like', 'geo_like']), False)] == ['a', 'b']
+        assert blocks[(frozenset(['geo_like']), False)] == ['c']
+        assert blocks[(frozenset(['seis_like']), False)] == ['h']
+
+        blocks = base.get_update_blocks(dependencies, hypernames=['h', 'b'])
+        assert blocks[(frozenset(['seis_like', 'geo_like']), False)] == ['a']
+        assert blocks[(frozenset(['seis_like', 'geo_like']), True)] == ['b']
+        assert blocks[(frozenset(['seis_like']), True)] == ['h']
+
+    def test_blocked_updates(self):
+        with pm.Model() as model:
+            a = pm.Uniform('a', lower=-1., upper=1., transform=None)
+            b = pm.Uniform('b', lower=-1., upper=1., transform=None)
+            c = pm.Uniform('c', lower=-1., upper=1., transform=None)
+            h = pm.Uniform('h', lower=-1., upper=1., transform=None)
+            seis = pm.Deterministic('seis_like', -(a + b + h) ** 2)
+            geo = pm.Deterministic('geo_like', -(a * b + c) ** 2)
+            pm.Deterministic('like', seis + geo)
+
+        with model:
+            step = metropolis.Metropolis(
+                n_chains=2, scale=0.01, tune=False, blocked_updates=True)
+
+        assert len(step.blocks) == 3
+
+        # accept all proposals within the bounds
+        step.beta = 0.
+        step.stage = 1
+        step.n_steps = 30
+        q0 = num.zeros_like(step.bij.map(step.population[0]))
+        step.chain_previous_lpoint[0] = step.logp_forw(q0)
+
+        for i in range(step.n_steps):
+            mask = step.blocks[i % len(step.blocks)][0]
+            q, lp = step.astep(q0)
+
+            assert (q[~mask] == q0[~mask]).all()
+            assert (q[mask] != q0[mask]).all()
+
+            for blocked, full in zip(lp, step.logp_forw(q)):
+                num.testing.assert_allclose(blocked, full, rtol=1e-10)
+
+            q0 = q
+
+    def test_hyper_only_blocks(self):
+        n_samples = 50
+        slnf = shared(num.array([3.]), name='slnf')
+        with pm.Model() as model:
+            a = pm.Uniform('a', lower=-1., upper=1., transform=None)
+            h = pm.Uniform('h_seis', lower=-1., upper=1., transform=None)
+            wresiduals = 100. * (a - 0.3) ** 2
+            seis = pm.Deterministic('seis_like', -0.5 * (
+                slnf + 2. * n_samples * h + wresiduals * tt.exp(-2. * h)))
+            pm.Deterministic('like', seis.sum())
+
+        with model:
+            step = metropolis.Metropolis(
+                n_chains=2, blocked_updates=True,
+                hyper_datasets={'seis_like': [('h_seis', n_samples, slnf)]})
+
+        blocks = dict(
+            (hyper_only, (mask, llk_names))
+            for mask, llk_names, hyper_only in step.blocks)
+        assert len(step.blocks) == 2 and len(blocks) == 2
+
+        calls = []
+        logp_forw = step.composite_logp_forw['seis_like']
+
+        def counted_logp_forw(q):
+            calls.append(q)
+            return logp_forw(q)
+
+        step.composite_logp_forw['seis_like'] = counted_logp_forw
+
+        q0 = num.zeros_like(step.bij.map(step.population[0]))
+        l0 = step.logp_forw(q0)
+
+        mask, llk_names = blocks[True]
+        q = q0 + mask * 0.2
+        lp = step.blocked_logp_forw(
+            q, l0, llk_names, q0=q0, hyper_only=True)
+        assert len(calls) == 0
+        for blocked, full in zip(lp, step.logp_forw(q)):
+            num.testing.assert_allclose(blocked, full, rtol=1e-6)
+
+        mask, llk_names = blocks[False]
+        q = q0 + mask * 0.2
+        lp = step.blocked_logp_forw(q, l0, llk_names)
+        assert len(calls) == 1
+        for blocked, full in zip(lp, step.logp_forw(q)):
+            num.testing.assert_allclose(blocked, full, rtol=1e-6)
+
+    def test_update_hyper_llks(self):
+        def llks(hypers, wresiduals, n_samples, slnfs):
+            return -0.5 * (
+                slnfs + 2. * n_samples * hypers +
+                wresiduals / num.exp(2. * hypers))
+
+        n_samples = num.array([100, 250, 30])
+        slnfs = num.random.randn(3) * 10.
+        wresiduals = num.random.rand(3) * 1000.
+        hypers0 = num.random.randn(3)
+        hypers = num.random.randn(3)
+
+        updated = metropolis.update_hyper_llks(
+            llks(hypers0, wresiduals, n_samples, slnfs),
+            hypers0, hypers, n_samples, slnfs)
+        num.testing.assert_allclose(
+            updated, llks(hypers, wresiduals, n_samples, slnfs), rtol=1e-10)
+
+    def test_function_cache(self):
+        tmpdir = mkdtemp(prefix='beat_cache')
+        path = os.path.join(tmpdir, 'functions.pkl')
+
+        for i in range(2):
+            weight = shared(num.float64(2.), name='weight')
+            with pm.Model() as model:
+                a = pm.Uniform('a', lower=-1., upper=1., transform=None)
+                pm.Deterministic('like', weight * a ** 2)
+
+            cache = base.FunctionCache(path=path, key='test')
+            with model:
+                f = cache.logp_forw(
+                    'logp_forw', model.unobserved_RVs, model.vars,
+                    make_shared_replacements(model.vars, model))
+
+            if i == 0:
+                cache.layout = ['a', 'like']
+                cache.dump()
+                assert os.path.exists(path)
+            else:
+                assert cache.layout == ['a', 'like']
+                assert f is cache.cached['logp_forw']
+
+            # updates of the model shared variables reach the function
+            weight.set_value(num.float64(3.))
+            num.testing.assert_allclose(f(num.array([0.5]))[-1], 0.75)
+
+        cache = base.FunctionCache(path=path, key='changed')
+        assert cache.layout is None and len(cache.cached) == 0
+
+        shutil.rmtree(tmpdir)
+
 
 if __name__ == '__main__':
     util.setup_logging('test_sampler', 'info')
@@ -103,6 +103,33 @@ class TestSMC(unittest.TestCase):
             self.n_chains, self.n_cpu)
         self._test_sample(n_jobs, self.test_folder_multi)
 
+    def test_resampling_threshold_below_target_ess(self):
+        step = smc.SMC.__new__(smc.SMC)
+        step.n_chains = self.n_chains
+        step.beta = 0.
+        step.target_ess = 0.5
+        step.resampling_method = 'systematic'
+        step.resampling_threshold = 0.3
+        step.log_chain_weights = num.ones(self.n_chains) * \
+            -num.log(self.n_chains)
+        step.likelihoods = num.random.randn(self.n_chains) * 100.
+
+        for stage in range(50):
+            step.beta, step.old_beta, step.weights = step.calc_beta()
+            if step.beta >= 1.:
+                break
+
+            assert step.beta - step.old_beta > 1e-4
+            assert step.calc_ess(step.beta - step.old_beta) >= \
+                step.target_ess * self.n_chains * 0.99
+
+            # mutation of the resampled chains
+            indexes = step.resample()
+            step.likelihoods = step.likelihoods[indexes] + \
+                num.random.randn(self.n_chains)
+
+        assert step.beta >= 1.
+
     def tearDown(self):
         shutil.rmtree(self.test_folder_one)
         shutil.rmtree(self.test_folder_multi)
@@ -24,6 +24,21 @@ class TestUtility(unittest.TestCase):
         num.testing.assert_allclose(self.Rx(90).dot(B), C, rtol=0., atol=1e-6)
         num.testing.assert_allclose(self.Ry(90).dot(C), A, rtol=0., atol=1e-6)
 
+    def test_cholesky_rank_one_update(self):
+
+        A = num.random.normal(size=(6, 6))
+        C = A.dot(A.T) + num.eye(6)
+        L = num.linalg.cholesky(C)
+        x = num.random.normal(size=6)
+
+        num.testing.assert_allclose(
+            utility.cholesky_rank_one_update(L, x),
+            num.linalg.cholesky(C + num.outer(x, x)), rtol=0., atol=1e-10)
+        num.testing.assert_allclose(
+            utility.cholesky_rank_one_update(L, 0.1 * x, sign=-1.),
+            num.linalg.cholesky(C - 0.01 * num.outer(x, x)),
+            rtol=0., atol=1e-10)
+
 if __name__ == '__main__':
     util.setup_logging('test_utility', 'warning')
     unittest.main()